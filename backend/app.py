@@ -1,6 +1,9 @@
 import streamlit as st
 from src.word_timestamp import transcribe_audio
-from utils import save_uploaded_video, extract_audio, extract_video_segments, modify_and_patch_video
+from src.edl import EDL
+from src.workspace import workspace_manager
+from src.transcript_diff import anchored_diff, parse_script, sync_timestamps
+from utils import save_uploaded_video, extract_audio, render_edl, modify_and_patch_video, prepare_reference, GAP_TOLERANCE_MS
 import logging
 logging.basicConfig(level=logging.INFO)
 
@@ -20,6 +23,12 @@ if 'original_script' not in st.session_state:
 if 'new_script' not in st.session_state:
     st.session_state.new_script = []
 
+# Every browser session edits in its own workspace
+if 'workspace_id' not in st.session_state:
+    st.session_state.workspace_id = workspace_manager.create().id
+workspace = workspace_manager.get(st.session_state.workspace_id, create=True)
+workspace_manager.start_gc()
+
 st.session_state.bloopers = False
 
 with st.sidebar:
@@ -40,15 +49,17 @@ with cols[0]:
     uploaded_video = st.file_uploader("Upload Video")
     if uploaded_video is not None:
         st.video(uploaded_video, format="video/mp4")
-        video_path = save_uploaded_video(uploaded_video)
-        audio_path = extract_audio(video_path)        
-        if 'audio_path' not in st.session_state:
-            st.session_state.audio_path = audio_path
+        video_path = save_uploaded_video(workspace, uploaded_video)
+        audio_path = extract_audio(workspace, video_path)        
         transcript_response = transcribe_audio(audio_path)
-        ref_text = ''.join([x['text'] for x in transcript_response])
+        # Voice cloning only needs a short clean window of the original and the words in it
+        reference_path, ref_text = prepare_reference(workspace, audio_path, transcript_response)
+        if 'audio_path' not in st.session_state:
+            st.session_state.audio_path = reference_path
         transcript = ['[' + x['start'] + ' - ' + x['end'] +']'+ ' :|: ' +  x['text'] for x in transcript_response]
         transcribed_text = '\n'.join(transcript)
         st.session_state.original_script = transcribed_text
+        st.session_state.ref_text = ref_text
         if 'original_video_path' not in st.session_state:
             st.session_state.original_video_path = video_path
         
@@ -75,28 +86,31 @@ with cols[1]:
                 new_lines.append(line)
             st.session_state.new_script = script
 
+        edl = EDL.from_timestamps(new_script_final).coalesce(GAP_TOLERANCE_MS)
         if st.session_state.bloopers:
-            new_time_stamps = []
+            # The removed parts are just the complement of what was kept
+            original_time_stamps = []
             for line in st.session_state.original_script.split('\n'):
-                if line not in new_lines:
-                    timestamp_list = line.split(':|:')
-                    timestamp = timestamp_list[0]
-                    text = timestamp_list[1]
-                    start = timestamp.split('-')[0].replace('[', '').strip()
-                    end = timestamp.split('-')[1].replace(']', '').strip()
-                    new_time_stamps.append({'start': start, 'end': end, 'text': text})
-            new_script_final = new_time_stamps
-
-        new_video_path = extract_video_segments(st.session_state.original_video_path, new_script_final)
+                timestamp = line.split(':|:')[0]
+                start = timestamp.split('-')[0].replace('[', '').strip()
+                end = timestamp.split('-')[1].replace(']', '').strip()
+                original_time_stamps.append({'start': start, 'end': end})
+            original = EDL.from_timestamps(original_time_stamps)
+            edl = edl.complement(original.start_ms, original.end_ms)
+
+        new_video_path = render_edl(workspace, st.session_state.original_video_path, edl)
         st.video(new_video_path, format="video/mp4") 
         
         if 'new_video_path' not in st.session_state:
             st.session_state.new_video_path = new_video_path
-        new_audio_path = extract_audio(st.session_state.new_video_path)       
-        transcript_response = transcribe_audio(new_audio_path)
-        ref_text = ''.join([x['text'] for x in transcript_response])
-        if 'ref_text' not in st.session_state:
-            st.session_state.ref_text = ref_text
+        # Map the original word times onto the rendered timeline instead of transcribing the render
+        original_words = []
+        for line in st.session_state.original_script.split('\n'):
+            timestamp, text = line.split(':|:', 1)
+            start = timestamp.split('-')[0].replace('[', '').strip()
+            end = timestamp.split('-')[1].replace(']', '').strip()
+            original_words.append({'start': start, 'end': end, 'text': text.strip()})
+        transcript_response = edl.remap_timestamps(original_words)
         transcript = ['[' + x['start'] + ' - ' + x['end'] +']'+ ' :|: ' +  x['text'] for x in transcript_response]
         transcribed_text = '\n'.join(transcript)
         st.session_state.new_transcript = transcribed_text
@@ -111,19 +125,13 @@ if not st.session_state.bloopers:
         to_be_synced_time_stamps = []
         if process:
             if new_new_script:
-                for old_line, new_line in zip(st.session_state.new_transcript.split('\n'), new_new_script.split('\n')):
-                    timestamp_list = new_line.split(':|:')
-                    timestamp = timestamp_list[0]
-                    text = timestamp_list[1]
-                    start = timestamp.split('-')[0].replace('[', '').strip()
-                    end = timestamp.split('-')[1].replace(']', '').strip()
-
-                    if old_line != new_line:
-                        to_be_synced_time_stamps.append({'start': start, 'end': end, 'text': text, 'sync': True})
-                    else:
-                        to_be_synced_time_stamps.append({'start': start, 'end': end, 'text': text, 'sync': False})
-                
-                synced_video_path = modify_and_patch_video(st.session_state.new_video_path, 
+                # Word-level diff, so inserting or deleting a line doesn't mark everything after it as changed
+                edits = anchored_diff(parse_script(st.session_state.new_transcript),
+                                      [x['text'] for x in parse_script(new_new_script)])
+                to_be_synced_time_stamps = sync_timestamps(edits)
+
+                synced_video_path = modify_and_patch_video(workspace,
+                                                        st.session_state.new_video_path, 
                                                         st.session_state.audio_path, 
                                                         to_be_synced_time_stamps, 
                                                         st.session_state.ref_text)
@@ -1,20 +1,30 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from fastapi import FastAPI, File, UploadFile
+from fastapi.responses import FileResponse, PlainTextResponse
+from fastapi import FastAPI, File, UploadFile, Header, HTTPException, Request
 import shutil
+import hashlib
 from pathlib import Path
 from src.get_audio import extract_audio
 from src.word_timestamp import transcribe_audio
-from src.get_video_clips import extract_videos
+from src.get_video_clips import extract_subclip
 from src.lip_sync import get_lip_sync
 from src.voice_cloning import get_cloned_voice
+from src.reference_audio import build_reference
+from src.scheduler import TaskGraph
+from src.workspace import workspace_manager, QuotaExceeded
+from src.cache import artifact_cache
+from src.word_timestamp import transcript_cache, pool as transcription_pool
+from src.metrics import metrics, span, breakdown_scope, server_timing
+from src.transcript_diff import anchored_diff
+from functools import partial
 import os
+import re
 import subprocess
-from moviepy.editor import VideoFileClip, concatenate_videoclips
 import logging
 import json
+import time
 
 logging.basicConfig(level=logging.INFO)
 
@@ -27,31 +37,99 @@ app = FastAPI()
 #     allow_headers=["*"],
 # )
 
-# Define the directory to store the uploaded videos
-UPLOAD_DIR = Path("uploaded_videos")
-UPLOAD_DIR.mkdir(exist_ok=True)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# How many remote predictions of each kind may be in flight at once
+CLONE_MAX_IN_FLIGHT = int(os.getenv("CLONE_MAX_IN_FLIGHT", "4"))
+LIP_SYNC_MAX_IN_FLIGHT = int(os.getenv("LIP_SYNC_MAX_IN_FLIGHT", "4"))
+EXTRACT_MAX_IN_FLIGHT = int(os.getenv("EXTRACT_MAX_IN_FLIGHT", "2"))
+
+metrics.register_cache("artifacts", artifact_cache)
+metrics.register_cache("transcripts", transcript_cache)
+metrics.gauge("transcriptions_pending", lambda: transcription_pool.pending)
+
+
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    """Times every request and reports the stages it ran in a Server-Timing header."""
+    breakdown = {}
+    start = time.perf_counter()
+    with breakdown_scope(breakdown):
+        response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    metrics.observe("http_request_seconds", elapsed, method=request.method,
+                    route=route.path if route else "unmatched", status=response.status_code)
+    response.headers["Server-Timing"] = server_timing(breakdown, elapsed)
+    return response
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.on_event("startup")
+def start_workspace_gc():
+    workspace_manager.start_gc()
+
+
+@app.on_event("startup")
+def warm_transcription():
+    # A local model takes seconds to load; do it before the first upload needs it
+    transcription_pool.warm()
+
+
+def get_workspace(workspace_id):
+    try:
+        return workspace_manager.get(workspace_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Workspace not found")
+
 
 @app.post("/upload_mp4/")
-async def upload_mp4(file: UploadFile = File(...)):
-    video_path = UPLOAD_DIR / 'uploaded_video.mp4'
+async def upload_mp4(file: UploadFile = File(...), x_workspace_id: str = Header(None)):
+    # Each upload without a workspace id starts a new editing session
+    workspace = get_workspace(x_workspace_id) if x_workspace_id else workspace_manager.create()
+    video_path = Path(workspace.path('uploaded_video.mp4'))
 
-    with video_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Stream to disk in fixed-size chunks, hashing on the way
+    remaining = workspace.remaining_bytes()
+    digest = hashlib.sha256()
+    with workspace.in_use(), video_path.open("wb") as buffer:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            if remaining < 0:
+                buffer.close()
+                video_path.unlink()
+                raise HTTPException(status_code=413, detail="Upload exceeds the workspace quota")
+            digest.update(chunk)
+            buffer.write(chunk)
+    logging.info(f"Saved upload {video_path} (sha256 {digest.hexdigest()})")
 
-    extract_audio(video_path, video_path.with_suffix(".wav"))
-    transcribed_audio = transcribe_audio(video_path.with_suffix(".wav"))
-    with open(video_path.with_suffix(".json"), "w") as f:
-        json.dump(transcribed_audio, f)
+    with workspace.in_use():
+        extract_audio(video_path, video_path.with_suffix(".wav"))
+        transcribed_audio = transcribe_audio(video_path.with_suffix(".wav"))
+        with open(video_path.with_suffix(".json"), "w") as f:
+            json.dump(transcribed_audio, f)
+        # Clone requests send a short clean window of the upload, not the whole recording
+        with span("reference"):
+            reference_text = build_reference(video_path.with_suffix(".wav"), transcribed_audio, workspace.path('reference.wav'))
+        with open(workspace.path('reference.txt'), 'w') as f:
+            f.write(reference_text)
 
-    return {"transcription": transcribed_audio}
+    return {"workspace_id": workspace.id, "transcription": transcribed_audio}
 
-def time_str_to_seconds(time_str):
-    """Convert a timestamp string (HH:MM:SS.sss) to seconds."""
-    hours, minutes, seconds = map(float, time_str.split(':'))
-    return hours * 3600 + minutes * 60 + seconds
+def clip_number(video_file):
+    match = re.search(r'(\d+)\.mp4$', video_file)
+    return int(match.group(1)) if match else 0
 
 
-def concat_all_vids(video_directory):
+def concat_all_vids(video_directory, output_path='final_output.mp4', list_path='videos.txt'):
     if not os.path.exists(video_directory):
         logging.error(f"Directory {video_directory} does not exist")
         return
@@ -62,25 +140,30 @@ def concat_all_vids(video_directory):
         logging.error(f"No MP4 files found in {video_directory}")
         return
 
-    video_files.sort()
+    # Sort by clip number so video_10 comes after video_9
+    video_files.sort(key=clip_number)
 
-    with open('videos.txt', 'w') as file:
+    with open(list_path, 'w') as file:
         for video in video_files:
-            file.write(f"file '{video}'\n")
+            file.write(f"file '{os.path.abspath(video)}'\n")
 
     ffmpeg_command = [
         'ffmpeg',
         '-f', 'concat',
         '-safe', '0',
-        '-i', 'videos.txt',
+        '-i', list_path,
         '-c:v', 'libx264',
         '-strict', '-2',
-        'final_output.mp4',
+        '-movflags', '+faststart',
+        output_path,
         '-y'
     ]
 
     try:
-        result = subprocess.run(ffmpeg_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        with span("concat") as current:
+            result = subprocess.run(ffmpeg_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            if os.path.exists(output_path):
+                current.bytes_out = os.path.getsize(output_path)
         if result.returncode != 0:
             logging.error(f"Error concatenating videos: {result.stderr}")
         else:
@@ -89,53 +172,85 @@ def concat_all_vids(video_directory):
         logging.error(f"Error concatenating videos: {str(e)}")
 
 
+def lip_sync_clip(face_path, audio_path):
+    synced_path = get_lip_sync(face_path, audio_path)
+    shutil.copy(synced_path, face_path)
+    return face_path
+
+
 @app.post("/process_script")
 def process_script(request: dict):
+    workspace = get_workspace(request["workspace_id"])
     original_script = request["original_script"]
     new_script = request["new_script"]    
-    to_be_synced = []
-    to_be_synced_ids = []
-    for _, (old_element, new_element) in enumerate(zip(original_script, new_script)):
-        if old_element["start"] == new_element["start"] and old_element["end"] == new_element["end"]:
-            if old_element["text"] != new_element["text"]:
-                to_be_synced.append({"idx": _, "start": old_element["start"], "end": old_element["end"], "text": new_element["text"]})
-                to_be_synced_ids.append(_)
-    print('to be synced', to_be_synced_ids)
 
     final_timestamps = {}
-    to_be_synced_ids_map = {}
-
-    start = original_script[0]['start']
-    clip = 1
-    for i, (org, new) in enumerate(zip(original_script, new_script)):
-        if org['start'] == new['start'] and org['end'] == new['end']:
-            if org['text'] == new['text']:
-                final_timestamps[clip] = (start, org['end'])
-            else:
-                clip+=1
-                final_timestamps[clip] = (new['start'], new['end'])
-                to_be_synced_ids_map[clip] = i
-                start = new['end']
-                clip+=1
-
-    extract_videos('uploaded_videos/uploaded_video.mp4', final_timestamps)
-
-    for i, element in enumerate(to_be_synced):
-        idx = element["idx"]
-        id_ = to_be_synced_ids_map[idx]
-        print('Syncing video', id_)
-        text = element["text"]
-        get_cloned_voice('uploaded_videos/uploaded_video.wav', id_, text, 'en')
-        get_lip_sync(f'videos_output/video_{id_}.mp4', f'voice_cloned_outputs/output_new_{id_}.mp3')
-        subprocess.run(['cp', f'lip_sync_outputs/output_new_clip_{id_}.mp4', f'videos_output/video_{id_}.mp4'])
-
-    
-    print('org time stamps', to_cut_timestamps)
-
-    concat_all_vids('videos_output')
-
-    return {"message": "Video processed and synced successfully.", "output_video": "final_output.mp4"}
+    synced_clips = {}
+
+    # Word-level diff: kept runs become plain clips, changed spans are cloned and lip-synced,
+    # and deleted words are dropped
+    edits = anchored_diff(original_script, [w['text'] for w in new_script])
+    clip = 0
+    previous = None
+    for edit in edits:
+        if edit.op == "delete":
+            previous = edit
+            continue
+        clip += 1
+        if edit.op == "replace":
+            final_timestamps[clip] = (edit.start, edit.end)
+            synced_clips[clip] = edit.text
+        else:
+            # An unchanged run also keeps the pause after the clip before it
+            start = previous.end if previous is not None and previous.op == "replace" else edit.start
+            final_timestamps[clip] = (start, edit.end)
+        previous = edit
+    print('to be synced', list(synced_clips))
+
+    try:
+        workspace.check_quota()
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    video_path = workspace.path('uploaded_video.mp4')
+    audio_path = workspace.path('reference.wav')
+    clips_dir = workspace.path('videos_output')
+    output_path = workspace.path('final_output.mp4')
+    if os.path.exists(clips_dir):
+        shutil.rmtree(clips_dir)
+
+    # Clone predictions start right away; each clip's lip sync starts as soon as its
+    # clip and cloned audio are ready, and the concat waits for everything else.
+    graph = TaskGraph(limits={
+        "extract": EXTRACT_MAX_IN_FLIGHT,
+        "clone": CLONE_MAX_IN_FLIGHT,
+        "lip_sync": LIP_SYNC_MAX_IN_FLIGHT,
+    })
+    for clip_num, (clip_start, clip_end) in final_timestamps.items():
+        extract = graph.add(
+            ("extract", clip_num),
+            partial(extract_subclip, video_path, clip_num, clip_start, clip_end, clips_dir),
+            stage="extract"
+        )
+        if clip_num in synced_clips:
+            clone = graph.add(
+                ("clone", clip_num),
+                partial(get_cloned_voice, audio_path, clip_num, synced_clips[clip_num], 'en'),
+                stage="clone"
+            )
+            graph.add(("lip_sync", clip_num), lip_sync_clip, deps=[extract, clone], stage="lip_sync")
+
+    graph.add("concat", lambda *_: concat_all_vids(clips_dir, output_path, workspace.path('videos.txt')),
+              deps=list(graph.tasks), stage="concat")
+    with workspace.in_use():
+        graph.run()
 
+    return {
+        "message": "Video processed and synced successfully.",
+        "workspace_id": workspace.id,
+        "output_video": output_path,
+        "timings": graph.stage_timings()
+    }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import re
+import subprocess
+
+# Wav2Lip works on 96x96 faces; crops are scaled down to at most this, leaving its detector some room
+ROI_MAX_SIZE = int(os.getenv("LIP_SYNC_ROI_SIZE", "256"))
+# Context kept around the detected face, as fractions of its size; the chin needs the most
+ROI_MARGIN = {"left": 0.25, "right": 0.25, "top": 0.2, "bottom": 0.35}
+FACE_SAMPLES = 8
+DEFAULT_FPS = 25.0
+
+
+def _parse_rate(rate: str) -> float:
+    num, _, den = rate.partition("/")
+    return float(num) / float(den or 1) if float(den or 1) else 0.0
+
+
+def probe_video(path: str) -> dict:
+    """Width, height, fps and duration of the first video stream.
+
+    Asks ffprobe, falling back to the banner of `ffmpeg -i` where ffprobe isn't installed.
+    """
+    try:
+        result = subprocess.run([
+            'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+            '-show_entries', 'stream=width,height,avg_frame_rate,r_frame_rate:format=duration',
+            '-of', 'json', path
+        ], capture_output=True, text=True)
+        if result.returncode == 0:
+            info = json.loads(result.stdout)
+            stream = info["streams"][0]
+            fps = _parse_rate(stream.get("avg_frame_rate", "0/0")) or _parse_rate(stream.get("r_frame_rate", "0/0"))
+            return {
+                "width": int(stream["width"]),
+                "height": int(stream["height"]),
+                "fps": fps or DEFAULT_FPS,
+                "duration": float(info["format"]["duration"]),
+            }
+    except (FileNotFoundError, KeyError, IndexError, ValueError):
+        pass
+
+    stderr = subprocess.run(['ffmpeg', '-i', path], capture_output=True, text=True).stderr
+    size = re.search(r"Video:.*?\b(\d{2,5})x(\d{2,5})\b", stderr)
+    fps = re.search(r"([\d.]+) fps", stderr)
+    duration = re.search(r"Duration: (\d+):(\d+):(\d+\.\d+)", stderr)
+    if size is None or duration is None:
+        raise ValueError(f"Can't probe {path}")
+    hours, minutes, seconds = duration.groups()
+    return {
+        "width": int(size.group(1)),
+        "height": int(size.group(2)),
+        "fps": float(fps.group(1)) if fps else DEFAULT_FPS,
+        "duration": int(hours) * 3600 + int(minutes) * 60 + float(seconds),
+    }
+
+
+def probe_duration(path: str) -> float:
+    """Duration in seconds of any media file, audio included."""
+    try:
+        result = subprocess.run([
+            'ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', path
+        ], capture_output=True, text=True)
+        if result.returncode == 0:
+            return float(result.stdout.strip())
+    except (FileNotFoundError, ValueError):
+        pass
+    stderr = subprocess.run(['ffmpeg', '-i', path], capture_output=True, text=True).stderr
+    duration = re.search(r"Duration: (\d+):(\d+):(\d+\.\d+)", stderr)
+    if duration is None:
+        raise ValueError(f"Can't probe {path}")
+    hours, minutes, seconds = duration.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def detect_face(video_path: str, samples: int = FACE_SAMPLES):
+    """(x, y, w, h) covering the largest face across a few frames, or None.
+
+    None also when OpenCV isn't installed; callers then send the full frame.
+    """
+    try:
+        import cv2
+    except ImportError:
+        logging.info("OpenCV not installed, lip sync will use the full frame")
+        return None
+
+    detector = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml"))
+    capture = cv2.VideoCapture(video_path)
+    total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) or samples
+    boxes = []
+    try:
+        for i in range(samples):
+            capture.set(cv2.CAP_PROP_POS_FRAMES, int(i * total / samples))
+            ok, frame = capture.read()
+            if not ok:
+                continue
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            faces = detector.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(48, 48))
+            if len(faces):
+                boxes.append(max(faces, key=lambda f: f[2] * f[3]))
+    finally:
+        capture.release()
+    if not boxes:
+        return None
+    # The union over the samples, so the head can move without leaving the crop
+    x0 = min(b[0] for b in boxes)
+    y0 = min(b[1] for b in boxes)
+    x1 = max(b[0] + b[2] for b in boxes)
+    y1 = max(b[1] + b[3] for b in boxes)
+    return int(x0), int(y0), int(x1 - x0), int(y1 - y0)
+
+
+def _even(value: int) -> int:
+    return value - value % 2
+
+
+def plan_roi(face, width: int, height: int) -> dict:
+    """Where to crop around `face`, how big to send it, and which part of the result to paste back.
+
+    Everything is in even pixels, as yuv420p needs.
+    """
+    x, y, w, h = face
+    left = max(0, x - int(w * ROI_MARGIN["left"]))
+    top = max(0, y - int(h * ROI_MARGIN["top"]))
+    right = min(width, x + w + int(w * ROI_MARGIN["right"]))
+    bottom = min(height, y + h + int(h * ROI_MARGIN["bottom"]))
+    crop = {"x": _even(left), "y": _even(top), "w": _even(right - _even(left)), "h": _even(bottom - _even(top))}
+
+    scale = min(1.0, ROI_MAX_SIZE / max(crop["w"], crop["h"]))
+    sent = {"w": max(2, _even(int(crop["w"] * scale))), "h": max(2, _even(int(crop["h"] * scale)))}
+
+    # Wav2Lip only redraws the lower half of the face; pasting back just that hides the re-encode
+    mouth_top = _even(y + h // 2)
+    mouth = {"x": crop["x"], "y": mouth_top, "w": crop["w"], "h": _even(crop["y"] + crop["h"] - mouth_top)}
+    return {"crop": crop, "sent": sent, "mouth": mouth}
+
+
+def make_roi_clip(face_path: str, output_path: str, duration: float, fps: float, roi=None) -> str:
+    """The face clip cut to `duration` and, given a plan, cropped and scaled to the face."""
+    filters = [f"fps={fps:g}"]
+    if roi is not None:
+        crop, sent = roi["crop"], roi["sent"]
+        filters.append(f"crop={crop['w']}:{crop['h']}:{crop['x']}:{crop['y']}")
+        filters.append(f"scale={sent['w']}:{sent['h']}")
+    subprocess.run([
+        'ffmpeg', '-y', '-v', 'error',
+        '-i', face_path, '-t', f"{duration:.3f}",
+        '-vf', ",".join(filters), '-an',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18', '-pix_fmt', 'yuv420p',
+        output_path
+    ], check=True)
+    return output_path
+
+
+def composite_roi(face_path: str, synced_path: str, audio_path: str, roi: dict, output_path: str) -> str:
+    """Pastes the mouth region of the synced crop back onto the full-resolution face clip.
+
+    The face clip loops if the new audio outlasts it, as Wav2Lip's own output does.
+    """
+    crop, mouth = roi["crop"], roi["mouth"]
+    graph = (
+        f"[1:v]scale={crop['w']}:{crop['h']},"
+        f"crop={mouth['w']}:{mouth['h']}:{mouth['x'] - crop['x']}:{mouth['y'] - crop['y']}[mouth];"
+        f"[0:v][mouth]overlay={mouth['x']}:{mouth['y']}:shortest=1,format=yuv420p[v]"
+    )
+    subprocess.run([
+        'ffmpeg', '-y', '-v', 'error',
+        '-stream_loop', '-1', '-i', face_path,
+        '-i', synced_path,
+        '-i', audio_path,
+        '-filter_complex', graph,
+        '-map', '[v]', '-map', '2:a',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18',
+        '-c:a', 'aac', '-shortest', '-movflags', '+faststart',
+        output_path
+    ], check=True)
+    return output_path
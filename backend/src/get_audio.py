@@ -1,13 +1,18 @@
+import os
 import subprocess
+from src.metrics import span
 
 def extract_audio(input_video_file, output_audio_file):
-    subprocess.run([
-            "ffmpeg",
-            "-i", input_video_file,  # Input video file
-            "-acodec", "pcm_s16le",  # 16-bit PCM codec for WAV
-            "-ar", "44100",  # 44.1kHz sample rate
-            "-y",  # Overwrite output file if it exists
-            output_audio_file
-        ], check=True)
+    with span("extract_audio") as current:
+        subprocess.run([
+                "ffmpeg",
+                "-i", input_video_file,  # Input video file
+                "-acodec", "pcm_s16le",  # 16-bit PCM codec for WAV
+                "-ar", "44100",  # 44.1kHz sample rate
+                "-y",  # Overwrite output file if it exists
+                output_audio_file
+            ], check=True)
+        current.bytes_in = os.path.getsize(input_video_file)
+        current.bytes_out = os.path.getsize(output_audio_file)
 
     return output_audio_file
\ No newline at end of file
@@ -1,51 +1,73 @@
-import replicate
 import time
-import requests
-import shutil
 import os
+import tempfile
+from src.cache import artifact_cache, hash_file_cached, make_key
+from src.face_region import ROI_MAX_SIZE, composite_roi, detect_face, make_roi_clip, plan_roi, probe_duration, probe_video
+from src.metrics import span, record_prediction
+from src.registry import registry
+from src.transfer import downloader
 
-def get_lip_sync(face_path, audio_path):
-    if os.path.exists("lip_sync_outputs"):
-        shutil.rmtree("lip_sync_outputs")
-    os.makedirs("lip_sync_outputs", exist_ok=True)
-
-
-    face = open(face_path, "rb")
+LIP_SYNC_MODEL_VERSION = "8d65e3f4f4298520e079198b493c25adfc43c058ffec924f2aefc8010ed25eef"
+# Long clips can sit in Replicate's queue for a while before they even start
+LIP_SYNC_TIMEOUT_SECONDS = float(os.getenv("LIP_SYNC_TIMEOUT_SECONDS", "600"))
+POLL_SECONDS = 2
 
-    audio = open(audio_path, "rb")
 
-    idx = face_path.split('.')[0].split('_')[-1]
-
-    input={
-        "face": face,
-        "audio": audio,
-        "fps": 25,
-        "pads": "0 0 0 0",
-    }
+def get_lip_sync(face_path, audio_path):
+    probe = probe_video(face_path)
+    fps = round(probe["fps"], 3)
+    pads = "0 0 0 0"
 
-    prediction = replicate.predictions.create(
-        "8d65e3f4f4298520e079198b493c25adfc43c058ffec924f2aefc8010ed25eef",
-        input=input
-    )
+    # Unchanged clips come straight from the cache instead of another prediction
+    key = make_key("lip_sync", hash_file_cached(face_path), hash_file_cached(audio_path), fps, pads,
+                   ROI_MAX_SIZE, LIP_SYNC_MODEL_VERSION)
+    cached = artifact_cache.get(key, ".mp4")
+    if cached is not None:
+        print(f"Lip sync for {face_path} served from cache")
+        return cached
 
-    for i in range(20):
-        prediction.reload()
-        if prediction.status in {"succeeded", "failed", "canceled"}:
-            break
+    face_box = detect_face(face_path)
+    roi = plan_roi(face_box, probe["width"], probe["height"]) if face_box is not None else None
+    # The model renders one frame per audio frame, so face frames past the audio are never used
+    duration = min(probe["duration"], probe_duration(audio_path))
 
-        time.sleep(2)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        roi_path = os.path.join(tmpdir, "face.mp4")
+        with span("lip_sync_prepare"):
+            make_roi_clip(face_path, roi_path, duration, fps, roi)
 
+        with span("lip_sync_predict") as current, open(roi_path, "rb") as face, open(audio_path, "rb") as audio:
+            current.bytes_out = os.path.getsize(roi_path) + os.path.getsize(audio_path)
+            prediction = registry.get("replicate").predictions.create(
+                LIP_SYNC_MODEL_VERSION,
+                input={
+                    "face": face,
+                    "audio": audio,
+                    "fps": fps,
+                    "pads": pads,
+                }
+            )
 
-    output_url = prediction.output
+            deadline = time.monotonic() + LIP_SYNC_TIMEOUT_SECONDS
+            while True:
+                prediction.reload()
+                if prediction.status in {"succeeded", "failed", "canceled"}:
+                    break
+                if time.monotonic() > deadline:
+                    prediction.cancel()
+                    break
+                time.sleep(POLL_SECONDS)
+        record_prediction("lip_sync", prediction)
+        if prediction.status != "succeeded":
+            raise RuntimeError(f"Lip sync for {face_path} {prediction.status}: {getattr(prediction, 'error', None)}")
 
-    response = requests.get(output_url)
-    if response.status_code == 200:
-        content_type = response.headers.get('content-type')
-        if 'video' in content_type:
-            extension = '.mp4'
-        
-        filename = f"output_new_clip_{idx}{extension}"
-        
-        with open(os.path.join('lip_sync_outputs', filename), 'wb') as f:
-            f.write(response.content)
+        if roi is None:
+            return downloader.download_to_cache(prediction.output, artifact_cache, key, ".mp4", "lip_sync_download", expect="video")
 
+        synced_path = os.path.join(tmpdir, "synced.mp4")
+        with span("lip_sync_download") as current:
+            downloader.download(prediction.output, synced_path)
+            current.bytes_in = os.path.getsize(synced_path)
+        with span("lip_sync_composite"):
+            output_path = composite_roi(face_path, synced_path, audio_path, roi, os.path.join(tmpdir, "output.mp4"))
+        return artifact_cache.put_file(key, ".mp4", output_path)
@@ -0,0 +1,77 @@
+import os
+import struct
+import numpy as np
+
+
+def open_pcm(path: str):
+    """Memory-maps the samples of a 16-bit PCM WAV file.
+
+    Returns (samples, sample_rate); samples is 1-D for mono and (frames, channels) otherwise.
+    Nothing is read into memory until the samples are sliced.
+    """
+    fmt = None
+    with open(path, 'rb') as f:
+        riff, _, wave_id = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave_id != b'WAVE':
+            raise ValueError(f"{path} is not a WAV file")
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                fmt = struct.unpack('<HHIIHH', f.read(16))
+                f.seek(size - 16 + (size & 1), 1)
+            elif chunk_id == b'data':
+                offset = f.tell()
+                break
+            else:
+                f.seek(size + (size & 1), 1)
+
+    if fmt is None:
+        raise ValueError(f"{path} has no fmt chunk")
+    audio_format, channels, sample_rate, _, _, bits = fmt
+    if audio_format not in (1, 0xFFFE) or bits != 16:
+        raise ValueError(f"{path} is not 16-bit PCM")
+
+    # ffmpeg leaves the data size unset when writing to a pipe, so trust the file size
+    data_size = min(size, os.path.getsize(path) - offset)
+    frames = data_size // (2 * channels)
+    if frames == 0:
+        return np.zeros(0, dtype='<i2'), sample_rate
+    shape = (frames,) if channels == 1 else (frames, channels)
+    return np.memmap(path, dtype='<i2', mode='r', offset=offset, shape=shape), sample_rate
+
+
+def iter_frame_rms(samples, frame_len: int, start: int = 0, end: int = None, block_frames: int = 4096):
+    """Yields (first_frame_index, rms) blocks of per-frame RMS over samples[start:end].
+
+    Works block by block, so memory stays constant however long the audio is.
+    """
+    end = len(samples) if end is None else min(end, len(samples))
+    n_frames = max(0, (end - start) // frame_len)
+    for i in range(0, n_frames, block_frames):
+        j = min(i + block_frames, n_frames)
+        block = np.asarray(samples[start + i * frame_len:start + j * frame_len], dtype=np.float32)
+        if block.ndim > 1:
+            block = block.mean(axis=1)
+        block = block.reshape(j - i, frame_len)
+        yield i, np.sqrt(np.mean(block * block, axis=1))
+
+
+def frame_rms(samples, frame_len: int, start: int = 0, end: int = None) -> np.ndarray:
+    blocks = [rms for _, rms in iter_frame_rms(samples, frame_len, start, end)]
+    return np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+
+
+def quietest_point(samples, sample_rate: int, start_s: float, end_s: float, frame_ms: int = 20, window_ms: int = 300) -> float:
+    """Returns the time (seconds) in [start_s, end_s] at the centre of the quietest `window_ms` stretch."""
+    frame_len = max(1, sample_rate * frame_ms // 1000)
+    start = max(0, int(start_s * sample_rate))
+    rms = frame_rms(samples, frame_len, start, int(end_s * sample_rate))
+    if len(rms) == 0:
+        return start_s
+    window = max(1, min(len(rms), window_ms // frame_ms))
+    smoothed = np.convolve(rms, np.ones(window) / window, mode='valid')
+    best = int(np.argmin(smoothed)) + window // 2
+    return (start + best * frame_len + frame_len // 2) / sample_rate
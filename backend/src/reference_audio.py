@@ -0,0 +1,107 @@
+import os
+import tempfile
+import wave
+import numpy as np
+from src.pcm import open_pcm, iter_frame_rms
+from src.transcript import Transcript
+
+FULL_SCALE = 32768.0
+FRAME_MS = 20
+# Frames below this level count as silence inside a candidate window
+VOICED_DB = -40
+# Frames this loud are likely clipped; a distorted reference gives a distorted clone
+HOT_DB = -6
+
+
+def select_reference_window(words: Transcript, rms: np.ndarray, frame_ms: float, min_ms: int = 10000,
+                            max_ms: int = 15000, max_gap_ms: int = 600):
+    """Picks the words [i, j] that make the best clone reference, or None without words.
+
+    Candidates are runs of consecutive words, no pause longer than `max_gap_ms`, spanning between
+    `min_ms` and `max_ms`. They are scored on how much of the window is words, how much of it is
+    voiced and how little of it is clipped. With no run that long, the longest one wins.
+    """
+    n = len(words)
+    if n == 0:
+        return None
+    start = words.start_ms.astype(np.int64)
+    end = words.end_ms.astype(np.int64)
+
+    # Continuous-speech runs: a new run starts after every long pause
+    run = np.concatenate(([0], np.cumsum(start[1:] - end[:-1] > max_gap_ms)))
+    run_last = np.searchsorted(run, run, side='right') - 1
+    last = np.minimum(np.searchsorted(end, start + max_ms, side='right') - 1, run_last)
+    first = np.arange(n)
+    valid = last >= first
+    last = np.maximum(last, first)
+    duration = end[last] - start
+
+    long_enough = valid & (duration >= min_ms)
+    if not long_enough.any():
+        candidates = np.flatnonzero(valid)
+        if not len(candidates):
+            return 0, 0
+        i = int(candidates[np.argmax(duration[candidates])])
+        return i, int(last[i])
+
+    word_ms = np.concatenate(([0], np.cumsum(end - start)))
+    coverage = (word_ms[last + 1] - word_ms[first]) / np.maximum(duration, 1)
+
+    score = coverage
+    if len(rms):
+        voiced = np.concatenate(([0], np.cumsum(rms > FULL_SCALE * 10 ** (VOICED_DB / 20))))
+        hot = np.concatenate(([0], np.cumsum(rms > FULL_SCALE * 10 ** (HOT_DB / 20))))
+        lo = np.minimum((start / frame_ms).astype(np.int64), len(rms))
+        hi = np.minimum(np.maximum((end[last] / frame_ms).astype(np.int64), lo + 1), len(rms))
+        frames = np.maximum(hi - lo, 1)
+        score = score + (voiced[hi] - voiced[lo]) / frames - 4 * (hot[hi] - hot[lo]) / frames
+    # Between equally clean windows, more reference audio is better
+    score = score + 0.1 * duration / max_ms
+
+    score = np.where(long_enough, score, -np.inf)
+    i = int(np.argmax(score))
+    return i, int(last[i])
+
+
+def write_wav(path: str, samples, sample_rate: int):
+    """Writes 16-bit PCM samples (1-D mono or (frames, channels)) atomically."""
+    channels = 1 if samples.ndim == 1 else samples.shape[1]
+    fd, tmp_path = tempfile.mkstemp(suffix=".wav", dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    try:
+        with wave.open(tmp_path, 'wb') as f:
+            f.setnchannels(channels)
+            f.setsampwidth(2)
+            f.setframerate(sample_rate)
+            f.writeframes(np.ascontiguousarray(samples, dtype='<i2').tobytes())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def build_reference(audio_path: str, timestamps: list, output_path: str, min_ms: int = 10000,
+                    max_ms: int = 15000, padding_ms: int = 150) -> str:
+    """Cuts the best clone reference out of `audio_path` into `output_path`; returns its text.
+
+    Only the chosen window is read from the memory-mapped WAV, so the cost doesn't grow with the
+    length of the upload beyond one pass of frame energies. Falls back to the whole file when
+    there are no words to choose from.
+    """
+    samples, sample_rate = open_pcm(audio_path)
+    words = Transcript.from_timestamps(timestamps)
+    frame_len = max(1, sample_rate * FRAME_MS // 1000)
+    rms = np.concatenate([block for _, block in iter_frame_rms(samples, frame_len, block_frames=16384)] or [np.zeros(0)])
+    window = select_reference_window(words, rms, 1000 * frame_len / sample_rate, min_ms, max_ms)
+    if window is None:
+        write_wav(output_path, samples, sample_rate)
+        return ""
+
+    i, j = window
+    # Pad into the pauses around the window without reaching the neighbouring words
+    start_ms = max(int(words.start_ms[i]) - padding_ms, int(words.end_ms[i - 1]) if i > 0 else 0)
+    end_ms = int(words.end_ms[j]) + padding_ms
+    if j + 1 < len(words):
+        end_ms = min(end_ms, int(words.start_ms[j + 1]))
+    write_wav(output_path, samples[start_ms * sample_rate // 1000:end_ms * sample_rate // 1000], sample_rate)
+    return words[i:j + 1].text.strip()
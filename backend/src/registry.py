@@ -0,0 +1,62 @@
+import os
+import threading
+
+
+class ServiceRegistry:
+    """Shared clients, each built by its factory the first time it's asked for.
+
+    Factories import their SDK themselves, so importing the app doesn't load openai, replicate
+    or requests, and a process that never transcribes never pays for them.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory):
+        with self._lock:
+            self._factories[name] = factory
+            self._instances.pop(name, None)
+
+    def get(self, name: str):
+        instance = self._instances.get(name)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(name)
+                if instance is None:
+                    instance = self._instances[name] = self._factories[name]()
+        return instance
+
+    def set(self, name: str, instance):
+        """Uses `instance` instead of building one, e.g. a fake in benchmarks."""
+        with self._lock:
+            self._instances[name] = instance
+
+
+def _openai():
+    from openai import OpenAI
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+
+def _http():
+    import requests
+    from requests.adapters import HTTPAdapter
+    # Sized for every clone and lip-sync download in flight at once to keep its connection
+    pool_size = int(os.getenv("TRANSFER_POOL_SIZE", "16"))
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _replicate():
+    from replicate.client import Client
+    return Client(api_token=os.getenv("REPLICATE_API_TOKEN"))
+
+
+registry = ServiceRegistry()
+registry.register("openai", _openai)
+registry.register("replicate", _replicate)
+registry.register("http", _http)
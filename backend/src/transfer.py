@@ -0,0 +1,117 @@
+import logging
+import os
+import random
+import re
+import time
+from src.metrics import metrics, span
+from src.registry import registry
+
+CHUNK_SIZE = 1024 * 1024
+# Connect and per-read timeouts; a stalled read is retried from where it stopped
+TIMEOUT = (10, 60)
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class TransferError(Exception):
+    pass
+
+
+def _backoff(attempt: int, base: float, cap: float) -> float:
+    # Full jitter, so concurrent downloads that failed together don't retry together
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class Downloader:
+    """Streams remote files to disk over one pooled keep-alive session.
+
+    Safe to share between threads: every prediction output is fetched through the same
+    connection pool (the registry's "http" session) instead of a fresh TCP/TLS handshake each.
+    Interrupted downloads resume with a Range request and failed ones back off with jitter.
+    """
+
+    def __init__(self, session=None, retries: int = None,
+                 backoff: float = 0.5, max_backoff: float = 30.0, chunk_size: int = CHUNK_SIZE):
+        self._session = session
+        self.retries = retries if retries is not None else int(os.getenv("TRANSFER_RETRIES", "5"))
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.chunk_size = chunk_size
+
+    @property
+    def session(self):
+        return self._session or registry.get("http")
+
+    def download(self, url: str, path: str) -> str:
+        """Writes `url` to `path` and returns the response's content type.
+
+        `path` is written in place; a partial file left by an earlier attempt is resumed.
+        """
+        import requests
+        for attempt in range(self.retries + 1):
+            try:
+                content_type, done = self._fetch(url, path)
+                if done:
+                    return content_type
+                error = TransferError(f"{url} ended early")
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                error = e
+            except TransferError as e:
+                if not getattr(e, "retryable", False):
+                    raise
+                error = e
+            if attempt == self.retries:
+                raise TransferError(f"Giving up on {url} after {attempt + 1} attempts: {error}") from error
+            delay = getattr(error, "retry_after", None) or _backoff(attempt, self.backoff, self.max_backoff)
+            logging.warning(f"Download of {url} failed ({error}); retrying in {delay:.1f}s")
+            metrics.inc("transfer_retries_total")
+            time.sleep(delay)
+
+    def _fetch(self, url: str, path: str):
+        """One attempt; returns (content_type, complete)."""
+        offset = os.path.getsize(path) if os.path.exists(path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        with self.session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+            content_type = response.headers.get("content-type", "")
+            if response.status_code == 416 and offset:
+                # Nothing past what we already have
+                return content_type, True
+            if response.status_code in RETRY_STATUSES:
+                error = TransferError(f"HTTP {response.status_code}")
+                error.retryable = True
+                retry_after = response.headers.get("retry-after", "")
+                error.retry_after = min(float(retry_after), self.max_backoff) if retry_after.isdigit() else None
+                raise error
+            if response.status_code not in (200, 206):
+                raise TransferError(f"Download of {url} failed with HTTP {response.status_code}")
+
+            resumed = response.status_code == 206 and self._range_start(response) == offset
+            expected = response.headers.get("content-length")
+            expected = int(expected) + (offset if resumed else 0) if expected and expected.isdigit() else None
+            with open(path, "ab" if resumed else "wb") as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    f.write(chunk)
+                size = f.tell()
+        return content_type, expected is None or size >= expected
+
+    @staticmethod
+    def _range_start(response) -> int:
+        match = re.match(r"bytes (\d+)-", response.headers.get("content-range", ""))
+        return int(match.group(1)) if match else -1
+
+    def download_to_cache(self, url: str, cache, key: str, suffix: str, stage: str, expect: str = None) -> str:
+        """Downloads `url` straight into `cache` under `key`, counting the bytes against `stage`.
+
+        `suffix` is what lookups for `key` use, so it is kept whatever the server calls the file;
+        a content type not starting with `expect` is only logged.
+        """
+        def write(tmp_path):
+            with span(stage) as current:
+                content_type = self.download(url, tmp_path)
+                current.bytes_in = os.path.getsize(tmp_path)
+            if expect and not content_type.startswith(expect):
+                logging.warning(f"Expected {expect} from {url}, got {content_type or 'no content type'}")
+
+        return cache.store(key, suffix, write)
+
+
+downloader = Downloader()
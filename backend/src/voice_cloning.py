@@ -1,23 +1,27 @@
-import replicate
 import time
 import sys
-import requests
-import shutil
 import os
-import json
+from src.cache import artifact_cache, hash_file_cached, make_key
+from src.metrics import span, record_prediction
+from src.registry import registry
+from src.transfer import downloader
+
+CLONE_MODEL_VERSION = "87faf6dd7a692dd82043f662e76369cab126a2cf1937e25a9d41e0b834fd230e"
 
 def get_cloned_voice(speaker_wav_path, idx, text, language):
 
-    if os.path.exists("voice_cloned_outputs"):
-        shutil.rmtree("voice_cloned_outputs")
-    
-    os.makedirs("voice_cloned_outputs", exist_ok=True)
+    # The reference window's text is saved next to it at upload
+    with open(speaker_wav_path.replace(".wav", ".txt")) as f:
+        ref_text = f.read().strip()
 
-    speaker = open(speaker_wav_path, "rb")
-    ref_text = json.load(open(speaker_wav_path.replace(".wav", ".json"), 'rb'))
-    ref_text = [t['text'] for t in ref_text]
-    ref_text = ' '.join(ref_text)
+    # Unchanged lines come straight from the cache instead of another prediction
+    key = make_key("clone", hash_file_cached(speaker_wav_path), ref_text, text, CLONE_MODEL_VERSION)
+    cached = artifact_cache.get(key, ".mp3")
+    if cached is not None:
+        print(f"Cloned voice for clip {idx} served from cache")
+        return cached
 
+    speaker = open(speaker_wav_path, "rb")
 
     input = {
             "gen_text": text,
@@ -26,31 +30,24 @@ def get_cloned_voice(speaker_wav_path, idx, text, language):
             }
 
 
-    prediction = replicate.predictions.create(
-        "87faf6dd7a692dd82043f662e76369cab126a2cf1937e25a9d41e0b834fd230e",
-        input=input
-    )
-
-
-    for i in range(20):
-        prediction.reload()
-        if prediction.status in {"succeeded", "failed", "canceled"}:
-            break
+    with span("clone_predict") as current:
+        current.bytes_out = os.path.getsize(speaker_wav_path)
+        prediction = registry.get("replicate").predictions.create(
+            CLONE_MODEL_VERSION,
+            input=input
+        )
 
-        time.sleep(2)
 
+        for i in range(20):
+            prediction.reload()
+            if prediction.status in {"succeeded", "failed", "canceled"}:
+                break
 
-    output_url = prediction.output
+            time.sleep(2)
+    record_prediction("voice_clone", prediction)
 
-    response = requests.get(output_url)
-    if response.status_code == 200:
-        content_type = response.headers.get('content-type')
-        if 'audio' in content_type:
-            extension = '.mp3'
-        
-        filename = f"output_new_{idx}{extension}"
-        
-        with open(os.path.join('voice_cloned_outputs', filename), 'wb') as f:
-            f.write(response.content)
 
+    if prediction.status != "succeeded":
+        raise RuntimeError(f"Voice clone for clip {idx} {prediction.status}: {getattr(prediction, 'error', None)}")
 
+    return downloader.download_to_cache(prediction.output, artifact_cache, key, ".mp3", "clone_download", expect="audio")
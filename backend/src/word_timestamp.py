@@ -1,26 +1,42 @@
 import os
-from datetime import timedelta
+import re
 import subprocess
-import moviepy.editor as mp
-from openai import OpenAI
+from src.cache import TranscriptCache
+from src.metrics import timed
+from src.transcript import Transcript
+from src.transcription_providers import TranscriptionPool, get_provider
 # from dotenv import load_dotenv
 
 # Load environment variables from .env file
 # load_dotenv()
 
-# Initialize the OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# TRANSCRIPTION_PROVIDER picks the engine: "openai" (default) or "local"
+provider = get_provider()
+pool = TranscriptionPool(provider)
+
+transcript_cache = TranscriptCache(
+    os.getenv("TRANSCRIPT_CACHE_DIR", "cache/transcripts"),
+    max_bytes=int(os.getenv("TRANSCRIPT_CACHE_MAX_MB", "256")) * 1024 * 1024
+)
+
+
+# C:\... or C:/... ; anything else is already a POSIX path and needs no wslpath round trip
+WINDOWS_PATH = re.compile(r"^[A-Za-z]:[\\/]")
 
 
 def convert_windows_path_to_wsl(windows_path):
+    if not WINDOWS_PATH.match(str(windows_path)):
+        return windows_path
     try:
-        return subprocess.check_output(['wslpath', '-u', windows_path]).decode('utf-8').strip()
-    except subprocess.CalledProcessError:
+        return subprocess.check_output(['wslpath', '-u', str(windows_path)]).decode('utf-8').strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
         print("Error converting Windows path to WSL path.")
         return windows_path
 
 
+@timed("extract_audio")
 def extract_audio(video_path, audio_path):
+    import moviepy.editor as mp
     try:
         wsl_video_path = convert_windows_path_to_wsl(video_path)
         wsl_audio_path = convert_windows_path_to_wsl(audio_path)
@@ -32,40 +48,23 @@ def extract_audio(video_path, audio_path):
         raise
 
 
+@timed("transcribe")
 def transcribe_audio(audio_file):
     try:
-        with open(audio_file, "rb") as audio:
-            response = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio,
-                response_format="verbose_json",
-                temperature=0,
-                timestamp_granularities=["word"],
-                prompt="Umm, let me think like, uh, uh, hmm... Okay, here's what I, I'm, like, thinking."
-            )
-        return process_transcription(response)
+        # Streamlit reruns the whole script on every interaction, so most calls are repeats
+        key = transcript_cache.key(str(audio_file), **provider.cache_params())
+        cached = transcript_cache.get(key)
+        if cached is not None:
+            return cached
+
+        transcript = process_words(pool.transcribe(str(audio_file)))
+        transcript_cache.put(key, transcript)
+        return transcript
     except Exception as e:
         print(f"Error during transcription: {e}")
         raise
 
 
-def format_timestamp(seconds):
-    td = timedelta(seconds=seconds)
-    hours, remainder = divmod(td.seconds, 3600)
-    minutes, seconds = divmod(remainder, 60)
-    milliseconds = int(td.microseconds / 1000)
-    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
-
-
-
-def process_transcription(result):
-    timestamp_word_tuples = []
-    for word in result.words:
-        start_time = format_timestamp(word['start'])
-        end_time = format_timestamp(word['end'])
-        formatted_word = f" {word['word']}"  # Add a space before each word
-        if word['word'] in [',', '.', '!', '?']:  # Remove space before punctuation
-            formatted_word = word['word']
-        timestamp_word_tuples.append({"start": start_time, "end": end_time, "text": formatted_word})
-
-    return timestamp_word_tuples
+def process_words(words):
+    # One bulk conversion for the whole transcript instead of formatting each word
+    return Transcript.from_words(words).to_timestamps()
@@ -0,0 +1,192 @@
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+WORKSPACE_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
+    return total
+
+
+class Workspace:
+    """One session's private directory; every intermediate and output file of an edit lives here."""
+
+    def __init__(self, manager: "WorkspaceManager", workspace_id: str):
+        self.manager = manager
+        self.id = workspace_id
+        self.root = os.path.join(manager.root, workspace_id)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def touch(self):
+        os.utime(self.root)
+
+    @property
+    def last_used(self) -> float:
+        return os.stat(self.root).st_mtime
+
+    def usage(self) -> int:
+        return dir_size(self.root)
+
+    def remaining_bytes(self) -> int:
+        return self.manager.remaining_bytes(self)
+
+    def check_quota(self, extra_bytes: int = 0):
+        self.manager.check_quota(self, extra_bytes)
+
+    def pin(self):
+        """Keeps the garbage collector off the workspace until the matching unpin()."""
+        self.manager._pin(self.id, 1)
+
+    def unpin(self):
+        self.manager._pin(self.id, -1)
+
+    @contextmanager
+    def in_use(self):
+        """Pins the workspace so the garbage collector leaves it alone while a job runs in it."""
+        self.pin()
+        self.touch()
+        try:
+            yield self
+        finally:
+            self.touch()
+            self.unpin()
+
+
+class WorkspaceManager:
+    def __init__(self, root: str = "data/workspaces", quota_bytes: int = None, global_quota_bytes: int = None,
+                 idle_seconds: int = None, gc_interval: int = 300):
+        self.root = root
+        self.quota_bytes = quota_bytes or int(os.getenv("WORKSPACE_QUOTA_MB", "4096")) * 1024 * 1024
+        self.global_quota_bytes = global_quota_bytes or int(os.getenv("WORKSPACES_GLOBAL_QUOTA_MB", "20480")) * 1024 * 1024
+        self.idle_seconds = idle_seconds or int(os.getenv("WORKSPACE_IDLE_SECONDS", str(6 * 3600)))
+        self.gc_interval = gc_interval
+        self._pins = {}
+        self._lock = threading.Lock()
+        self._gc_thread = None
+        os.makedirs(self.root, exist_ok=True)
+
+    def create(self) -> Workspace:
+        workspace = Workspace(self, uuid.uuid4().hex)
+        os.makedirs(workspace.root)
+        return workspace
+
+    def get(self, workspace_id: str, create: bool = False) -> Workspace:
+        if not WORKSPACE_ID.match(workspace_id or ""):
+            raise KeyError(workspace_id)
+        workspace = Workspace(self, workspace_id)
+        if not os.path.isdir(workspace.root):
+            if not create:
+                raise KeyError(workspace_id)
+            os.makedirs(workspace.root, exist_ok=True)
+        workspace.touch()
+        return workspace
+
+    def list(self) -> list:
+        return [Workspace(self, name) for name in os.listdir(self.root) if WORKSPACE_ID.match(name)]
+
+    def total_usage(self) -> int:
+        return dir_size(self.root)
+
+    def remaining_bytes(self, workspace: Workspace) -> int:
+        return min(self.quota_bytes - workspace.usage(), self.global_quota_bytes - self.total_usage())
+
+    def check_quota(self, workspace: Workspace, extra_bytes: int = 0):
+        if workspace.usage() + extra_bytes > self.quota_bytes:
+            raise QuotaExceeded(f"Workspace {workspace.id} is over its {self.quota_bytes // (1024 * 1024)} MB quota")
+        if self.total_usage() + extra_bytes > self.global_quota_bytes:
+            self.collect(need_bytes=extra_bytes)
+            if self.total_usage() + extra_bytes > self.global_quota_bytes:
+                raise QuotaExceeded("Server is out of workspace storage")
+
+    def _pin(self, workspace_id: str, delta: int):
+        with self._lock:
+            count = self._pins.get(workspace_id, 0) + delta
+            if count > 0:
+                self._pins[workspace_id] = count
+            else:
+                self._pins.pop(workspace_id, None)
+
+    def delete(self, workspace: Workspace):
+        shutil.rmtree(workspace.root, ignore_errors=True)
+
+    def _evict(self, workspace: Workspace) -> bool:
+        """Deletes `workspace` unless it's pinned; the lock is held throughout, so it can't be
+        pinned between the check and the delete."""
+        with self._lock:
+            if workspace.id in self._pins:
+                return False
+            self.delete(workspace)
+            return True
+
+    def collect(self, need_bytes: int = 0) -> list:
+        """Deletes idle workspaces, then the least recently used ones while over the global quota."""
+        now = time.time()
+        # A snapshot to skip the obviously busy ones; _evict checks again at delete time
+        with self._lock:
+            pinned = set(self._pins)
+        candidates = []
+        for workspace in self.list():
+            if workspace.id in pinned:
+                continue
+            try:
+                candidates.append((workspace.last_used, workspace))
+            except FileNotFoundError:
+                continue
+        candidates.sort(key=lambda item: item[0])
+
+        removed = []
+        for last_used, workspace in candidates:
+            if now - last_used > self.idle_seconds and self._evict(workspace):
+                removed.append(workspace.id)
+
+        total = self.total_usage()
+        for last_used, workspace in candidates:
+            if total + need_bytes <= self.global_quota_bytes:
+                break
+            if workspace.id in removed:
+                continue
+            size = workspace.usage()
+            if self._evict(workspace):
+                removed.append(workspace.id)
+                total -= size
+
+        if removed:
+            logging.info(f"Evicted {len(removed)} workspaces")
+        return removed
+
+    def start_gc(self):
+        if self._gc_thread is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(self.gc_interval)
+                try:
+                    self.collect()
+                except Exception as e:
+                    logging.error(f"Workspace garbage collection failed: {e}")
+
+        self._gc_thread = threading.Thread(target=loop, name="workspace-gc", daemon=True)
+        self._gc_thread.start()
+
+
+workspace_manager = WorkspaceManager(os.getenv("WORKSPACES_DIR", "data/workspaces"))
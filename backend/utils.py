@@ -1,43 +1,75 @@
 import tempfile
 import os
+import hashlib
 import subprocess
-from moviepy.editor import VideoFileClip, concatenate_videoclips, AudioFileClip
-import replicate
+import logging
 import time
-import requests
-from moviepy.audio.fx.all import volumex
-
-DATA_DIR = 'data'
-
-if not os.path.exists(DATA_DIR):
-    os.makedirs(DATA_DIR)
-
-def save_uploaded_video(uploaded_video):
-    with open(DATA_DIR + '/uploaded_video.mp4', 'wb') as f:
-        f.write(uploaded_video.getbuffer())
-    return DATA_DIR + '/uploaded_video.mp4'
-
-def extract_audio(video_path):
-    audio_path = DATA_DIR + '/audio.wav'
+from itertools import groupby
+from src.edl import EDL
+from src.filter_graph import FilterGraphRenderer, FilterGraphError
+from src.cache import artifact_cache, hash_file_cached, make_key
+from src.reference_audio import build_reference
+from src.registry import registry
+from src.transfer import downloader
+from src.workspace import Workspace
+
+# Kept words closer than this are rendered as one contiguous range
+GAP_TOLERANCE_MS = int(os.getenv("EDL_GAP_TOLERANCE_MS", "50"))
+# "ffmpeg" renders the whole timeline in one filter-graph run; "moviepy" pulls frames through Python
+RENDER_MODE = os.getenv("RENDER_MODE", "moviepy")
+CLONE_VOLUME = 1.5
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+_saved_digests = {}
+
+def save_uploaded_video(workspace: Workspace, uploaded_video):
+    video_path = workspace.path('uploaded_video.mp4')
+    # Streamlit already holds the upload in memory; walk it in fixed-size slices
+    # instead of copying it, and skip the write when a rerun hands us the same file
+    buffer = uploaded_video.getbuffer()
+    digest = hashlib.sha256()
+    for i in range(0, len(buffer), UPLOAD_CHUNK_SIZE):
+        digest.update(buffer[i:i + UPLOAD_CHUNK_SIZE])
+    digest = digest.hexdigest()
+    if _saved_digests.get(video_path) == digest and os.path.exists(video_path):
+        return video_path
+
+    workspace.check_quota(len(buffer))
+    with open(video_path, 'wb') as f:
+        for i in range(0, len(buffer), UPLOAD_CHUNK_SIZE):
+            f.write(buffer[i:i + UPLOAD_CHUNK_SIZE])
+    _saved_digests[video_path] = digest
+    return video_path
+
+def extract_audio(workspace: Workspace, video_path):
+    audio_path = workspace.path('audio.wav')
     subprocess.run(['ffmpeg', '-i', video_path, '-vn', '-acodec', 'pcm_s16le', '-ac', '1', '-ar', '16000', '-y', audio_path])
     return audio_path
 
-def extract_video_segments(video_path, timestamps):
+def extract_video_segments(workspace: Workspace, video_path, timestamps):
+    return render_edl(workspace, video_path, EDL.from_timestamps(timestamps).coalesce(GAP_TOLERANCE_MS))
+
+def render_edl(workspace: Workspace, video_path, edl):
+    workspace.check_quota()
+    output_path = workspace.path('new_video.mp4')
+    if RENDER_MODE == "ffmpeg":
+        try:
+            return FilterGraphRenderer().render(video_path, [(start, end, None, 1.0) for start, end in edl], output_path)
+        except FilterGraphError as e:
+            logging.info(f"Filter graph render failed, falling back to MoviePy: {e}")
+
+    from moviepy.editor import VideoFileClip, concatenate_videoclips
     video = VideoFileClip(video_path)
     
-    output_path = DATA_DIR + '/new_video.mp4'
-    
     segments = []
     
-    for ts in timestamps:
-        start = float(ts['start'].replace(":", "").replace(".", "")) / 1000
-        end = float(ts['end'].replace(":", "").replace(".", "")) / 1000
+    for start, end in edl.to_seconds():
         segment = video.subclip(start, end)
         segments.append(segment)
     
     final_video = concatenate_videoclips(segments)
     
-    final_video.write_videofile(output_path, codec="libx264", audio=True)
+    final_video.write_videofile(output_path, codec="libx264", audio=True, ffmpeg_params=["-movflags", "+faststart"])
     
     video.close()
     final_video.close()
@@ -46,8 +78,21 @@ def extract_video_segments(video_path, timestamps):
     return output_path
 
 
+def prepare_reference(workspace: Workspace, audio_path, transcript):
+    """Cuts a short clean clone reference out of the upload; returns (reference_path, reference_text)."""
+    reference_path = workspace.path('reference.wav')
+    return reference_path, build_reference(audio_path, transcript, reference_path)
+
+
+CLONE_MODEL_VERSION = "87faf6dd7a692dd82043f662e76369cab126a2cf1937e25a9d41e0b834fd230e"
+
 def get_cloned_voice(audio_path, ref_text, text):
     
+    key = make_key("clone", hash_file_cached(audio_path), ref_text, text, CLONE_MODEL_VERSION)
+    cached = artifact_cache.get(key, ".mp3")
+    if cached is not None:
+        return cached
+
     speaker = open(audio_path, "rb")
 
     input = {
@@ -57,8 +102,8 @@ def get_cloned_voice(audio_path, ref_text, text):
             }
 
 
-    prediction = replicate.predictions.create(
-        "87faf6dd7a692dd82043f662e76369cab126a2cf1937e25a9d41e0b834fd230e",
+    prediction = registry.get("replicate").predictions.create(
+        CLONE_MODEL_VERSION,
         input=input
     )
 
@@ -70,50 +115,53 @@ def get_cloned_voice(audio_path, ref_text, text):
         time.sleep(2)
 
 
-    output_url = prediction.output
-
-    response = requests.get(output_url)
-    if response.status_code == 200:
-        content_type = response.headers.get('content-type')
-        if 'audio' in content_type:
-            extension = '.mp3'
-        
-        filename = f"cloned_voice{extension}"
-        
-        with open(os.path.join(DATA_DIR, filename), 'wb') as f:
-            f.write(response.content)
+    if prediction.status != "succeeded":
+        raise RuntimeError(f"Voice clone {prediction.status}: {getattr(prediction, 'error', None)}")
 
-        return os.path.join(DATA_DIR, filename)
+    return downloader.download_to_cache(prediction.output, artifact_cache, key, ".mp3", "clone_download", expect="audio")
 
 
 
-def modify_and_patch_video(video_path, audio_path, timestamps, ref_text):
+def patched_segments(audio_path, timestamps, ref_text):
+    """(start_ms, end_ms, cloned_audio_path, volume) per synced line, plain ranges for the unchanged runs."""
+    segments = []
+    for sync, run in groupby(timestamps, key=lambda ts: bool(ts['sync'])):
+        run = list(run)
+        if sync:
+            for ts in run:
+                # An empty line has no range; don't pay for a clone that can't be rendered
+                for start, end in EDL.from_timestamps([ts]).ranges:
+                    segments.append((start, end, get_cloned_voice(audio_path, ref_text, ts['text']), CLONE_VOLUME))
+        else:
+            segments.extend((start, end, None, 1.0) for start, end in EDL.from_timestamps(run).coalesce(GAP_TOLERANCE_MS))
+    return segments
+
+
+def modify_and_patch_video(workspace: Workspace, video_path, audio_path, timestamps, ref_text):
+    workspace.check_quota()
+    output_path = workspace.path('synced_video.mp4')
+    plan = patched_segments(audio_path, timestamps, ref_text)
+    if RENDER_MODE == "ffmpeg":
+        try:
+            return FilterGraphRenderer().render(video_path, plan, output_path)
+        except FilterGraphError as e:
+            logging.info(f"Filter graph render failed, falling back to MoviePy: {e}")
+
+    from moviepy.editor import VideoFileClip, AudioFileClip, concatenate_videoclips
+    from moviepy.audio.fx.all import volumex
     video = VideoFileClip(video_path)
     
-    output_path = DATA_DIR + '/synced_video.mp4'
-    
     segments = []
     
-    for ts in timestamps:
-        start = float(ts['start'].replace(":", "").replace(".", "")) / 1000
-        end = float(ts['end'].replace(":", "").replace(".", "")) / 1000
-        sync = ts['sync']
-
-        if sync:
-            segment = video.subclip(start, end)
-            text = ts['text']
-            to_set_audio_path = get_cloned_voice(audio_path, ref_text, text)
-            new_audio = AudioFileClip(to_set_audio_path)
-            new_audio = volumex(new_audio, 1.5)
-            segment = segment.set_audio(new_audio)
-
-        else:
-            segment = video.subclip(start, end)
+    for start, end, cloned_audio_path, volume in plan:
+        segment = video.subclip(start / 1000, end / 1000)
+        if cloned_audio_path is not None:
+            segment = segment.set_audio(volumex(AudioFileClip(cloned_audio_path), volume))
         segments.append(segment)
     
     final_video = concatenate_videoclips(segments)
     
-    final_video.write_videofile(output_path, codec="libx264", audio=True)
+    final_video.write_videofile(output_path, codec="libx264", audio=True, ffmpeg_params=["-movflags", "+faststart"])
     
     video.close()
     final_video.close()
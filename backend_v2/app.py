@@ -2,9 +2,32 @@ import streamlit as st
 import requests
 from typing import List
 import json
+import time
 
 API_URL = "http://localhost:8000"  # FastAPI endpoint
 
+
+def wait_for_job(job):
+    """Polls a backend job, showing its stage and progress, and returns the finished job."""
+    bar = st.progress(0, text="Queued")
+    while job["status"] not in ("succeeded", "failed"):
+        time.sleep(0.5)
+        job = requests.get(f"{API_URL}/jobs/{job['job_id']}").json()
+        bar.progress(min(100, int(job["percent"])), text=job["stage"] or job["status"])
+    bar.empty()
+    return job
+
+
+def job_result_url(job):
+    return f"{API_URL}/jobs/{job['job_id']}/result"
+
+
+def workspace_headers():
+    """Every request after the first upload is scoped to this session's workspace."""
+    if st.session_state.get('workspace_id'):
+        return {"X-Workspace-Id": st.session_state.workspace_id}
+    return {}
+
 st.set_page_config(
     page_title="ScriptCut",
     page_icon="📝",
@@ -42,15 +65,25 @@ with cols[0]:
         # Upload video to FastAPI
         files = {"file": uploaded_video.getvalue()}
         response = requests.post(f"{API_URL}/upload-video/", files=files)
-        data = response.json()
-        
-        
-        transcript = ['[' + str(x['start']) + ' - ' + str(x['end']) +']'+ ' :|: ' +  x['text'] 
-                     for x in data["transcript"]]
-        st.session_state.original_script = '\n'.join(transcript)
+        st.session_state.workspace_id = response.json()["workspace_id"]
+        job = wait_for_job(response.json())
+        if job["status"] == "succeeded":
+            data = requests.get(job_result_url(job)).json()
+            transcript = ['[' + str(x['start']) + ' - ' + str(x['end']) +']'+ ' :|: ' +  x['text'] 
+                         for x in data["transcript"]]
+            st.session_state.original_script = '\n'.join(transcript)
+        else:
+            st.error(f"Failed to process upload: {job['error']}")
 
 with cols[1]:
     st.subheader("Trim Transcript")
+    if st.session_state.get('workspace_id') and st.button("Remove silences and fillers"):
+        suggestions = requests.get(f"{API_URL}/suggested-cuts/", headers=workspace_headers()).json()
+        st.info(f"Cut {len(suggestions['cuts'])} ranges ({suggestions['cut_ms'] / 1000:.1f}s): "
+                f"{suggestions['silences']} silences, {suggestions['fillers']} filler words")
+        transcript = ['[' + str(x['start']) + ' - ' + str(x['end']) +']'+ ' :|: ' +  x['text'] 
+                     for x in suggestions["kept_transcript"]]
+        st.session_state.original_script = '\n'.join(transcript)
     script = st.text_area("Transcript", 
                          st.session_state.original_script if 'original_script' in st.session_state else '', 
                          height=300)
@@ -70,26 +103,34 @@ with cols[1]:
                 f"{API_URL}/process-video/",
                 json={
                     "timestamps": timestamps,
-                }
+                },
+                headers=workspace_headers()
             )
+            job = wait_for_job(response.json())
             ## handle file response
-            if response.status_code == 200:
-                video_content = response.content
-                st.video(video_content, format="video/mp4")
-                st.session_state.trimmed_video = video_content
-                import io
-
-                # Wrap the raw bytes in io.BytesIO
-                video_file = io.BytesIO(video_content)
-                files = {"file": video_file.getvalue()}
-                response = requests.post(f"{API_URL}/upload-video/", files=files)
-                data = response.json()
+            if job["status"] == "succeeded":
+                # The player streams the result with range requests instead of downloading it first
+                st.video(job_result_url(job), format="video/mp4")
+                st.session_state.trimmed_video_url = job_result_url(job)
+
+                # Word times for the trim are remapped from the original transcript on the backend
+                data = requests.get(f"{API_URL}/jobs/{job['job_id']}/transcript").json()
                 transcript = ['[' + str(x['start']) + ' - ' + str(x['end']) +']'+ ' :|: ' +  x['text'] 
                      for x in data["transcript"]]
                 st.session_state.new_transcript = '\n'.join(transcript)
             
             else:
-                st.error(f"Failed to load video: {response.status_code} - {response.text}")
+                st.error(f"Failed to render video: {job['error']}")
+
+    # Previews are rendered from a low-resolution proxy; export renders the same cut from the source
+    if st.session_state.get('trimmed_video_url') and st.button("Export full resolution"):
+        response = requests.post(f"{API_URL}/export-video/", json={}, headers=workspace_headers())
+        job = wait_for_job(response.json())
+        if job["status"] == "succeeded":
+            st.video(job_result_url(job), format="video/mp4")
+            st.markdown(f"[Download]({job_result_url(job)})")
+        else:
+            st.error(f"Failed to export video: {job['error']}")
 
 
 # if not st.session_state.bloopers and 'new_transcript' in st.session_state:
@@ -105,7 +146,8 @@ with cols[1]:
 #                 f"{API_URL}/modify-video/",
 #                 json={
 #                     "to_lip_sync_transcript": new_script
-#                 }
+#                 },
+#                 headers=workspace_headers()
 #             )
-#             video_content = response.content
-#             st.video(video_content, format="video/mp4")
\ No newline at end of file
+#             job = wait_for_job(response.json())
+#             st.video(job_result_url(job), format="video/mp4")
\ No newline at end of file
@@ -1,19 +1,90 @@
-from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Header, Depends
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from pydantic import BaseModel
 from typing import List
 import os
-from services.video_service import VideoService
+import json
+import time
+from services.video_service import VideoService, EDL_NAME
 from services.audio_service import AudioService
 from services.transcription_service import TranscriptionService
+from services.analysis_service import AnalysisService
+from services.timeline_service import TimelineService, TimelineUnavailable
+from services.jobs import JobManager
+from services.upload_service import UploadService, UploadError
+from services.streaming import range_file_response, file_etag, etag_matches, cache_control
+from services.workspace import WorkspaceManager, Workspace, QuotaExceeded
+from services.transcript_diff import anchored_diff, parse_script, sync_timestamps
+from services.metrics import metrics, breakdown_scope, server_timing
 import logging
 
 logging.basicConfig(level=logging.INFO)
 
 app = FastAPI()
-video_service = VideoService()
 audio_service = AudioService()
+video_service = VideoService(audio_service=audio_service)
 transcription_service = TranscriptionService()
+analysis_service = AnalysisService()
+timeline_service = TimelineService()
+job_manager = JobManager(max_workers=int(os.getenv("JOB_WORKERS", "2")))
+upload_service = UploadService()
+workspace_manager = WorkspaceManager()
+
+metrics.register_cache("artifacts", audio_service.artifacts)
+metrics.register_cache("transcripts", transcription_service.cache)
+metrics.register_cache("segments", video_service.segment_renderer.cache)
+metrics.gauge("jobs", job_manager.queue_depth, state="queued")
+metrics.gauge("jobs", job_manager.running, state="running")
+metrics.gauge("transcriptions_pending", lambda: transcription_service.pool.pending)
+
+
+@app.on_event("startup")
+def start_workspace_gc():
+    workspace_manager.start_gc()
+
+
+@app.on_event("startup")
+def warm_transcription():
+    # A local model takes seconds to load; do it before the first upload needs it
+    transcription_service.warm()
+
+
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    """Times every request and reports the stages it ran in a Server-Timing header."""
+    breakdown = {}
+    start = time.perf_counter()
+    with breakdown_scope(breakdown):
+        response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    metrics.observe("http_request_seconds", elapsed, method=request.method,
+                    route=route.path if route else "unmatched", status=response.status_code)
+    # Job results carry the job's own breakdown instead
+    if "Server-Timing" not in response.headers:
+        response.headers["Server-Timing"] = server_timing(breakdown, elapsed)
+    return response
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.exception_handler(QuotaExceeded)
+async def quota_exceeded_handler(request: Request, exc: QuotaExceeded):
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
+
+def get_workspace(x_workspace_id: str = Header(None)) -> Workspace:
+    """Every editing session sends its workspace id in the X-Workspace-Id header."""
+    if x_workspace_id is None:
+        raise HTTPException(status_code=400, detail="Missing X-Workspace-Id header")
+    try:
+        return workspace_manager.get(x_workspace_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Workspace not found")
 
 class TimeStamp(BaseModel):
     start: str
@@ -21,71 +92,286 @@ class TimeStamp(BaseModel):
     text: str
     sync: bool = False
 
-@app.post("/upload-video/")
-async def upload_video(file: UploadFile = File(...)):
-    video_path = await video_service.save_video(file)
-    audio_path = audio_service.extract_audio(video_path, 'original_audio.wav')
-    transcript = transcription_service.transcribe_audio(audio_path)
-    with open('data/original_reference_text.txt', 'w') as f:
-        f.write(''.join([t['text'] for t in transcript]))
-    
+
+def run_upload(workspace, video_path, job):
+    with workspace.in_use():
+        job.update("extract_audio", 0.05)
+        audio_path = audio_service.extract_audio(workspace, video_path, 'original_audio.wav')
+        job.update("waveform", 0.15)
+        timeline_service.build_waveform(workspace, audio_path)
+        job.update("transcribe", 0.2)
+        transcript = transcription_service.transcribe_audio(audio_path)
+        with open(workspace.path('original_transcript.json'), 'w') as f:
+            json.dump(transcript, f)
+        job.update("reference", 0.95)
+        audio_service.prepare_reference(workspace, audio_path, transcript)
+
     return {
+        "workspace_id": workspace.id,
         "transcript": transcript
     }
 
+def run_proxy(workspace, video_path, job):
+    with workspace.in_use():
+        job.update("proxy")
+        proxy_path = video_service.make_proxy(workspace, video_path)
+        if proxy_path:
+            # The proxy is a fraction of the source's pixels and decodes much faster
+            job.update("thumbnails", 0.9)
+            timeline_service.build_thumbnails(workspace, proxy_path)
+    return {"proxy_path": proxy_path}
+
+def start_ingest(workspace, video_path):
+    """Transcribes the upload and, in parallel, encodes the preview proxy."""
+    proxy_job = job_manager.submit("proxy", run_proxy, workspace, video_path, pin=workspace)
+    job = job_manager.submit("upload", run_upload, workspace, video_path, pin=workspace)
+    return {**job.to_dict(), "workspace_id": workspace.id, "proxy_job_id": proxy_job.id}
+
+@app.post("/workspaces/")
+async def create_workspace():
+    return {"workspace_id": workspace_manager.create().id}
+
+@app.delete("/workspaces/{workspace_id}")
+async def delete_workspace(workspace_id: str):
+    try:
+        workspace_manager.delete(workspace_manager.get(workspace_id))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Workspace not found")
+    return {"workspace_id": workspace_id, "deleted": True}
+
+@app.post("/upload-video/")
+async def upload_video(file: UploadFile = File(...), x_workspace_id: str = Header(None)):
+    # Uploading without a workspace starts a new editing session
+    workspace = get_workspace(x_workspace_id) if x_workspace_id else workspace_manager.create()
+    video_path, _ = await video_service.save_video(file, workspace)
+    return start_ingest(workspace, video_path)
+
+
+# Resumable uploads: POST /uploads/ -> PUT chunks at ?offset= -> POST /uploads/{id}/commit.
+# After a dropped connection, GET /uploads/{id} tells the client where to resume.
+@app.post("/uploads/")
+async def init_upload(request: dict = None, workspace: Workspace = Depends(get_workspace)):
+    request = request or {}
+    return upload_service.init(workspace, request.get("size"), request.get("sha256"))
+
+@app.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str, workspace: Workspace = Depends(get_workspace)):
+    try:
+        return {"upload_id": upload_id, "offset": upload_service.offset(workspace, upload_id)}
+    except UploadError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.put("/uploads/{upload_id}")
+async def put_upload_chunk(upload_id: str, offset: int, request: Request, workspace: Workspace = Depends(get_workspace)):
+    try:
+        new_offset = await upload_service.append(workspace, upload_id, offset, request.stream())
+    except UploadError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"upload_id": upload_id, "offset": new_offset}
+
+@app.post("/uploads/{upload_id}/commit")
+async def commit_upload(upload_id: str, workspace: Workspace = Depends(get_workspace)):
+    video_path = workspace.path("uploaded_video.mp4")
+    try:
+        upload_service.commit(workspace, upload_id, video_path)
+    except UploadError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    # Only once the new upload is in place; a rejected commit leaves the old one fully usable
+    video_service.discard_derived(workspace)
+    return start_ingest(workspace, video_path)
+
+
+def run_process(workspace, video_path, timestamps, render_mode, job):
+    with workspace.in_use():
+        preview_path = video_service.preview(workspace, video_path, timestamps, render_mode, progress=job.update)
+    return {"video_path": preview_path, "transcript": video_service.load_trimmed_transcript(workspace)}
+
+def run_export(workspace, video_path, render_mode, job):
+    with workspace.in_use():
+        new_video_path = video_service.export(workspace, video_path, render_mode, progress=job.update)
+    return {"video_path": new_video_path}
+
 @app.post("/process-video/")
-async def process_video(request: dict):
-    video_path = 'data/uploaded_video.mp4'
+async def process_video(request: dict, workspace: Workspace = Depends(get_workspace)):
+    video_path = workspace.path('uploaded_video.mp4')
     timestamps = request["timestamps"]
     logging.info(f"Video path: {video_path}")
-    new_video_path = video_service.extract_segments(video_path, timestamps)
-    processed_video = FileResponse(new_video_path, media_type="video/mp4", filename="modified_video.mp4")
-    return processed_video
-
-def get_to_synced_timestamps(new_transcript, new_new_script):
-    to_be_synced_time_stamps = []
-    for old_line, new_line in zip(new_transcript.split('\n'), new_new_script.split('\n')):
-        timestamp_list = new_line.split(':|:')
-        timestamp = timestamp_list[0]
-        text = timestamp_list[1]
-        start = timestamp.split('-')[0].replace('[', '').strip()
-        end = timestamp.split('-')[1].replace(']', '').strip()
-
-        if old_line != new_line:
-            to_be_synced_time_stamps.append({'start': start, 'end': end, 'text': text, 'sync': True})
-        else:
-            to_be_synced_time_stamps.append({'start': start, 'end': end, 'text': text, 'sync': False})
-    
-    return to_be_synced_time_stamps
+    job = job_manager.submit("process", run_process, workspace, video_path, timestamps, request.get("render_mode"), pin=workspace)
+    return job.to_dict()
+
+@app.post("/export-video/")
+async def export_video(request: dict = None, workspace: Workspace = Depends(get_workspace)):
+    """Renders the last previewed trim at full resolution."""
+    request = request or {}
+    if not os.path.exists(workspace.path(EDL_NAME)):
+        raise HTTPException(status_code=409, detail="Nothing to export: submit a trim first")
+    video_path = workspace.path('uploaded_video.mp4')
+    job = job_manager.submit("export", run_export, workspace, video_path, request.get("render_mode"), pin=workspace)
+    return job.to_dict()
+
+def run_modify(workspace, new_new_transcript, job):
+    with workspace.in_use():
+        new_video_path = workspace.path('new_video.mp4')
+        if not os.path.exists(new_video_path):
+            # Lip sync works on the full-resolution cut, not the preview
+            job.update("export")
+            video_service.export(workspace, workspace.path('uploaded_video.mp4'))
+        # The trimmed video's words are the original ones remapped through the EDL
+        new_transcript = video_service.load_trimmed_transcript(workspace)
 
+        with open(workspace.path('original_transcript.json')) as f:
+            original_transcript = json.load(f)
+        reference_path, reference_text = audio_service.load_reference(
+            workspace, workspace.path('original_audio.wav'), original_transcript
+        )
+        # Only the spans whose words actually changed are sent for cloning
+        edits = anchored_diff(new_transcript, [x['text'] for x in parse_script(new_new_transcript)])
+        to_be_synced_time_stamps = sync_timestamps(edits)
+        synced_video_path = video_service.modify_and_patch(
+            workspace,
+            new_video_path,
+            reference_path,
+            to_be_synced_time_stamps,
+            reference_text,
+            job.timings,
+            progress=job.update
+        )
+    return {"video_path": synced_video_path}
 
 @app.post("/modify-video/")
-async def modify_video(request: dict):
+async def modify_video(request: dict, workspace: Workspace = Depends(get_workspace)):
     new_new_transcript = request["to_lip_sync_transcript"]
     print(new_new_transcript)
-    new_audio_path = audio_service.extract_audio('data/new_video.mp4', 'new_audio.wav')
-    new_transcript = transcription_service.transcribe_audio(new_audio_path)
-    new_transcript = ['[' + x['start'] + ' - ' + x['end'] +']'+ ' :|: ' +  x['text'] for x in new_transcript]
-    new_transcript = '\n'.join(new_transcript)
-
-    reference_text = open('data/original_reference_text.txt', 'r').read().strip()
-    original_audio_path = 'data/original_audio.wav'
-    to_be_synced_time_stamps = get_to_synced_timestamps(new_transcript, new_new_transcript)
-    synced_video_path = video_service.modify_and_patch(
-        'data/new_video.mp4',
-        original_audio_path,
-        to_be_synced_time_stamps,
-        reference_text
-    )
-    modified_video = FileResponse(synced_video_path, media_type="video/mp4", filename="modified_video.mp4")
-    return modified_video
-
-@app.get("/video/{video_name}")
-async def get_video(video_name: str):
-    video_path = os.path.join("data", video_name)
-    return FileResponse(video_path)
+    job = job_manager.submit("modify", run_modify, workspace, new_new_transcript, pin=workspace)
+    return job.to_dict()
+
+
+@app.get("/suggested-cuts/")
+def suggested_cuts(min_silence_ms: int = None, threshold_db: float = None, padding_ms: int = None,
+                   workspace: Workspace = Depends(get_workspace)):
+    """Long silences and filler words in the upload, with the transcript that remains without them."""
+    audio_path = workspace.path('original_audio.wav')
+    transcript_path = workspace.path('original_transcript.json')
+    if not os.path.exists(audio_path) or not os.path.exists(transcript_path):
+        raise HTTPException(status_code=409, detail="Upload and transcribe a video first")
+    with open(transcript_path) as f:
+        transcript = json.load(f)
+    with workspace.in_use():
+        return analysis_service.suggest_cuts(audio_path, transcript, min_silence_ms, threshold_db, padding_ms)
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, request: Request):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    if not job.done:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+
+    headers = {"Server-Timing": server_timing(job.breakdown, job.finished_at - job.created_at)}
+    if "video_path" in job.result:
+        return range_file_response(request, job.result["video_path"], filename="modified_video.mp4",
+                                   headers={"X-Stage-Timings": json.dumps(job.timings), **headers})
+    return JSONResponse(job.result, headers=headers)
+
+@app.get("/jobs/{job_id}/transcript")
+async def get_job_transcript(job_id: str):
+    """The transcript that goes with a finished render, on the render's own timeline."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not job.done or job.status == "failed":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    if "transcript" not in job.result:
+        raise HTTPException(status_code=404, detail="Job has no transcript")
+    return {"transcript": job.result["transcript"]}
+
+@app.get("/workspaces/{workspace_id}/video/{video_name}")
+async def get_video(workspace_id: str, video_name: str, request: Request):
+    try:
+        workspace = workspace_manager.get(workspace_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Workspace not found")
+    video_path = workspace.path(os.path.basename(video_name))
+    if not os.path.isfile(video_path):
+        raise HTTPException(status_code=404, detail="Video not found")
+    # preview.mp4, new_video.mp4 and synced_video.mp4 are overwritten by every render
+    return range_file_response(request, video_path, max_age=0)
+
+# Timeline data is addressed by path, like the video, so <img> and fetch() can use it without headers
+def timeline_workspace(workspace_id: str) -> Workspace:
+    try:
+        return workspace_manager.get(workspace_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Workspace not found")
+
+@app.get("/workspaces/{workspace_id}/timeline")
+async def get_timeline(workspace_id: str):
+    try:
+        summary = timeline_service.summary(timeline_workspace(workspace_id))
+    except TimelineUnavailable as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if summary["thumbnails"]:
+        summary["thumbnails"]["urls"] = [f"/workspaces/{workspace_id}/timeline/thumbnails/{sheet}"
+                                         for sheet in summary["thumbnails"]["sheets"]]
+    return summary
+
+@app.get("/workspaces/{workspace_id}/timeline/waveform")
+async def get_waveform(workspace_id: str, request: Request, start: float = 0.0, end: float = None,
+                       buckets: int = None):
+    """Min/max peak pairs (little-endian int16) for [start, end] seconds, at the coarsest level
+    with at least `buckets` in the window, e.g. the width of the view in pixels."""
+    workspace = timeline_workspace(workspace_id)
+    try:
+        path = timeline_service.waveform_path(workspace)
+    except TimelineUnavailable as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    # The file's own tag, narrowed to this window. A re-upload rewrites the file under the same
+    # URL, so browsers revalidate instead of drawing the old peaks from cache
+    etag = f'{file_etag(path)[:-1]}-{start:g}-{end}-{buckets}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control(0)}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    window, data = timeline_service.waveform_window(workspace, start, end, buckets)
+    headers.update({
+        "X-Sample-Rate": str(window["sample_rate"]),
+        "X-Samples-Per-Bucket": str(window["samples_per_bucket"]),
+        "X-First-Bucket": str(window["first_bucket"]),
+        "X-Bucket-Count": str(window["buckets"]),
+        "X-Start-Seconds": f"{window['start']:.6f}",
+    })
+    return Response(content=data, media_type="application/octet-stream", headers=headers)
+
+@app.get("/workspaces/{workspace_id}/timeline/thumbnails")
+async def get_thumbnails(workspace_id: str, start: float = 0.0, end: float = None):
+    try:
+        tiles = timeline_service.thumbnails_window(timeline_workspace(workspace_id), start, end)
+    except TimelineUnavailable as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    for tile in tiles:
+        tile["url"] = f"/workspaces/{workspace_id}/timeline/thumbnails/{tile['sheet']}"
+    return {"thumbnails": tiles}
+
+@app.get("/workspaces/{workspace_id}/timeline/thumbnails/{sheet}")
+async def get_thumbnail_sheet(workspace_id: str, sheet: str, request: Request):
+    try:
+        path = timeline_service.sheet_path(timeline_workspace(workspace_id), sheet)
+    except TimelineUnavailable:
+        raise HTTPException(status_code=404, detail="Sprite sheet not found")
+    # Sheet names repeat across uploads
+    return range_file_response(request, path, media_type="image/jpeg", max_age=0)
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,106 @@
+# services/analysis_service.py
+import os
+import re
+from bisect import bisect_left
+import numpy as np
+from .pcm import open_pcm, iter_frame_rms
+from .edl import EDL
+from .transcript import Transcript, ms_to_timestamp
+
+# Hesitations the Whisper prompt makes the model keep instead of smoothing over
+FILLER_WORDS = {"um", "umm", "uh", "uhm", "uhh", "hmm", "hm", "mm", "er", "erm", "ah"}
+FULL_SCALE = 32768.0
+
+
+def normalize_word(text: str) -> str:
+    return re.sub(r"[^\w']", "", text).lower()
+
+
+class AnalysisService:
+    """Finds cut suggestions (long silences and filler words) in an upload's extracted audio."""
+
+    def __init__(self):
+        self.min_silence_ms = int(os.getenv("SILENCE_MIN_MS", "700"))
+        self.threshold_db = float(os.getenv("SILENCE_THRESHOLD_DB", "-40"))
+        # Silence left on each side of a cut so speech onsets and tails aren't clipped
+        self.padding_ms = int(os.getenv("CUT_PADDING_MS", "100"))
+        self.frame_ms = 20
+
+    def detect_silences(self, audio_path: str, min_silence_ms: int = None, threshold_db: float = None) -> EDL:
+        """Stretches of at least `min_silence_ms` whose frame RMS stays below `threshold_db` dBFS.
+
+        The WAV is memory-mapped and scanned in fixed-size blocks, carrying any silence that is
+        still open across block boundaries, so memory stays flat for multi-hour recordings.
+        """
+        min_silence_ms = self.min_silence_ms if min_silence_ms is None else min_silence_ms
+        threshold_db = self.threshold_db if threshold_db is None else threshold_db
+        samples, sample_rate = open_pcm(audio_path)
+        frame_len = max(1, sample_rate * self.frame_ms // 1000)
+        frame_ms = 1000 * frame_len / sample_rate
+        threshold = FULL_SCALE * 10 ** (threshold_db / 20)
+        min_frames = max(1, int(np.ceil(min_silence_ms / frame_ms)))
+
+        silences = []
+        open_start = None
+        n_frames = 0
+        for first, rms in iter_frame_rms(samples, frame_len, block_frames=16384):
+            quiet = rms < threshold
+            edges = np.diff(np.concatenate(([open_start is not None], quiet)).astype(np.int8))
+            starts = (first + np.flatnonzero(edges == 1)).tolist()
+            ends = (first + np.flatnonzero(edges == -1)).tolist()
+            if open_start is not None and ends:
+                starts.insert(0, open_start)
+            elif open_start is not None:
+                n_frames = first + len(rms)
+                continue
+            open_start = starts.pop() if len(starts) > len(ends) else None
+            silences.extend((s, e) for s, e in zip(starts, ends) if e - s >= min_frames)
+            n_frames = first + len(rms)
+        if open_start is not None and n_frames - open_start >= min_frames:
+            silences.append((open_start, n_frames))
+
+        return EDL((round(s * frame_ms), round(e * frame_ms)) for s, e in silences)
+
+    @staticmethod
+    def find_fillers(words: Transcript) -> EDL:
+        filler = np.array([normalize_word(text) in FILLER_WORDS for text in words.texts()], dtype=bool)
+        return EDL(zip(words.start_ms[filler].tolist(), words.end_ms[filler].tolist()))
+
+    def suggest_cuts(self, audio_path: str, transcript: list, min_silence_ms: int = None,
+                     threshold_db: float = None, padding_ms: int = None) -> dict:
+        """Silences and filler words merged into cut ranges, plus the transcript that remains.
+
+        Silences are shrunk by `padding_ms` on each side; a filler sitting between two pauses
+        merges with them into a single cut.
+        """
+        padding_ms = self.padding_ms if padding_ms is None else padding_ms
+        words = Transcript.from_timestamps(transcript)
+        silences = self.detect_silences(audio_path, min_silence_ms, threshold_db)
+        fillers = self.find_fillers(words)
+        padded = EDL((start + padding_ms, end - padding_ms) for start, end in silences)
+        cuts = padded.union(fillers).coalesce(2 * padding_ms)
+
+        filler_starts = [start for start, _ in fillers]
+        silence_starts = [start for start, _ in padded]
+        suggestions = []
+        for start, end in cuts:
+            reasons = []
+            i = bisect_left(silence_starts, start)
+            if i < len(silence_starts) and silence_starts[i] < end:
+                reasons.append("silence")
+            i = bisect_left(filler_starts, start)
+            if i < len(filler_starts) and filler_starts[i] < end:
+                reasons.append("filler")
+            suggestions.append({"start": ms_to_timestamp(start), "end": ms_to_timestamp(end), "reasons": reasons})
+
+        # Words whose midpoint survives, on the source timeline, ready to submit as a trim
+        mid = ((words.start_ms.astype(np.int64) + words.end_ms) // 2).tolist()
+        kept_transcript = [ts for ts, t in zip(transcript, mid) if not cuts.contains(t)]
+        return {
+            "cuts": suggestions,
+            # Silences shorter than the padding on both sides aren't cut at all
+            "silences": len(padded),
+            "fillers": len(fillers),
+            "cut_ms": cuts.duration_ms,
+            "kept_transcript": kept_transcript,
+        }
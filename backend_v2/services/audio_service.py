@@ -1,55 +1,107 @@
 # services/audio_service.py
 import os
 import subprocess
-from moviepy.editor import AudioFileClip
-from moviepy.audio.fx.all import volumex
-import replicate
-import requests
 import time
+from .cache import ArtifactCache, hash_file_cached, make_key
+from .metrics import span, record_prediction
+from .reference_audio import build_reference
+from .registry import registry
+from .transfer import downloader
+from .workspace import Workspace
+
+CLONE_MODEL_VERSION = "87faf6dd7a692dd82043f662e76369cab126a2cf1937e25a9d41e0b834fd230e"
+# Cloned voices come back quieter than the source recording
+CLONE_VOLUME = 1.5
+# The clone reference: a short clean window of the upload and the words spoken in it
+REFERENCE_AUDIO_NAME = "reference_audio.wav"
+REFERENCE_TEXT_NAME = "reference_text.txt"
 
 class AudioService:
     def __init__(self):
-        self.data_dir = "data"
-        os.makedirs(self.data_dir, exist_ok=True)
-
-    def extract_audio(self, video_path: str, audio_path: str) -> str:
-        audio_path = os.path.join(self.data_dir, audio_path)
-        subprocess.run([
-            'ffmpeg', '-i', video_path,
-            '-vn',
-            '-acodec', 'pcm_s16le',
-            '-ac', '1',
-            '-ar', '16000',
-            '-y', audio_path
-        ])
+        self.artifacts = ArtifactCache(
+            os.getenv("ARTIFACT_CACHE_DIR", "cache/artifacts"),
+            max_bytes=int(os.getenv("ARTIFACT_CACHE_MAX_MB", "2048")) * 1024 * 1024
+        )
+        self.reference_min_ms = int(os.getenv("CLONE_REFERENCE_MIN_MS", "10000"))
+        self.reference_max_ms = int(os.getenv("CLONE_REFERENCE_MAX_MS", "15000"))
+
+    def extract_audio(self, workspace: Workspace, video_path: str, audio_name: str) -> str:
+        audio_path = workspace.path(audio_name)
+        with span("extract_audio") as current:
+            subprocess.run([
+                'ffmpeg', '-i', video_path,
+                '-vn',
+                '-acodec', 'pcm_s16le',
+                '-ac', '1',
+                '-ar', '16000',
+                '-y', audio_path
+            ])
+            current.bytes_in = os.path.getsize(video_path)
+            current.bytes_out = os.path.getsize(audio_path) if os.path.exists(audio_path) else 0
         return audio_path
 
-    def get_cloned_voice(self, audio_path: str, ref_text: str, text: str) -> str:
-        with open(audio_path, "rb") as speaker:
-            prediction = replicate.predictions.create(
-                "87faf6dd7a692dd82043f662e76369cab126a2cf1937e25a9d41e0b834fd230e",
-                input={
-                    "gen_text": text,
-                    "ref_text": ref_text,
-                    "ref_audio": speaker,
-                }
-            )
-
-        for _ in range(100):
-            prediction.reload()
-            if prediction.status in {"succeeded", "failed", "canceled"}:
-                break
-            time.sleep(2)
-
-        output_url = prediction.output
-        response = requests.get(output_url)
-        
-        if response.status_code == 200:
-            filename = os.path.join(self.data_dir, "cloned_voice.mp3")
-            with open(filename, 'wb') as f:
-                f.write(response.content)
-            
-            audio = AudioFileClip(filename)
-            audio = volumex(audio, 1.5)
-            return audio
+    def prepare_reference(self, workspace: Workspace, audio_path: str, transcript: list):
+        """Cuts the clone reference out of the upload once; returns (reference_path, reference_text).
+
+        Every clone request then sends these few seconds instead of the whole recording, so
+        request size and clone latency no longer grow with the length of the source.
+        """
+        reference_path = workspace.path(REFERENCE_AUDIO_NAME)
+        with span("reference") as current:
+            reference_text = build_reference(audio_path, transcript, reference_path, self.reference_min_ms, self.reference_max_ms)
+            current.bytes_out = os.path.getsize(reference_path)
+        with open(workspace.path(REFERENCE_TEXT_NAME), 'w') as f:
+            f.write(reference_text)
+        return reference_path, reference_text
+
+    def load_reference(self, workspace: Workspace, audio_path: str, transcript: list):
+        """The reference prepared at upload, preparing it now for workspaces that predate it."""
+        reference_path = workspace.path(REFERENCE_AUDIO_NAME)
+        text_path = workspace.path(REFERENCE_TEXT_NAME)
+        if not (os.path.exists(reference_path) and os.path.exists(text_path)):
+            return self.prepare_reference(workspace, audio_path, transcript)
+        with open(text_path) as f:
+            return reference_path, f.read().strip()
+
+    def get_cloned_voice(self, audio_path: str, ref_text: str, text: str):
+        filename = self.get_cloned_voice_path(audio_path, ref_text, text)
+        if filename is None:
+            return None
+
+        from moviepy.editor import AudioFileClip
+        from moviepy.audio.fx.all import volumex
+        audio = AudioFileClip(filename)
+        audio = volumex(audio, CLONE_VOLUME)
+        return audio
+
+    def get_cloned_voice_path(self, audio_path: str, ref_text: str, text: str) -> str:
+        """Path of the cached cloned voice, predicting it first on a miss."""
+        key = make_key("clone", hash_file_cached(audio_path), ref_text, text, CLONE_MODEL_VERSION)
+        filename = self.artifacts.get(key, ".mp3")
+        if filename is None:
+            filename = self._predict_cloned_voice(audio_path, ref_text, text, key)
+        return filename
+
+    def _predict_cloned_voice(self, audio_path: str, ref_text: str, text: str, key: str) -> str:
+        with span("clone_predict") as current:
+            current.bytes_out = os.path.getsize(audio_path)
+            with open(audio_path, "rb") as speaker:
+                prediction = registry.get("replicate").predictions.create(
+                    CLONE_MODEL_VERSION,
+                    input={
+                        "gen_text": text,
+                        "ref_text": ref_text,
+                        "ref_audio": speaker,
+                    }
+                )
+
+            for _ in range(100):
+                prediction.reload()
+                if prediction.status in {"succeeded", "failed", "canceled"}:
+                    break
+                time.sleep(2)
+        record_prediction("voice_clone", prediction)
 
+        if prediction.status != "succeeded":
+            raise RuntimeError(f"Voice clone {prediction.status}: {getattr(prediction, 'error', None)}")
+        return downloader.download_to_cache(prediction.output, self.artifacts, key, ".mp3", "clone_download", expect="audio")
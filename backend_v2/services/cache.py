@@ -0,0 +1,151 @@
+# services/cache.py
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from .transcript import Transcript
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+_file_hashes = {}
+
+
+def hash_file_cached(path: str) -> str:
+    """hash_file, memoized on (path, size, mtime) so a reference file is hashed once."""
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if memo_key not in _file_hashes:
+        _file_hashes[memo_key] = hash_file(path)
+    return _file_hashes[memo_key]
+
+
+def make_key(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class DiskCache:
+    """Content-addressed files under `cache_dir`, evicted least-recently-used once over `max_bytes`."""
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path_for(self, key: str, suffix: str = "") -> str:
+        return os.path.join(self.cache_dir, key[:2], key + suffix)
+
+    def lookup(self, key: str, suffix: str = "") -> str:
+        path = self.path_for(key, suffix)
+        with self._lock:
+            if os.path.exists(path):
+                self.hits += 1
+                os.utime(path)  # mtime doubles as the LRU clock
+                return path
+            self.misses += 1
+            return None
+
+    def store(self, key: str, suffix: str, write) -> str:
+        """Calls `write(tmp_path)` and atomically moves the result into the cache."""
+        path = self.path_for(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        os.close(fd)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+        return path
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if name.endswith(".tmp"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class TranscriptCache(DiskCache):
+    """Word-level transcripts keyed by the extracted audio and the transcription parameters."""
+
+    def key(self, audio_path: str, **params) -> str:
+        return make_key(hash_file(audio_path), params)
+
+    def get(self, key: str):
+        path = self.lookup(key, ".json.gz")
+        if path is None:
+            return None
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            columns = json.load(f)
+        return Transcript.from_texts(columns["start"], columns["end"], columns["text"]).to_timestamps()
+
+    def put(self, key: str, transcript: list):
+        # Columnar integer milliseconds compress far better than per-word dicts of strings
+        columns = Transcript.from_timestamps(transcript).columns()
+
+        def write(tmp_path):
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                json.dump(columns, f, separators=(',', ':'))
+
+        self.store(key, ".json.gz", write)
+        logging.info(f"Cached transcript {key[:12]} ({len(transcript)} words)")
+
+
+class ArtifactCache(DiskCache):
+    """Outputs of remote inference (cloned voices, lip-synced clips) keyed by everything that shaped them."""
+
+    def get(self, key: str, suffix: str):
+        return self.lookup(key, suffix)
+
+    def put_bytes(self, key: str, suffix: str, content: bytes) -> str:
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+
+        return self.store(key, suffix, write)
+
+    def put_file(self, key: str, suffix: str, src_path: str) -> str:
+        return self.store(key, suffix, lambda tmp_path: shutil.copyfile(src_path, tmp_path))
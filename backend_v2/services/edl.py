@@ -0,0 +1,110 @@
+# services/edl.py
+from bisect import bisect_right
+from .transcript import Transcript, parse_timestamps, format_timestamps
+
+
+class EDL:
+    """Edit decision list: sorted, non-overlapping [start_ms, end_ms) ranges of a source to keep."""
+
+    def __init__(self, ranges=()):
+        self.ranges = self._normalize(ranges)
+
+    @staticmethod
+    def _normalize(ranges):
+        merged = []
+        for start, end in sorted((int(s), int(e)) for s, e in ranges):
+            if end <= start:
+                continue
+            if merged and start <= merged[-1][1]:
+                if end > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        return merged
+
+    @classmethod
+    def from_timestamps(cls, timestamps: list) -> "EDL":
+        starts = parse_timestamps(ts['start'] for ts in timestamps)
+        ends = parse_timestamps(ts['end'] for ts in timestamps)
+        return cls(zip(starts.tolist(), ends.tolist()))
+
+    def coalesce(self, gap_ms: int) -> "EDL":
+        """Merges ranges separated by at most `gap_ms`, e.g. the pauses between kept words."""
+        merged = []
+        for start, end in self.ranges:
+            if merged and start - merged[-1][1] <= gap_ms:
+                merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        return EDL(merged)
+
+    def union(self, other: "EDL") -> "EDL":
+        return EDL(self.ranges + other.ranges)
+
+    def complement(self, start_ms: int = 0, end_ms: int = None) -> "EDL":
+        """Returns the removed parts of [start_ms, end_ms), i.e. the bloopers view."""
+        if end_ms is None:
+            end_ms = self.end_ms
+        gaps = []
+        cursor = start_ms
+        for start, end in self.ranges:
+            if end <= cursor:
+                continue
+            if start >= end_ms:
+                break
+            if start > cursor:
+                gaps.append((cursor, start))
+            cursor = max(cursor, end)
+        if cursor < end_ms:
+            gaps.append((cursor, end_ms))
+        return EDL(gaps)
+
+    def shift(self, offset_ms: int) -> "EDL":
+        return EDL((start + offset_ms, end + offset_ms) for start, end in self.ranges)
+
+    def contains(self, t_ms: int) -> bool:
+        return self._find(t_ms) >= 0
+
+    def _find(self, t_ms: int) -> int:
+        """Index of the range containing `t_ms`, or -1."""
+        i = bisect_right(self.ranges, (t_ms, float('inf'))) - 1
+        return i if i >= 0 and self.ranges[i][0] <= t_ms < self.ranges[i][1] else -1
+
+    def remap_timestamps(self, timestamps: list) -> list:
+        """Maps source-time word timestamps onto the timeline rendered from this EDL.
+
+        A word survives if its midpoint is kept; its start and end are clamped to the range
+        holding that midpoint. Other keys of each timestamp are passed through unchanged.
+        """
+        indices, start_ms, end_ms = Transcript.from_timestamps(timestamps).remap_indices(self)
+        return [
+            {**timestamps[i], 'start': start, 'end': end}
+            for i, start, end in zip(indices.tolist(), format_timestamps(start_ms), format_timestamps(end_ms))
+        ]
+
+    @property
+    def start_ms(self) -> int:
+        return self.ranges[0][0] if self.ranges else 0
+
+    @property
+    def end_ms(self) -> int:
+        return self.ranges[-1][1] if self.ranges else 0
+
+    @property
+    def duration_ms(self) -> int:
+        return sum(end - start for start, end in self.ranges)
+
+    def to_seconds(self) -> list:
+        return [(start / 1000, end / 1000) for start, end in self.ranges]
+
+    def __len__(self):
+        return len(self.ranges)
+
+    def __iter__(self):
+        return iter(self.ranges)
+
+    def __eq__(self, other):
+        return isinstance(other, EDL) and self.ranges == other.ranges
+
+    def __repr__(self):
+        return f"EDL({self.ranges!r})"
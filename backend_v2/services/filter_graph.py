@@ -0,0 +1,98 @@
+# services/filter_graph.py
+import logging
+import os
+import subprocess
+import tempfile
+
+VIDEO_ENCODER = ["-c:v", "libx264", "-preset", "veryfast", "-crf", "20", "-pix_fmt", "yuv420p"]
+AUDIO_ENCODER = ["-c:a", "aac", "-b:a", "192k"]
+# concat needs every audio branch in one format; cloned voices come back as mono mp3
+AUDIO_FORMAT = "aresample=48000,aformat=sample_fmts=fltp:channel_layouts=stereo"
+
+
+class FilterGraphError(Exception):
+    pass
+
+
+def merge_adjacent(segments: list) -> list:
+    """Joins touching segments that play the source's own audio, so they become one trim."""
+    merged = []
+    for start, end, audio_path, volume in segments:
+        if merged and audio_path is None and merged[-1][2] is None and merged[-1][1] == start:
+            merged[-1] = (merged[-1][0], end, None, merged[-1][3])
+        else:
+            merged.append((start, end, audio_path, volume))
+    return merged
+
+
+def build_filter_graph(segments: list):
+    """Compiles segments into one filter graph; returns (extra_inputs, filter_script).
+
+    A segment is (start_ms, end_ms, audio_path, volume), as for SegmentRenderer. The source is
+    input 0 and is decoded once: `split`/`asplit` feed one `trim`/`atrim` branch per segment,
+    so the segments must be in source order without overlaps. A segment with `audio_path` takes
+    its audio from that file instead, padded or cut to the segment's length.
+    """
+    previous_end = 0
+    for start, end, _, _ in segments:
+        if end <= start or start < previous_end:
+            raise FilterGraphError("Segments must be non-empty, in source order and non-overlapping")
+        previous_end = end
+
+    inputs = []
+    lines = []
+    own_audio = [i for i, segment in enumerate(segments) if segment[2] is None]
+    lines.append(f"[0:v]split={len(segments)}" + "".join(f"[sv{i}]" for i in range(len(segments))))
+    if own_audio:
+        lines.append(f"[0:a]asplit={len(own_audio)}" + "".join(f"[sa{i}]" for i in own_audio))
+
+    for i, (start_ms, end_ms, audio_path, volume) in enumerate(segments):
+        start, end, duration = start_ms / 1000, end_ms / 1000, (end_ms - start_ms) / 1000
+        lines.append(f"[sv{i}]trim=start={start:.3f}:end={end:.3f},setpts=PTS-STARTPTS[v{i}]")
+        if audio_path is None:
+            lines.append(f"[sa{i}]atrim=start={start:.3f}:end={end:.3f},asetpts=PTS-STARTPTS,{AUDIO_FORMAT}[a{i}]")
+        else:
+            # Each override is its own input; an input pad can only be consumed once
+            inputs.append(audio_path)
+            lines.append(
+                f"[{len(inputs)}:a]volume={volume},{AUDIO_FORMAT},apad,atrim=end={duration:.3f},asetpts=PTS-STARTPTS[a{i}]"
+            )
+
+    lines.append("".join(f"[v{i}][a{i}]" for i in range(len(segments))) + f"concat=n={len(segments)}:v=1:a=1[v][a]")
+    return inputs, ";\n".join(lines)
+
+
+class FilterGraphRenderer:
+    """Renders a timeline in a single ffmpeg run, leaving decode, filtering and encode to ffmpeg's threads."""
+
+    def render(self, source_path: str, segments: list, output_path: str, progress=None) -> str:
+        if not segments:
+            raise FilterGraphError("Nothing to render")
+        segments = merge_adjacent(segments)
+        inputs, script = build_filter_graph(segments)
+        total_s = sum(end - start for start, end, _, _ in segments) / 1000
+        logging.info(f"Filter graph render: {len(segments)} segments, {len(inputs)} audio overrides")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # Long timelines blow past the command-line length limit, so the graph goes in a file
+            script_path = os.path.join(tmpdir, "graph.txt")
+            with open(script_path, "w") as f:
+                f.write(script)
+            cmd = ["ffmpeg", "-y", "-v", "error", "-nostats", "-progress", "pipe:1", "-i", source_path]
+            for path in inputs:
+                cmd += ["-i", path]
+            cmd += ["-filter_complex_script", script_path, "-map", "[v]", "-map", "[a]"]
+            cmd += VIDEO_ENCODER + AUDIO_ENCODER + ["-movflags", "+faststart", output_path]
+
+            with tempfile.TemporaryFile(mode="w+") as stderr:
+                process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr, text=True)
+                for line in process.stdout:
+                    key, _, value = line.strip().partition("=")
+                    if progress and key == "out_time_us" and value.isdigit() and total_s:
+                        progress("encode", min(1.0, int(value) / 1e6 / total_s))
+                if process.wait() != 0:
+                    stderr.seek(0)
+                    raise FilterGraphError(f"Filter graph render failed: {stderr.read().strip()[-500:]}")
+        if progress:
+            progress("encode", 1.0)
+        return output_path
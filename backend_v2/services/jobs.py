@@ -0,0 +1,113 @@
+# services/jobs.py
+import logging
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .metrics import metrics, breakdown_scope
+
+
+class Job:
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"
+        self.stage = None
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.timings = {}
+        # Seconds per instrumented stage, from the spans the job ran
+        self.breakdown = {}
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def update(self, stage: str = None, progress: float = None):
+        """Progress callback handed to the services: `progress` is the fraction done in [0, 1]."""
+        if stage is not None:
+            self.stage = stage
+        if progress is not None:
+            self.progress = max(self.progress, min(1.0, progress))
+
+    @property
+    def done(self) -> bool:
+        return self.status in {"succeeded", "failed"}
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "percent": round(self.progress * 100, 1),
+            "error": self.error,
+            "timings": self.timings,
+            "breakdown": {stage: round(seconds, 3) for stage, seconds in self.breakdown.items()},
+        }
+
+
+class JobManager:
+    """Runs long jobs on a worker pool so the event loop never blocks on ffmpeg, MoviePy or remote APIs."""
+
+    def __init__(self, max_workers: int = 2, max_jobs: int = 1000):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, fn, *args, pin=None, **kwargs) -> Job:
+        """Queues `fn(*args, job=job, **kwargs)`; its return value becomes the job result.
+
+        `pin` (a Workspace) is pinned from now until the job finishes, so a job still waiting for
+        a worker doesn't have its workspace collected from under it.
+        """
+        job = Job(kind)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._prune()
+        if pin is not None:
+            pin.pin()
+        try:
+            self.executor.submit(self._run, job, fn, args, kwargs, pin)
+        except BaseException:
+            if pin is not None:
+                pin.unpin()
+            raise
+        return job
+
+    def _run(self, job: Job, fn, args, kwargs, pin=None):
+        job.status = "running"
+        job.started_at = time.time()
+        metrics.observe("job_queue_seconds", job.started_at - job.created_at, kind=job.kind)
+        try:
+            with breakdown_scope(job.breakdown):
+                job.result = fn(*args, job=job, **kwargs)
+            job.progress = 1.0
+            job.status = "succeeded"
+        except Exception as e:
+            logging.error(f"Job {job.id} ({job.kind}) failed: {e}\n{traceback.format_exc()}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            if pin is not None:
+                pin.unpin()
+            job.finished_at = time.time()
+            metrics.observe("job_seconds", job.finished_at - job.started_at, kind=job.kind, status=job.status)
+
+    def _prune(self):
+        # Forget the oldest finished jobs once we hold too many
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> Job:
+        return self.jobs.get(job_id)
+
+    def queue_depth(self) -> int:
+        return sum(1 for job in list(self.jobs.values()) if job.status == "queued")
+
+    def running(self) -> int:
+        return sum(1 for job in list(self.jobs.values()) if job.status == "running")
@@ -0,0 +1,208 @@
+# services/metrics.py
+import contextvars
+import functools
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+NAMESPACE = "scriptcut"
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+HELP = {
+    "stage_seconds": "Time spent in each pipeline stage",
+    "stage_bytes_total": "Bytes read (in) and written or sent (out) by each pipeline stage",
+    "stage_errors_total": "Pipeline stages that raised",
+    "prediction_seconds": "Remote prediction time from the provider's metadata, split into queue and run",
+    "predictions_total": "Remote predictions by final status",
+    "transfer_retries_total": "Download attempts retried after a dropped connection or a retryable status",
+    "segments_total": "Timeline segments rendered, by whether they came from the segment cache",
+    "http_request_seconds": "HTTP request handling time",
+    "job_queue_seconds": "Time background jobs waited for a worker",
+    "job_seconds": "Time background jobs ran",
+    "jobs": "Background jobs by state",
+    "transcriptions_pending": "Transcription requests queued or running in the shared pool",
+    "cache_lookups_total": "Disk cache lookups by result",
+    "cache_evictions_total": "Disk cache evictions",
+    "cache_hit_ratio": "Disk cache hits over lookups since start",
+}
+
+# Per-request (or per-job) stage breakdown the spans add to; None outside of one
+_breakdown = contextvars.ContextVar("breakdown", default=None)
+_breakdown_lock = threading.Lock()
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class MetricsRegistry:
+    """Counters, histograms and callback gauges, rendered in the Prometheus text format."""
+
+    def __init__(self, namespace: str = NAMESPACE):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._types = {}
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._gauges = []
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        with self._lock:
+            self._types[name] = "counter"
+            self._counters[(name, _label_key(labels))] += value
+
+    def observe(self, name: str, value: float, **labels):
+        with self._lock:
+            self._types[name] = "histogram"
+            key = (name, _label_key(labels))
+            if key not in self._histograms:
+                self._histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+            histogram = self._histograms[key]
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def gauge(self, name: str, fn, kind: str = "gauge", **labels):
+        """Registers `fn()` to be read at every scrape; `kind` is "counter" for running totals kept elsewhere."""
+        with self._lock:
+            self._types[name] = kind
+            self._gauges.append((name, _label_key(labels), fn))
+
+    def register_cache(self, name: str, cache):
+        """Exposes a DiskCache's hit, miss and eviction counts under `cache=name`."""
+        self.gauge("cache_lookups_total", lambda: cache.hits, "counter", cache=name, result="hit")
+        self.gauge("cache_lookups_total", lambda: cache.misses, "counter", cache=name, result="miss")
+        self.gauge("cache_evictions_total", lambda: cache.evictions, "counter", cache=name)
+        self.gauge("cache_hit_ratio", lambda: cache.stats()["hit_rate"], cache=name)
+
+    def render(self) -> str:
+        samples = defaultdict(list)
+        with self._lock:
+            types = dict(self._types)
+            for (name, labels), value in self._counters.items():
+                samples[name].append(("", labels, value))
+            for (name, labels), (buckets, total, count) in self._histograms.items():
+                for bound, n in zip(BUCKETS, buckets):
+                    samples[name].append(("_bucket", labels + (("le", f"{bound:g}"),), n))
+                samples[name].append(("_bucket", labels + (("le", "+Inf"),), count))
+                samples[name].append(("_sum", labels, total))
+                samples[name].append(("_count", labels, count))
+            gauges = list(self._gauges)
+        # Callbacks run outside the lock; several registrations of one series add up
+        summed = defaultdict(float)
+        for name, labels, fn in gauges:
+            summed[(name, labels)] += fn()
+        for (name, labels), value in summed.items():
+            samples[name].append(("", labels, value))
+
+        lines = []
+        for name in sorted(samples):
+            full_name = f"{self.namespace}_{name}"
+            if name in HELP:
+                lines.append(f"# HELP {full_name} {HELP[name]}")
+            lines.append(f"# TYPE {full_name} {types[name]}")
+            for suffix, labels, value in samples[name]:
+                lines.append(f"{full_name}{suffix}{_format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+class Span:
+    __slots__ = ("stage", "bytes_in", "bytes_out")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+
+@contextmanager
+def span(stage: str):
+    """Times a pipeline stage; set `bytes_in`/`bytes_out` on the yielded span to count traffic.
+
+    The duration also goes into the breakdown of the request or job being served, if any.
+    """
+    current = Span(stage)
+    start = time.perf_counter()
+    try:
+        yield current
+    except Exception:
+        metrics.inc("stage_errors_total", stage=stage)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        metrics.observe("stage_seconds", duration, stage=stage)
+        if current.bytes_in:
+            metrics.inc("stage_bytes_total", current.bytes_in, stage=stage, direction="in")
+        if current.bytes_out:
+            metrics.inc("stage_bytes_total", current.bytes_out, stage=stage, direction="out")
+        breakdown = _breakdown.get()
+        if breakdown is not None:
+            with _breakdown_lock:
+                breakdown[stage] = breakdown.get(stage, 0.0) + duration
+
+
+def timed(stage: str):
+    """Decorator form of `span` for functions without byte counts."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def breakdown_scope(breakdown: dict):
+    """Collects the spans run in this context (and the task graphs it starts) into `breakdown`."""
+    token = _breakdown.set(breakdown)
+    try:
+        yield breakdown
+    finally:
+        _breakdown.reset(token)
+
+
+def server_timing(breakdown: dict, total_seconds: float = None) -> str:
+    """A Server-Timing header value: one `stage;dur=<ms>` entry per stage."""
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in breakdown.items()]
+    if total_seconds is not None:
+        entries.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def _parse_time(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def record_prediction(model: str, prediction):
+    """Splits a finished Replicate prediction into time queued and time running, from its timestamps."""
+    created = _parse_time(getattr(prediction, "created_at", None))
+    started = _parse_time(getattr(prediction, "started_at", None))
+    completed = _parse_time(getattr(prediction, "completed_at", None))
+    if created and started:
+        metrics.observe("prediction_seconds", max(0.0, (started - created).total_seconds()), model=model, phase="queue")
+    if started and completed:
+        metrics.observe("prediction_seconds", max(0.0, (completed - started).total_seconds()), model=model, phase="run")
+    metrics.inc("predictions_total", model=model, status=getattr(prediction, "status", "unknown"))
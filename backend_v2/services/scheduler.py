@@ -0,0 +1,109 @@
+# services/scheduler.py
+import contextvars
+import logging
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class TaskGraph:
+    """Runs a DAG of tasks on a thread pool, starting each task as soon as its dependencies finish.
+
+    Every task belongs to a stage (e.g. "clone", "lip_sync"); `limits` caps how many tasks
+    of a stage may be in flight at once. A task is called with its dependencies' results
+    as positional arguments, in the order the dependencies were given.
+    """
+
+    def __init__(self, max_workers: int = 8, limits: dict = None):
+        self.max_workers = max_workers
+        self.limits = limits or {}
+        self.tasks = {}
+        self.timings = {}
+
+    def add(self, name, fn, deps=(), stage: str = "default"):
+        if name in self.tasks:
+            raise ValueError(f"Duplicate task {name!r}")
+        self.tasks[name] = (fn, tuple(deps), stage)
+        return name
+
+    @staticmethod
+    def _timed(fn, args):
+        start = time.perf_counter()
+        result = fn(*args)
+        return result, start, time.perf_counter()
+
+    def run(self, on_task_done=None) -> dict:
+        """Runs every task and returns their results by name.
+
+        `on_task_done(name, stage, done, total)` is called after each task, where `done` counts
+        finished tasks of that stage.
+        """
+        for name, (_, deps, _) in self.tasks.items():
+            missing = [d for d in deps if d not in self.tasks]
+            if missing:
+                raise ValueError(f"Task {name!r} depends on unknown tasks {missing!r}")
+
+        results = {}
+        pending = dict(self.tasks)
+        running = {}
+        in_flight = defaultdict(int)
+        finished = defaultdict(int)
+        stage_totals = defaultdict(int)
+        for _, _, stage in self.tasks.values():
+            stage_totals[stage] += 1
+        started_at = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name, (fn, deps, stage) in list(pending.items()):
+                    if in_flight[stage] >= self.limits.get(stage, self.max_workers):
+                        continue
+                    if all(d in results for d in deps):
+                        del pending[name]
+                        in_flight[stage] += 1
+                        # Tasks run in the caller's context, so their spans count towards its request or job
+                        context = contextvars.copy_context()
+                        future = pool.submit(context.run, self._timed, fn, [results[d] for d in deps])
+                        running[future] = name
+
+                if not running:
+                    raise ValueError(f"Tasks {list(pending)!r} have circular dependencies")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    stage = self.tasks[name][2]
+                    in_flight[stage] -= 1
+                    try:
+                        result, start, end = future.result()
+                    except Exception:
+                        for other in running:
+                            other.cancel()
+                        raise
+                    results[name] = result
+                    self.timings[name] = {
+                        "stage": stage,
+                        "start": start - started_at,
+                        "end": end - started_at,
+                        "duration": end - start,
+                    }
+                    finished[stage] += 1
+                    if on_task_done is not None:
+                        on_task_done(name, stage, finished[stage], stage_totals[stage])
+
+        logging.info(f"Task graph finished in {time.perf_counter() - started_at:.2f}s: {self.stage_timings()}")
+        return results
+
+    def stage_timings(self) -> dict:
+        """Per stage: task count, summed task time and wall-clock span."""
+        stages = {}
+        for timing in self.timings.values():
+            stage = stages.setdefault(timing["stage"], {"tasks": 0, "busy": 0.0, "start": timing["start"], "end": timing["end"]})
+            stage["tasks"] += 1
+            stage["busy"] += timing["duration"]
+            stage["start"] = min(stage["start"], timing["start"])
+            stage["end"] = max(stage["end"], timing["end"])
+        return {
+            name: {"tasks": s["tasks"], "busy": round(s["busy"], 3), "wall": round(s["end"] - s["start"], 3)}
+            for name, s in stages.items()
+        }
@@ -0,0 +1,132 @@
+# services/segment_render.py
+import logging
+import os
+import subprocess
+import tempfile
+from .cache import ArtifactCache, hash_file_cached, make_key
+from .edl import EDL
+from .metrics import metrics, span
+from .scheduler import TaskGraph
+
+# Every cached segment is encoded with exactly these settings, so any mix of old and new
+# segments concatenates with stream copy. Audio stays PCM inside the segments and is encoded
+# to AAC once for the whole timeline, which avoids priming gaps at every join.
+VIDEO_ENCODER = ["-c:v", "libx264", "-preset", "veryfast", "-crf", "20", "-pix_fmt", "yuv420p"]
+AUDIO_ENCODER = ["-c:a", "pcm_s16le", "-ar", "48000", "-ac", "2"]
+SEGMENT_SUFFIX = ".mkv"
+# Shorter leftovers at a range's edges are folded into the neighbouring segment
+MIN_SEGMENT_MS = 200
+
+
+class SegmentRenderError(Exception):
+    pass
+
+
+def split_on_grid(start_ms: int, end_ms: int, grid_ms: int) -> list:
+    """Cuts [start_ms, end_ms) at multiples of `grid_ms` of source time.
+
+    Unchanged stretches of the source then map to the same segments from one edit to the next,
+    so deleting a word only invalidates the grid cells around it.
+    """
+    cuts = [start_ms]
+    boundary = (start_ms // grid_ms + 1) * grid_ms
+    while boundary < end_ms:
+        cuts.append(boundary)
+        boundary += grid_ms
+    cuts.append(end_ms)
+    if len(cuts) > 2 and cuts[1] - cuts[0] < MIN_SEGMENT_MS:
+        del cuts[1]
+    if len(cuts) > 2 and cuts[-1] - cuts[-2] < MIN_SEGMENT_MS:
+        del cuts[-2]
+    return list(zip(cuts, cuts[1:]))
+
+
+class SegmentRenderer:
+    """Renders a timeline as independently cached segments joined with stream copy.
+
+    A segment is (start_ms, end_ms, audio_path, volume): a range of the source, optionally with its
+    audio replaced by `audio_path`. Its cache key covers the source hash, the in/out points, the
+    encoder settings and the override's hash, so a re-render only encodes segments it hasn't seen.
+    """
+
+    def __init__(self, cache: ArtifactCache = None, grid_ms: int = None, max_workers: int = None):
+        self.cache = cache or ArtifactCache(
+            os.getenv("SEGMENT_CACHE_DIR", "cache/segments"),
+            max_bytes=int(os.getenv("SEGMENT_CACHE_MAX_MB", "4096")) * 1024 * 1024
+        )
+        self.grid_ms = grid_ms or int(os.getenv("SEGMENT_GRID_MS", "10000"))
+        self.max_workers = max_workers or int(os.getenv("SEGMENT_ENCODE_WORKERS", "2"))
+
+    def plan(self, edl: EDL) -> list:
+        return [(start, end, None, 1.0) for range_start, range_end in edl for start, end in split_on_grid(range_start, range_end, self.grid_ms)]
+
+    def key(self, source_hash: str, segment: tuple) -> str:
+        start_ms, end_ms, audio_path, volume = segment
+        audio_hash = hash_file_cached(audio_path) if audio_path else None
+        return make_key("segment", source_hash, start_ms, end_ms, VIDEO_ENCODER, AUDIO_ENCODER, audio_hash, volume)
+
+    def _encode(self, source_path: str, segment: tuple, key: str) -> str:
+        start_ms, end_ms, audio_path, volume = segment
+        cmd = ["ffmpeg", "-y", "-v", "error", "-ss", f"{start_ms / 1000:.3f}", "-i", source_path]
+        if audio_path:
+            cmd += ["-i", audio_path]
+        cmd += ["-t", f"{(end_ms - start_ms) / 1000:.3f}", "-map", "0:v:0"]
+        if audio_path:
+            # Pad a short voice with silence; -t trims a long one, as set_audio would
+            cmd += ["-map", "1:a:0", "-af", f"volume={volume},apad"]
+        else:
+            cmd += ["-map", "0:a:0"]
+        cmd += VIDEO_ENCODER + AUDIO_ENCODER
+
+        def write(tmp_path):
+            with span("segment_encode") as current:
+                result = subprocess.run(cmd + ["-f", "matroska", tmp_path], capture_output=True, text=True)
+                if result.returncode != 0:
+                    raise SegmentRenderError(f"Encoding segment {start_ms}-{end_ms} ms failed: {result.stderr.strip()[-500:]}")
+                current.bytes_out = os.path.getsize(tmp_path)
+
+        return self.cache.store(key, SEGMENT_SUFFIX, write)
+
+    def render(self, source_path: str, segments: list, output_path: str, progress=None) -> str:
+        if not segments:
+            raise SegmentRenderError("Nothing to render")
+        source_hash = hash_file_cached(source_path)
+        keys = [self.key(source_hash, segment) for segment in segments]
+        paths = [self.cache.get(key, SEGMENT_SUFFIX) for key in keys]
+
+        graph = TaskGraph(max_workers=self.max_workers)
+        for i, (segment, key, path) in enumerate(zip(segments, keys, paths)):
+            # The same segment can appear twice in a timeline; encode it once
+            if path is None and ("encode", key) not in graph.tasks:
+                graph.add(("encode", key), lambda segment=segment, key=key: self._encode(source_path, segment, key), stage="encode")
+
+        logging.info(f"Segment render: {len(graph.tasks)} of {len(segments)} segments to encode")
+        metrics.inc("segments_total", len(segments) - len(graph.tasks), result="reused")
+        metrics.inc("segments_total", len(graph.tasks), result="encoded")
+
+        def task_done(name, stage, done, total):
+            if progress:
+                progress("encode", 0.9 * done / total)
+
+        if graph.tasks:
+            encoded = graph.run(on_task_done=task_done)
+            paths = [path or encoded[("encode", key)] for key, path in zip(keys, paths)]
+
+        if progress:
+            progress("concat", 0.9)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            list_path = os.path.join(tmpdir, "segments.txt")
+            with open(list_path, "w") as f:
+                for path in paths:
+                    f.write(f"file '{os.path.abspath(path)}'\n")
+            with span("segment_concat"):
+                result = subprocess.run([
+                    "ffmpeg", "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", list_path,
+                    "-map", "0:v", "-map", "0:a", "-c:v", "copy", "-c:a", "aac", "-b:a", "192k",
+                    "-movflags", "+faststart", output_path,
+                ], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise SegmentRenderError(f"Concatenating segments failed: {result.stderr.strip()[-500:]}")
+        if progress:
+            progress("concat", 1.0)
+        return output_path
@@ -0,0 +1,203 @@
+# services/smart_cut.py
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from bisect import bisect_left, bisect_right
+
+# Codecs we know how to re-encode with matching parameters, so that the
+# re-encoded boundary pieces can be concatenated with stream-copied ones.
+# HEVC isn't here: ffprobe doesn't report its reference structure, so x265's SPS can't be matched.
+ENCODERS = {
+    "h264": ("libx264", "h264_mp4toannexb"),
+}
+SUPPORTED_PIX_FMTS = {"yuv420p", "yuvj420p", "yuv422p", "yuv444p"}
+# ffprobe's profile names (lowercased, no spaces) to x264's. The MP4 keeps only the first piece's
+# avcC, so encoded pieces must match the source's profile, level and reference count; a source
+# outside this table can't be matched and is re-encoded in full instead.
+X264_PROFILES = {
+    "constrainedbaseline": "baseline", "baseline": "baseline", "main": "main", "high": "high",
+    "high10": "high10", "high4:2:2": "high422", "high4:4:4predictive": "high444",
+}
+
+# Boundary pieces shorter than this are not worth a separate encode.
+MIN_PIECE_SECONDS = 0.01
+
+
+class SmartCutUnavailable(Exception):
+    """Raised when the source can't be smart-cut and needs a full re-encode."""
+
+
+def _run(cmd):
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise SmartCutUnavailable(f"{cmd[0]} failed: {result.stderr[-500:]}")
+    return result.stdout
+
+
+def probe_streams(video_path: str) -> dict:
+    output = _run([
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'stream=index,codec_type,codec_name,profile,level,refs,pix_fmt,width,height,sample_rate,channels',
+        '-of', 'json', video_path
+    ])
+    streams = json.loads(output).get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    return {"video": video, "audio": audio}
+
+
+def probe_keyframes(video_path: str) -> list:
+    # Reading packet flags avoids decoding any frames.
+    output = _run([
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=p=0', video_path
+    ])
+    keyframes = []
+    for line in output.splitlines():
+        parts = line.strip().split(',')
+        if len(parts) < 2 or 'K' not in parts[1]:
+            continue
+        try:
+            keyframes.append(float(parts[0]))
+        except ValueError:
+            continue
+    return sorted(keyframes)
+
+
+def plan_pieces(ranges: list, keyframes: list) -> list:
+    """Split each kept range (sorted, non-overlapping) into ("encode" | "copy", start, end) pieces."""
+    pieces = []
+    for start, end in ranges:
+        first = bisect_left(keyframes, start)
+        last = bisect_right(keyframes, end) - 1
+        if first >= len(keyframes) or last < 0 or keyframes[first] >= keyframes[last]:
+            pieces.append(("encode", start, end))
+            continue
+        copy_start, copy_end = keyframes[first], keyframes[last]
+        if copy_start - start > MIN_PIECE_SECONDS:
+            pieces.append(("encode", start, copy_start))
+        pieces.append(("copy", copy_start, copy_end))
+        if end - copy_end > MIN_PIECE_SECONDS:
+            pieces.append(("encode", copy_end, end))
+    return pieces
+
+
+def _check_copyable(streams: dict):
+    video = streams["video"]
+    if video is None:
+        raise SmartCutUnavailable("no video stream")
+    if video.get("codec_name") not in ENCODERS:
+        raise SmartCutUnavailable(f"codec {video.get('codec_name')} can't be smart-cut")
+    if video.get("pix_fmt") not in SUPPORTED_PIX_FMTS:
+        raise SmartCutUnavailable(f"pixel format {video.get('pix_fmt')} not supported")
+
+
+def _encode_args(video: dict) -> list:
+    """Encoder arguments for boundary pieces whose SPS matches the source's."""
+    encoder = ENCODERS[video["codec_name"]][0]
+    profile = X264_PROFILES.get((video.get("profile") or "").lower().replace(" ", ""))
+    level, refs = video.get("level"), video.get("refs")
+    if profile is None:
+        raise SmartCutUnavailable(f"profile {video.get('profile')} can't be matched")
+    if not isinstance(level, int) or level <= 0 or not isinstance(refs, int) or refs <= 0:
+        raise SmartCutUnavailable(f"level {level} / refs {refs} unknown, can't be matched")
+    # ffprobe reports levels as 10x the level, which x264 accepts as is. x264 raises
+    # max_num_ref_frames to 4 for B-pyramids and to 2 for any B-frames, so those go when
+    # they'd push it past the source's
+    x264_params = f"ref={refs}:b-pyramid=none" + (":bframes=0" if refs < 2 else "")
+    return ['-c:v', encoder, '-pix_fmt', video["pix_fmt"], '-preset', 'veryfast', '-crf', '18',
+            '-profile:v', profile, '-level', str(level), '-x264-params', x264_params]
+
+
+def _piece_command(video_path: str, kind: str, start: float, end: float, streams: dict, encode_args: list,
+                   output_path: str) -> list:
+    # Video only: the audio is cut and encoded once for the whole EDL by _audio_command
+    bsf = ENCODERS[streams["video"]["codec_name"]][1]
+    cmd = [
+        'ffmpeg', '-v', 'error',
+        '-ss', f"{start:.6f}", '-i', video_path,
+        '-t', f"{end - start:.6f}",
+        '-map', '0:v:0', '-an',
+    ]
+    cmd += ['-c:v', 'copy'] if kind == "copy" else encode_args
+    cmd += ['-bsf:v', bsf]
+    cmd += ['-avoid_negative_ts', 'make_zero', '-f', 'mpegts', '-y', output_path]
+    return cmd
+
+
+def audio_spans(pieces: list) -> list:
+    """The pieces' time ranges with touching ones joined, so the audio matches the video exactly."""
+    spans = []
+    for _, start, end in pieces:
+        if spans and abs(spans[-1][1] - start) < 1e-6:
+            spans[-1] = (spans[-1][0], end)
+        else:
+            spans.append((start, end))
+    return spans
+
+
+def _audio_command(video_path: str, spans: list, audio: dict, script_path: str, output_path: str) -> list:
+    """One AAC track for all of `spans`: a single encoder, so no priming or padding at the joins."""
+    lines = [f"[0:a:0]asplit={len(spans)}" + "".join(f"[s{i}]" for i in range(len(spans)))]
+    for i, (start, end) in enumerate(spans):
+        lines.append(f"[s{i}]atrim=start={start:.6f}:end={end:.6f},asetpts=PTS-STARTPTS[a{i}]")
+    lines.append("".join(f"[a{i}]" for i in range(len(spans))) + f"concat=n={len(spans)}:v=0:a=1[a]")
+    # Long EDLs blow past the command-line length limit, so the graph goes in a file
+    with open(script_path, 'w') as f:
+        f.write(";\n".join(lines))
+    return [
+        'ffmpeg', '-v', 'error', '-i', video_path,
+        '-filter_complex_script', script_path, '-map', '[a]',
+        '-c:a', 'aac', '-ar', str(audio["sample_rate"]), '-ac', str(audio["channels"]),
+        '-y', output_path,
+    ]
+
+
+def smart_cut(video_path: str, ranges: list, output_path: str, progress=None) -> str:
+    """Render the sorted `ranges` (seconds) of `video_path`, re-encoding only partial GOPs at the cut points."""
+    streams = probe_streams(video_path)
+    _check_copyable(streams)
+    encode_args = _encode_args(streams["video"])
+    keyframes = probe_keyframes(video_path)
+    if not keyframes:
+        raise SmartCutUnavailable("no keyframes found")
+
+    pieces = plan_pieces(ranges, keyframes)
+    if not pieces:
+        raise SmartCutUnavailable("nothing to render")
+
+    copied = sum(end - start for kind, start, end in pieces if kind == "copy")
+    total = sum(end - start for _, start, end in pieces)
+    logging.info(f"Smart cut: {len(pieces)} pieces, {copied:.1f}s of {total:.1f}s stream-copied")
+
+    work_dir = tempfile.mkdtemp(prefix="smart_cut_")
+    try:
+        list_path = os.path.join(work_dir, "pieces.txt")
+        done = 0.0
+        with open(list_path, 'w') as f:
+            for i, (kind, start, end) in enumerate(pieces):
+                piece_path = os.path.join(work_dir, f"piece_{i:05d}.ts")
+                _run(_piece_command(video_path, kind, start, end, streams, encode_args, piece_path))
+                f.write(f"file '{piece_path}'\n")
+                if progress:
+                    done += end - start
+                    progress("smart_cut", done / total)
+
+        cmd = ['ffmpeg', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', list_path]
+        if streams["audio"] is not None:
+            audio_path = os.path.join(work_dir, "audio.m4a")
+            script_path = os.path.join(work_dir, "audio_graph.txt")
+            _run(_audio_command(video_path, audio_spans(pieces), streams["audio"], script_path, audio_path))
+            cmd += ['-i', audio_path, '-map', '0:v:0', '-map', '1:a:0']
+        cmd += ['-c', 'copy']
+        # moov atom up front so previews can start playing before the download finishes
+        _run(cmd + ['-movflags', '+faststart', '-y', output_path])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return output_path
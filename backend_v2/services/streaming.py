@@ -0,0 +1,104 @@
+# services/streaming.py
+import os
+from email.utils import formatdate
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+CHUNK_SIZE = 256 * 1024
+
+
+def file_etag(path: str) -> str:
+    st = os.stat(path)
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def iter_file(path: str, start: int, end: int, chunk_size: int = CHUNK_SIZE):
+    """Yields bytes [start, end] (inclusive) of `path`."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def parse_range(header: str, size: int):
+    """Parses a single "bytes=a-b" range; returns (start, end) inclusive, or None if unsatisfiable."""
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, _, last = spec.strip().partition('-')
+    try:
+        if first == '':
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                return None
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match covers `etag`, compared weakly as RFC 9110 asks for GETs."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(',')]
+    return '*' in tags or etag.removeprefix("W/") in tags
+
+
+def cache_control(max_age: int) -> str:
+    # no-cache still lets the browser keep the file, but it revalidates (a cheap 304) before each use
+    return f"private, max-age={max_age}" if max_age > 0 else "private, no-cache"
+
+
+def range_file_response(request: Request, path: str, media_type: str = "video/mp4", filename: str = None,
+                        headers: dict = None, max_age: int = 3600) -> Response:
+    """Serves `path` with Range/206 support, an ETag and conditional GETs, so players can seek immediately.
+
+    Pass `max_age=0` for a URL whose file is rewritten in place, so browsers revalidate every time.
+    """
+    st = os.stat(path)
+    size = st.st_size
+    etag = file_etag(path)
+    base_headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Cache-Control": cache_control(max_age),
+    }
+    if filename:
+        base_headers["Content-Disposition"] = f'inline; filename="{filename}"'
+    base_headers.update(headers or {})
+
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=base_headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == etag):
+        byte_range = parse_range(range_header, size)
+        if byte_range is None:
+            return Response(status_code=416, headers={**base_headers, "Content-Range": f"bytes */{size}"})
+        start, end = byte_range
+        return StreamingResponse(
+            iter_file(path, start, end),
+            status_code=206,
+            media_type=media_type,
+            headers={**base_headers, "Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(end - start + 1)},
+        )
+
+    return StreamingResponse(
+        iter_file(path, 0, size - 1),
+        media_type=media_type,
+        headers={**base_headers, "Content-Length": str(size)},
+    )
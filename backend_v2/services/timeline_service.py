@@ -0,0 +1,237 @@
+# services/timeline_service.py
+import json
+import math
+import os
+import re
+import shutil
+import struct
+import subprocess
+import tempfile
+import numpy as np
+from .metrics import span
+from .pcm import open_pcm
+from .workspace import Workspace
+
+# Everything a timeline view needs, derived once at ingest; a new upload removes the directory
+TIMELINE_DIR = "timeline"
+WAVEFORM_NAME = "waveform.peaks"
+THUMBNAILS_INDEX_NAME = "thumbnails.json"
+
+# magic, version, level count, sample rate, total samples; then (samples_per_bucket, buckets) per level
+WAVEFORM_MAGIC = b"SCWF"
+WAVEFORM_VERSION = 1
+HEADER = struct.Struct("<4sHHIQ")
+LEVEL = struct.Struct("<IQ")
+
+
+class TimelineUnavailable(Exception):
+    """Raised when the upload hasn't been through ingest yet."""
+
+
+def compute_peaks(samples, levels: list, block_buckets: int = 256) -> list:
+    """Min/max int16 pairs per bucket for every bucket size in `levels`, in one pass over `samples`.
+
+    Blocks are a whole number of buckets at every level, so each level is reduced straight from
+    the same block and nothing but the peaks stays in memory.
+    """
+    block = math.lcm(*levels) * block_buckets
+    peaks = [[] for _ in levels]
+    for start in range(0, len(samples), block):
+        chunk = np.asarray(samples[start:start + block])
+        low, high = (chunk.min(axis=1), chunk.max(axis=1)) if chunk.ndim > 1 else (chunk, chunk)
+        for out, samples_per_bucket in zip(peaks, levels):
+            edges = np.arange(0, len(chunk), samples_per_bucket)
+            out.append(np.stack([np.minimum.reduceat(low, edges), np.maximum.reduceat(high, edges)], axis=1))
+    return [np.concatenate(out).astype("<i2") if out else np.zeros((0, 2), dtype="<i2") for out in peaks]
+
+
+def write_waveform(path: str, sample_rate: int, total_samples: int, levels: list, peaks: list):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(WAVEFORM_MAGIC, WAVEFORM_VERSION, len(levels), sample_rate, total_samples))
+        for samples_per_bucket, level in zip(levels, peaks):
+            f.write(LEVEL.pack(samples_per_bucket, len(level)))
+        for level in peaks:
+            f.write(level.tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_waveform(path: str) -> dict:
+    """Header of a peaks file, with each level's (buckets, 2) array memory-mapped."""
+    with open(path, "rb") as f:
+        magic, version, n_levels, sample_rate, total_samples = HEADER.unpack(f.read(HEADER.size))
+        if magic != WAVEFORM_MAGIC or version != WAVEFORM_VERSION:
+            raise ValueError(f"{path} is not a version {WAVEFORM_VERSION} peaks file")
+        entries = [LEVEL.unpack(f.read(LEVEL.size)) for _ in range(n_levels)]
+    offset = HEADER.size + LEVEL.size * n_levels
+    levels = []
+    for samples_per_bucket, buckets in entries:
+        data = (np.memmap(path, dtype="<i2", mode="r", offset=offset, shape=(buckets, 2))
+                if buckets else np.zeros((0, 2), dtype="<i2"))
+        levels.append({"samples_per_bucket": samples_per_bucket, "buckets": buckets, "peaks": data})
+        offset += buckets * 4
+    return {"sample_rate": sample_rate, "total_samples": total_samples, "levels": levels}
+
+
+class TimelineService:
+    """Waveform peaks and thumbnail sprite sheets for a timeline view, built once per upload."""
+
+    def __init__(self):
+        # Bucket sizes in samples, finest first; at 16 kHz these are 8 ms, 32 ms, 128 ms and 512 ms
+        self.levels = sorted(int(x) for x in os.getenv("WAVEFORM_LEVELS", "128,512,2048,8192").split(","))
+        self.thumbnail_interval = float(os.getenv("THUMBNAIL_INTERVAL_S", "2"))
+        self.thumbnail_width = int(os.getenv("THUMBNAIL_WIDTH", "160"))
+        self.thumbnail_height = int(os.getenv("THUMBNAIL_HEIGHT", "90"))
+        self.sprite_columns = 10
+        self.sprite_rows = 10
+
+    @staticmethod
+    def discard(workspace: Workspace):
+        shutil.rmtree(workspace.path(TIMELINE_DIR), ignore_errors=True)
+
+    def _dir(self, workspace: Workspace) -> str:
+        path = workspace.path(TIMELINE_DIR)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def build_waveform(self, workspace: Workspace, audio_path: str) -> str:
+        """Peaks at every level from the extracted PCM, which is memory-mapped, not decoded again."""
+        workspace.check_quota()
+        output_path = os.path.join(self._dir(workspace), WAVEFORM_NAME)
+        with span("waveform") as current:
+            samples, sample_rate = open_pcm(audio_path)
+            peaks = compute_peaks(samples, self.levels)
+            write_waveform(output_path, sample_rate, len(samples), self.levels, peaks)
+            current.bytes_in = os.path.getsize(audio_path)
+            current.bytes_out = os.path.getsize(output_path)
+        return output_path
+
+    def build_thumbnails(self, workspace: Workspace, video_path: str) -> dict:
+        """One thumbnail every `thumbnail_interval` seconds, tiled into JPEG sprite sheets.
+
+        Meant for the preview proxy, which is already small and quick to decode.
+        """
+        workspace.check_quota()
+        timeline_dir = self._dir(workspace)
+        width, height = self.thumbnail_width, self.thumbnail_height
+        per_sheet = self.sprite_columns * self.sprite_rows
+        video_filter = (
+            f"fps=1/{self.thumbnail_interval:g},"
+            f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,"
+            f"tile={self.sprite_columns}x{self.sprite_rows}"
+        )
+        with span("thumbnails") as current, tempfile.TemporaryDirectory(dir=timeline_dir) as tmpdir:
+            result = subprocess.run([
+                "ffmpeg", "-y", "-hide_banner", "-i", video_path,
+                "-vf", video_filter, "-an", "-q:v", "5",
+                os.path.join(tmpdir, "sheet_%03d.jpg"),
+            ], capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"Thumbnail sprite encode failed: {result.stderr.strip()[-500:]}")
+            match = re.search(r"Duration: (\d+):(\d+):(\d+\.\d+)", result.stderr)
+            duration = int(match.group(1)) * 3600 + int(match.group(2)) * 60 + float(match.group(3)) if match else 0.0
+
+            sheets = sorted(os.listdir(tmpdir))
+            for name in sheets:
+                os.replace(os.path.join(tmpdir, name), os.path.join(timeline_dir, name))
+            current.bytes_out = sum(os.path.getsize(os.path.join(timeline_dir, name)) for name in sheets)
+
+        count = min(len(sheets) * per_sheet, max(1, math.ceil(duration / self.thumbnail_interval)))
+        index = {
+            "interval": self.thumbnail_interval,
+            "width": width,
+            "height": height,
+            "columns": self.sprite_columns,
+            "rows": self.sprite_rows,
+            "count": count if sheets else 0,
+            "sheets": sheets,
+        }
+        index_path = os.path.join(timeline_dir, THUMBNAILS_INDEX_NAME)
+        with open(index_path + ".tmp", "w") as f:
+            json.dump(index, f)
+        os.replace(index_path + ".tmp", index_path)
+        return index
+
+    def waveform_path(self, workspace: Workspace) -> str:
+        path = os.path.join(workspace.path(TIMELINE_DIR), WAVEFORM_NAME)
+        if not os.path.exists(path):
+            raise TimelineUnavailable("Waveform not ready: upload a video first")
+        return path
+
+    def load_thumbnails(self, workspace: Workspace) -> dict:
+        try:
+            with open(os.path.join(workspace.path(TIMELINE_DIR), THUMBNAILS_INDEX_NAME)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise TimelineUnavailable("Thumbnails not ready: wait for the preview proxy")
+
+    def sheet_path(self, workspace: Workspace, sheet: str) -> str:
+        if sheet not in self.load_thumbnails(workspace)["sheets"]:
+            raise TimelineUnavailable(f"No sprite sheet {sheet}")
+        return os.path.join(workspace.path(TIMELINE_DIR), sheet)
+
+    def summary(self, workspace: Workspace) -> dict:
+        """What is ready, for a timeline to lay itself out before fetching any data."""
+        waveform = read_waveform(self.waveform_path(workspace))
+        try:
+            thumbnails = self.load_thumbnails(workspace)
+        except TimelineUnavailable:
+            thumbnails = None
+        return {
+            "duration": waveform["total_samples"] / waveform["sample_rate"],
+            "waveform": {
+                "sample_rate": waveform["sample_rate"],
+                "levels": [{"samples_per_bucket": l["samples_per_bucket"], "buckets": l["buckets"]}
+                           for l in waveform["levels"]],
+            },
+            "thumbnails": thumbnails,
+        }
+
+    def waveform_window(self, workspace: Workspace, start: float = 0.0, end: float = None, buckets: int = None):
+        """Peaks covering [start, end] seconds at the coarsest level that still has `buckets` in the window.
+
+        Without `buckets` the finest level is used. Returns (metadata, little-endian int16 min/max pairs).
+        """
+        waveform = read_waveform(self.waveform_path(workspace))
+        sample_rate = waveform["sample_rate"]
+        duration = waveform["total_samples"] / sample_rate
+        start = min(max(0.0, start), duration)
+        end = duration if end is None else min(max(start, end), duration)
+
+        levels = waveform["levels"]
+        level = levels[0]
+        if buckets:
+            window_samples = (end - start) * sample_rate
+            for candidate in levels:
+                if window_samples / candidate["samples_per_bucket"] >= buckets:
+                    level = candidate
+        samples_per_bucket = level["samples_per_bucket"]
+        first = int(start * sample_rate // samples_per_bucket)
+        last = min(level["buckets"], math.ceil(end * sample_rate / samples_per_bucket))
+        data = np.asarray(level["peaks"][first:max(first, last)]).tobytes()
+        return {
+            "sample_rate": sample_rate,
+            "samples_per_bucket": samples_per_bucket,
+            "first_bucket": first,
+            "buckets": max(0, last - first),
+            "start": first * samples_per_bucket / sample_rate,
+        }, data
+
+    def thumbnails_window(self, workspace: Workspace, start: float = 0.0, end: float = None) -> list:
+        """The thumbnails in [start, end] seconds, each with its sheet and pixel offset in it."""
+        index = self.load_thumbnails(workspace)
+        interval, columns = index["interval"], index["columns"]
+        per_sheet = columns * index["rows"]
+        first = max(0, int(start // interval))
+        last = index["count"] - 1 if end is None else min(index["count"] - 1, int(end // interval))
+        tiles = []
+        for i in range(first, last + 1):
+            position = i % per_sheet
+            tiles.append({
+                "time": i * interval,
+                "sheet": index["sheets"][i // per_sheet],
+                "x": (position % columns) * index["width"],
+                "y": (position // columns) * index["height"],
+            })
+        return tiles
@@ -0,0 +1,206 @@
+# services/transcript.py
+import numpy as np
+
+# "HH:MM:SS.mmm": character positions of the separators and of each digit group
+TIMESTAMP_WIDTH = 12
+_SEPARATORS = {2: ':', 5: ':', 8: '.'}
+_DIGITS = [0, 1, 3, 4, 6, 7, 9, 10, 11]
+_PLACE_MS = np.array([36000000, 3600000, 600000, 60000, 10000, 1000, 100, 10, 1], dtype=np.int64)
+PUNCTUATION = {',', '.', '!', '?'}
+
+
+def timestamp_to_ms(timestamp: str) -> int:
+    """Converts an "HH:MM:SS.mmm" timestamp to integer milliseconds."""
+    hours, minutes, seconds = timestamp.strip().split(':')
+    return (int(hours) * 3600 + int(minutes) * 60) * 1000 + round(float(seconds) * 1000)
+
+
+def ms_to_timestamp(ms: int) -> str:
+    seconds, milliseconds = divmod(int(ms), 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
+
+
+def parse_timestamps(values) -> np.ndarray:
+    """Vectorized timestamp_to_ms over many timestamps; returns int32 milliseconds.
+
+    Well-formed fixed-width timestamps are decoded straight from their code points; anything
+    else (single-digit hours, hand-edited values) goes through timestamp_to_ms.
+    """
+    values = list(values)
+    out = np.zeros(len(values), dtype=np.int32)
+    if not values:
+        return out
+    strings = np.array(values, dtype=str)
+    width = strings.dtype.itemsize // 4
+    if width != TIMESTAMP_WIDTH:
+        out[:] = [timestamp_to_ms(v) for v in values]
+        return out
+
+    codes = np.ascontiguousarray(strings).view(np.uint32).reshape(len(values), TIMESTAMP_WIDTH)
+    digits = codes[:, _DIGITS].astype(np.int64) - ord('0')
+    valid = ((digits >= 0) & (digits <= 9)).all(axis=1)
+    for position, separator in _SEPARATORS.items():
+        valid &= codes[:, position] == ord(separator)
+    out[valid] = digits[valid] @ _PLACE_MS
+    for i in np.flatnonzero(~valid):
+        out[i] = timestamp_to_ms(values[i])
+    return out
+
+
+def format_timestamps(ms) -> list:
+    """Vectorized ms_to_timestamp; returns a list of "HH:MM:SS.mmm" strings."""
+    ms = np.asarray(ms, dtype=np.int64)
+    if len(ms) == 0:
+        return []
+    if ms.min() < 0 or ms.max() >= 100 * 3600 * 1000:
+        return [ms_to_timestamp(v) for v in ms]
+    codes = np.empty((len(ms), TIMESTAMP_WIDTH), dtype=np.uint32)
+    for position, separator in _SEPARATORS.items():
+        codes[:, position] = ord(separator)
+    codes[:, _DIGITS] = (ms[:, None] // _PLACE_MS) % np.array([10, 10, 6, 10, 6, 10, 10, 10, 10]) + ord('0')
+    return codes.view(f'<U{TIMESTAMP_WIDTH}').ravel().tolist()
+
+
+def seconds_to_ms(seconds) -> np.ndarray:
+    """Float seconds to int ms, truncating after rounding to the microsecond like timedelta did."""
+    micros = np.round(np.asarray(seconds, dtype=np.float64) * 1e6).astype(np.int64)
+    return (micros // 1000).astype(np.int32)
+
+
+class Transcript:
+    """Word-level transcript stored as columns: int32 start/end milliseconds and one text buffer.
+
+    Word i's text is `buffer[offsets[i]:offsets[i + 1]]`, so the full text is a single slice of the
+    buffer. Slicing with a step-1 slice shares all three columns with the parent; the lists of
+    "HH:MM:SS.mmm" dicts used on the wire are produced and parsed in bulk.
+    """
+
+    __slots__ = ("start_ms", "end_ms", "buffer", "offsets")
+
+    def __init__(self, start_ms, end_ms, buffer: str = "", offsets=None):
+        self.start_ms = np.asarray(start_ms, dtype=np.int32)
+        self.end_ms = np.asarray(end_ms, dtype=np.int32)
+        self.buffer = buffer
+        self.offsets = np.zeros(1, dtype=np.int64) if offsets is None else np.asarray(offsets, dtype=np.int64)
+        if not len(self.start_ms) == len(self.end_ms) == len(self.offsets) - 1:
+            raise ValueError("start_ms, end_ms and offsets describe different numbers of words")
+
+    @classmethod
+    def from_texts(cls, start_ms, end_ms, texts: list) -> "Transcript":
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum([len(t) for t in texts], out=offsets[1:])
+        return cls(start_ms, end_ms, ''.join(texts), offsets)
+
+    @classmethod
+    def from_words(cls, words: list) -> "Transcript":
+        """From Whisper words ({word, start, end} in float seconds), spaced as display text."""
+        texts = [w['word'] if w['word'] in PUNCTUATION else f" {w['word']}" for w in words]
+        return cls.from_texts(
+            seconds_to_ms([w['start'] for w in words]),
+            seconds_to_ms([w['end'] for w in words]),
+            texts
+        )
+
+    @classmethod
+    def from_timestamps(cls, timestamps: list) -> "Transcript":
+        """From the wire format: a list of {"start", "end", "text"} with "HH:MM:SS.mmm" times."""
+        return cls.from_texts(
+            parse_timestamps(ts['start'] for ts in timestamps),
+            parse_timestamps(ts['end'] for ts in timestamps),
+            [ts['text'] for ts in timestamps]
+        )
+
+    def to_timestamps(self) -> list:
+        return [
+            {"start": start, "end": end, "text": text}
+            for start, end, text in zip(format_timestamps(self.start_ms), format_timestamps(self.end_ms), self.texts())
+        ]
+
+    def texts(self) -> list:
+        bounds = self.offsets.tolist()
+        return [self.buffer[a:b] for a, b in zip(bounds, bounds[1:])]
+
+    @property
+    def text(self) -> str:
+        return self.buffer[self.offsets[0]:self.offsets[-1]]
+
+    def word(self, i: int) -> str:
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]]
+
+    def index_at(self, t_ms: int) -> int:
+        """Index of the word spoken at `t_ms`, or -1 between words."""
+        i = int(np.searchsorted(self.start_ms, t_ms, side='right')) - 1
+        return i if i >= 0 and t_ms < self.end_ms[i] else -1
+
+    def indices_at(self, times_ms) -> np.ndarray:
+        """index_at for many times at once."""
+        times_ms = np.asarray(times_ms)
+        i = np.searchsorted(self.start_ms, times_ms, side='right') - 1
+        inside = (i >= 0) & (times_ms < self.end_ms[np.maximum(i, 0)])
+        return np.where(inside, i, -1)
+
+    def select(self, mask) -> "Transcript":
+        """Copy of the words where `mask` (boolean array or index array) selects them."""
+        indices = np.arange(len(self))[mask]
+        bounds = self.offsets.tolist()
+        return Transcript.from_texts(
+            self.start_ms[indices], self.end_ms[indices],
+            [self.buffer[bounds[i]:bounds[i + 1]] for i in indices.tolist()]
+        )
+
+    def remap_indices(self, edl):
+        """Which words survive rendering `edl`, and their new times: (indices, start_ms, end_ms).
+
+        A word survives if its midpoint is kept; its start and end are clamped to that range.
+        """
+        empty = np.zeros(0, dtype=np.int64)
+        if not len(self) or not len(edl):
+            return empty, empty.astype(np.int32), empty.astype(np.int32)
+        starts = np.array([s for s, _ in edl.ranges], dtype=np.int64)
+        ends = np.array([e for _, e in edl.ranges], dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(ends - starts)[:-1]))
+
+        start_ms = self.start_ms.astype(np.int64)
+        end_ms = self.end_ms.astype(np.int64)
+        mid = (start_ms + end_ms) // 2
+        i = np.searchsorted(starts, mid, side='right') - 1
+        keep = (i >= 0) & (mid < ends[np.maximum(i, 0)])
+        indices = np.flatnonzero(keep)
+        i = i[keep]
+        new_start = offsets[i] + np.maximum(start_ms[keep], starts[i]) - starts[i]
+        new_end = offsets[i] + np.minimum(end_ms[keep], ends[i]) - starts[i]
+        return indices, new_start.astype(np.int32), new_end.astype(np.int32)
+
+    def remap(self, edl) -> "Transcript":
+        """Maps word times onto the timeline rendered from `edl`."""
+        indices, start_ms, end_ms = self.remap_indices(edl)
+        kept = self.select(indices)
+        kept.start_ms, kept.end_ms = start_ms, end_ms
+        return kept
+
+    def columns(self) -> dict:
+        """Plain lists, e.g. for JSON."""
+        return {"start": self.start_ms.tolist(), "end": self.end_ms.tolist(), "text": self.texts()}
+
+    def __len__(self):
+        return len(self.start_ms)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step != 1:
+                return self.select(np.arange(start, stop, step))
+            stop = max(start, stop)
+            return Transcript(self.start_ms[start:stop], self.end_ms[start:stop], self.buffer, self.offsets[start:stop + 1])
+        i = item + len(self) if item < 0 else item
+        if not 0 <= i < len(self):
+            raise IndexError(item)
+        return {"start": ms_to_timestamp(self.start_ms[i]), "end": ms_to_timestamp(self.end_ms[i]), "text": self.word(i)}
+
+    def __iter__(self):
+        return iter(self.to_timestamps())
+
+    def __repr__(self):
+        return f"Transcript({len(self)} words)"
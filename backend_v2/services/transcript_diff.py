@@ -0,0 +1,238 @@
+# services/transcript_diff.py
+from collections import namedtuple
+from .transcript import Transcript, PUNCTUATION, ms_to_timestamp, timestamp_to_ms
+
+# Past this many inserted plus deleted words the middle of the diff is reported as one replace;
+# Myers costs O((n + m) * D) time and O(D^2) memory here, so this bounds a rewrite of everything.
+MAX_EDIT_DISTANCE = 2000
+# Shortest span a replaced line is synced onto; Whisper gives some words no duration at all
+MIN_SYNC_MS = 200
+
+# op is "keep", "delete", "replace" or "insert"; [old_start, old_end) indexes the old words,
+# [new_start, new_end) the new ones. start/end anchor the edit in the old transcript's time
+# ("HH:MM:SS.mmm"); an insert is anchored at a single point. text is the new words' text.
+Edit = namedtuple("Edit", "op old_start old_end new_start new_end start end text")
+
+
+def myers_opcodes(a: list, b: list, max_edit_distance: int = MAX_EDIT_DISTANCE) -> list:
+    """Minimal edit script turning `a` into `b`, as (op, i1, i2, j1, j2) runs.
+
+    Common prefixes and suffixes are matched first, so a local edit to a long transcript only
+    runs the O((n + m) * D) search over the changed middle.
+    """
+    n, m = len(a), len(b)
+    prefix = 0
+    while prefix < n and prefix < m and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < n - prefix and suffix < m - prefix and a[n - 1 - suffix] == b[m - 1 - suffix]:
+        suffix += 1
+
+    steps = [("keep", i, i) for i in range(prefix)]
+    middle = _myers_steps(a[prefix:n - suffix], b[prefix:m - suffix], max_edit_distance)
+    if middle is None:
+        steps += [("delete", i, None) for i in range(prefix, n - suffix)]
+        steps += [("insert", None, j) for j in range(prefix, m - suffix)]
+    else:
+        steps += [(op, None if i is None else i + prefix, None if j is None else j + prefix) for op, i, j in middle]
+    steps += [("keep", n - suffix + i, m - suffix + i) for i in range(suffix)]
+    return _group(steps)
+
+
+def _myers_steps(a: list, b: list, max_edit_distance: int):
+    """Per-element (op, i, j) steps of a shortest edit script, or None past `max_edit_distance`."""
+    n, m = len(a), len(b)
+    v = {1: 0}
+    trace = []
+    for d in range(min(n + m, max_edit_distance) + 1):
+        trace.append(dict(v))
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                x = v[k + 1]
+            else:
+                x = v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[k] = x
+            if x >= n and y >= m:
+                return _backtrack(trace, n, m)
+    return None
+
+
+def _backtrack(trace: list, n: int, m: int) -> list:
+    steps = []
+    x, y = n, m
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v[k - 1] < v[k + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = v[prev_k]
+        prev_y = prev_x - prev_k
+        while x > prev_x and y > prev_y:
+            x -= 1
+            y -= 1
+            steps.append(("keep", x, y))
+        if d > 0:
+            if x == prev_x:
+                steps.append(("insert", None, prev_y))
+            else:
+                steps.append(("delete", prev_x, None))
+        x, y = prev_x, prev_y
+    steps.reverse()
+    return steps
+
+
+def _group(steps: list) -> list:
+    """Collapses per-element steps into runs; adjacent deletes and inserts become a replace."""
+    opcodes = []
+    i = j = 0
+    pos = 0
+    while pos < len(steps):
+        if steps[pos][0] == "keep":
+            end = pos
+            while end < len(steps) and steps[end][0] == "keep":
+                end += 1
+            opcodes.append(("keep", i, i + end - pos, j, j + end - pos))
+        else:
+            end = pos
+            while end < len(steps) and steps[end][0] != "keep":
+                end += 1
+            deleted = sum(1 for op, _, _ in steps[pos:end] if op == "delete")
+            inserted = end - pos - deleted
+            op = "replace" if deleted and inserted else "delete" if deleted else "insert"
+            opcodes.append((op, i, i + deleted, j, j + inserted))
+        i, j = opcodes[-1][2], opcodes[-1][4]
+        pos = end
+    return opcodes
+
+
+def join_words(words: list) -> str:
+    return ''.join(w if w in PUNCTUATION else f" {w}" for w in words).strip()
+
+
+def script_words(texts: list) -> list:
+    """Splits free-form text (one string per line or word) into words."""
+    return [word for text in texts for word in text.split()]
+
+
+def parse_script(script: str) -> list:
+    """Parses "[start - end] :|: text" lines; lines without a timestamp count as plain text."""
+    parsed = []
+    for line in script.split('\n'):
+        if ':|:' not in line:
+            if line.strip():
+                parsed.append({'start': None, 'end': None, 'text': line})
+            continue
+        timestamp, text = line.split(':|:', 1)
+        start = timestamp.split('-')[0].replace('[', '').strip()
+        end = timestamp.split('-')[1].replace(']', '').strip()
+        parsed.append({'start': start, 'end': end, 'text': text})
+    return parsed
+
+
+def diff_transcript(old_timestamps: list, new_texts: list) -> list:
+    """Word-level diff of a timed transcript against edited text, as time-anchored Edits.
+
+    `old_timestamps` is the transcript the user saw ({"start", "end", "text"}); `new_texts` is what
+    they left in the editor, one string per line. Words are compared ignoring surrounding spaces.
+    """
+    old = Transcript.from_timestamps(old_timestamps)
+    old_words = [text.strip() for text in old.texts()]
+    new_words = script_words(new_texts)
+
+    edits = []
+    for op, i1, i2, j1, j2 in myers_opcodes(old_words, new_words):
+        if i2 > i1:
+            start, end = old.start_ms[i1], old.end_ms[i2 - 1]
+        else:
+            # An insert sits between the words around it
+            start = end = old.end_ms[i1 - 1] if i1 > 0 else (old.start_ms[0] if len(old) else 0)
+        edits.append(Edit(op, i1, i2, j1, j2, ms_to_timestamp(start), ms_to_timestamp(end), join_words(new_words[j1:j2])))
+    return edits
+
+
+def anchor_inserts(edits: list, old: Transcript, new_words: list) -> list:
+    """Folds each insert into a neighbouring word so the new speech has frames to be synced onto.
+
+    Grouping leaves every insert next to kept words: it becomes a replace of the kept word before
+    it (or after it, at the very start) by that word plus the inserted ones. Replaces that end up
+    adjacent are merged.
+    """
+    ops = [list(edit[:5]) for edit in edits]
+    anchored = []
+    for k, (op, i1, i2, j1, j2) in enumerate(ops):
+        if op != "insert":
+            anchored.append([op, i1, i2, j1, j2])
+        elif anchored:
+            previous = anchored[-1]
+            if previous[0] == "keep" and previous[2] - previous[1] > 1:
+                previous[2] -= 1
+                previous[4] -= 1
+                anchored.append(["replace", previous[2], previous[2] + 1, previous[4], j2])
+            else:
+                previous[0] = "replace"
+                previous[4] = j2
+        elif k + 1 < len(ops):
+            following = ops[k + 1]
+            anchored.append(["replace", following[1], following[1] + 1, j1, following[3] + 1])
+            following[1] += 1
+            following[3] += 1
+        # An insert into an empty transcript has nothing to be synced onto
+
+    merged = []
+    for op, i1, i2, j1, j2 in anchored:
+        if i1 == i2:
+            continue
+        if op == "replace" and merged and merged[-1][0] == "replace":
+            merged[-1][2], merged[-1][4] = i2, j2
+            continue
+        merged.append([op, i1, i2, j1, j2])
+    return [
+        Edit(op, i1, i2, j1, j2, ms_to_timestamp(old.start_ms[i1]), ms_to_timestamp(old.end_ms[i2 - 1]), join_words(new_words[j1:j2]))
+        for op, i1, i2, j1, j2 in merged
+    ]
+
+
+def anchored_diff(old_timestamps: list, new_texts: list) -> list:
+    """diff_transcript with inserts folded into neighbouring words, ready for voice cloning."""
+    old = Transcript.from_timestamps(old_timestamps)
+    return anchor_inserts(diff_transcript(old_timestamps, new_texts), old, script_words(new_texts))
+
+
+def sync_timestamps(edits: list) -> list:
+    """Timestamps for VideoService.modify_and_patch: kept runs as-is, replaced spans to be synced.
+
+    Deleted words are left out, so they are cut from the patched render.
+    """
+    timestamps = []
+    for k, edit in enumerate(edits):
+        if edit.op == "keep":
+            timestamps.append({'start': edit.start, 'end': edit.end, 'text': edit.text, 'sync': False})
+        elif edit.op == "replace":
+            before = timestamp_to_ms(edits[k - 1].end) if k > 0 else 0
+            after = timestamp_to_ms(edits[k + 1].start) if k + 1 < len(edits) else None
+            start, end = widen_span(timestamp_to_ms(edit.start), timestamp_to_ms(edit.end), before, after)
+            timestamps.append({'start': ms_to_timestamp(start), 'end': ms_to_timestamp(end), 'text': edit.text, 'sync': True})
+    return timestamps
+
+
+def widen_span(start: int, end: int, before: int, after: int = None, min_ms: int = MIN_SYNC_MS):
+    """Grows [start, end] ms towards `min_ms`, into the silence up to `after` and back to `before`.
+
+    A span with no room on either side still gets `min_ms`, overlapping the next line, since an
+    empty one would render nothing for the new words.
+    """
+    missing = min_ms - (end - start)
+    if missing <= 0:
+        return start, end
+    grow = missing if after is None else min(missing, max(0, after - end))
+    end += grow
+    start -= min(missing - grow, max(0, start - before))
+    if end <= start:
+        end = start + min_ms
+    return start, end
@@ -0,0 +1,199 @@
+# services/transcription_providers.py
+import contextvars
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .metrics import span
+from .registry import registry
+
+TEMPERATURE = 0
+PROMPT = "Umm, let me think like, uh, uh, hmm... Okay, here's what I, I'm, like, thinking."
+
+
+class TranscriptionProvider:
+    """Turns an audio file into words: a list of {"word", "start", "end"} dicts, times in seconds."""
+
+    name = "base"
+    # Whether audio goes over the network, so chunks are worth compressing first
+    remote = False
+
+    def transcribe(self, audio_path: str) -> list:
+        raise NotImplementedError
+
+    def cache_params(self) -> dict:
+        """Everything besides the audio that changes the result, for transcript cache keys."""
+        return {"provider": self.name}
+
+    def workers(self) -> int:
+        """How many transcriptions the provider can usefully run at once."""
+        return 1
+
+    def warm(self):
+        """Loads whatever the first request would otherwise wait for."""
+
+
+class OpenAIProvider(TranscriptionProvider):
+    name = "openai"
+    remote = True
+    model = "whisper-1"
+
+    def __init__(self, client=None):
+        self._client = client
+        self.max_workers = int(os.getenv("TRANSCRIPTION_MAX_WORKERS", "4"))
+
+    @property
+    def client(self):
+        # Built on the first request, not at startup
+        if self._client is None:
+            self._client = registry.get("openai")
+        return self._client
+
+    def transcribe(self, audio_path: str) -> list:
+        with span("transcribe_request") as current, open(audio_path, "rb") as audio:
+            current.bytes_out = os.path.getsize(audio_path)
+            response = self.client.audio.transcriptions.create(
+                model=self.model,
+                file=audio,
+                response_format="verbose_json",
+                temperature=TEMPERATURE,
+                timestamp_granularities=["word"],
+                prompt=PROMPT
+            )
+        return [{"word": w['word'], "start": w['start'], "end": w['end']} for w in response.words]
+
+    def cache_params(self) -> dict:
+        return {"model": self.model, "prompt": PROMPT, "temperature": TEMPERATURE}
+
+    def workers(self) -> int:
+        return self.max_workers
+
+
+class LocalWhisperProvider(TranscriptionProvider):
+    """Whisper on the CPU through faster-whisper (CTranslate2), int8 by default.
+
+    The model is loaded once, on first use or by `warm()`, and shared by every worker. CTranslate2
+    runs `num_workers` transcriptions in parallel, each on its own slice of the cores.
+    """
+
+    name = "local"
+
+    def __init__(self):
+        self.model_size = os.getenv("WHISPER_MODEL", "small")
+        self.compute_type = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+        cores = os.cpu_count() or 1
+        self.num_workers = int(os.getenv("WHISPER_WORKERS", str(max(1, cores // 4))))
+        self.cpu_threads = int(os.getenv("WHISPER_CPU_THREADS", str(max(1, cores // self.num_workers))))
+        # Speech-detected windows decoded together per transcription; 1 decodes them one by one
+        self.batch_size = int(os.getenv("WHISPER_BATCH_SIZE", "8"))
+        self._model = None
+        self._pipeline = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                try:
+                    from faster_whisper import BatchedInferencePipeline, WhisperModel
+                except ImportError as e:
+                    raise RuntimeError("TRANSCRIPTION_PROVIDER=local needs the faster-whisper package") from e
+                with span("transcribe_load"):
+                    logging.info(f"Loading Whisper {self.model_size} ({self.compute_type}, "
+                                 f"{self.num_workers} workers x {self.cpu_threads} threads)")
+                    self._model = WhisperModel(
+                        self.model_size,
+                        device="cpu",
+                        compute_type=self.compute_type,
+                        cpu_threads=self.cpu_threads,
+                        num_workers=self.num_workers,
+                    )
+                    if self.batch_size > 1:
+                        self._pipeline = BatchedInferencePipeline(model=self._model)
+        return self._model
+
+    def warm(self):
+        import numpy as np
+        model = self._load()
+        # One pass over a second of silence so the first real request doesn't pay for allocation
+        segments, _ = model.transcribe(np.zeros(16000, dtype=np.float32), language="en")
+        list(segments)
+
+    def transcribe(self, audio_path: str) -> list:
+        model = self._load()
+        options = dict(
+            language="en",
+            temperature=TEMPERATURE,
+            initial_prompt=PROMPT,
+            word_timestamps=True,
+        )
+        with span("transcribe_local"):
+            if self._pipeline is not None:
+                segments, _ = self._pipeline.transcribe(audio_path, batch_size=self.batch_size, **options)
+            else:
+                segments, _ = model.transcribe(audio_path, **options)
+            # Segments are decoded lazily as the generator is consumed
+            return [
+                {"word": w.word.strip(), "start": w.start, "end": w.end}
+                for segment in segments
+                for w in (segment.words or [])
+                if w.word.strip()
+            ]
+
+    def cache_params(self) -> dict:
+        return {"model": f"faster-whisper-{self.model_size}", "compute_type": self.compute_type,
+                "prompt": PROMPT, "temperature": TEMPERATURE}
+
+    def workers(self) -> int:
+        return self.num_workers
+
+
+PROVIDERS = {
+    OpenAIProvider.name: OpenAIProvider,
+    LocalWhisperProvider.name: LocalWhisperProvider,
+}
+
+
+def get_provider(name: str = None) -> TranscriptionProvider:
+    name = name or os.getenv("TRANSCRIPTION_PROVIDER", OpenAIProvider.name)
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown transcription provider {name!r}; expected one of {sorted(PROVIDERS)}")
+    return PROVIDERS[name]()
+
+
+class TranscriptionPool:
+    """Workers shared by every upload, so chunks from concurrent transcriptions queue for the same
+    provider slots instead of each upload starting its own.
+    """
+
+    def __init__(self, provider: TranscriptionProvider, workers: int = None):
+        self.provider = provider
+        self.workers = workers or provider.workers()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="transcribe")
+        self._lock = threading.Lock()
+        self.pending = 0
+
+    def _run(self, audio_path: str) -> list:
+        try:
+            return self.provider.transcribe(audio_path)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def submit(self, audio_path: str):
+        with self._lock:
+            self.pending += 1
+        # Spans inside the provider count towards the request or job that asked
+        return self._executor.submit(contextvars.copy_context().run, self._run, audio_path)
+
+    def transcribe(self, audio_path: str) -> list:
+        return self.submit(audio_path).result()
+
+    def warm(self):
+        """Loads the provider in the background; requests made meanwhile wait for it."""
+        self._executor.submit(self._warm)
+
+    def _warm(self):
+        try:
+            self.provider.warm()
+        except Exception as e:
+            logging.error(f"Transcription provider warm-up failed: {e}")
@@ -1,51 +1,138 @@
 # services/transcription_service.py
 from typing import List
 import os
-from openai import OpenAI
-from datetime import timedelta
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 import logging
+from .pcm import open_pcm, quietest_point
+from .cache import TranscriptCache
+from .metrics import span, timed
+from .transcript import Transcript
+from .transcription_providers import TranscriptionPool, get_provider
 
 logging.basicConfig(level=logging.INFO)
 
 
 class TranscriptionService:
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(self, provider=None):
+        # TRANSCRIPTION_PROVIDER picks the engine: "openai" (default) or "local"
+        self.provider = provider or get_provider()
+        self.pool = TranscriptionPool(self.provider)
+        # Audio longer than this is split at silences and transcribed chunk by chunk
+        self.chunk_seconds = float(os.getenv("TRANSCRIPTION_CHUNK_SECONDS", "600"))
+        # Chunks being encoded at once; the requests themselves queue for the shared pool
+        self.max_workers = int(os.getenv("TRANSCRIPTION_MAX_WORKERS", "4"))
+        # Each chunk is sent with this much extra audio on either side so boundary words aren't clipped
+        self.overlap_seconds = 1.0
+        # Split points are searched for in the last `split_search_seconds` before each chunk target
+        self.split_search_seconds = 30.0
+        self.cache = TranscriptCache(
+            os.getenv("TRANSCRIPT_CACHE_DIR", "cache/transcripts"),
+            max_bytes=int(os.getenv("TRANSCRIPT_CACHE_MAX_MB", "256")) * 1024 * 1024
+        )
 
-        
+    @timed("transcribe")
     def transcribe_audio(self, audio_file):
         try:
-            with open(audio_file, "rb") as audio:
-                response = self.client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio,
-                    response_format="verbose_json",
-                    temperature=0,
-                    timestamp_granularities=["word"],
-                    prompt="Umm, let me think like, uh, uh, hmm... Okay, here's what I, I'm, like, thinking."
-                )
-            return self.process_transcription(response)
+            key = self.cache.key(audio_file, chunk_seconds=self.chunk_seconds, **self.provider.cache_params())
+            cached = self.cache.get(key)
+            if cached is not None:
+                logging.info(f"Transcript cache hit ({self.cache.stats()})")
+                return cached
+
+            try:
+                samples, sample_rate = open_pcm(audio_file)
+            except ValueError:
+                samples, sample_rate = [], 1  # not PCM, send it as is
+            if len(samples) / sample_rate > self.chunk_seconds:
+                words = self.transcribe_long(audio_file, samples, sample_rate)
+            else:
+                words = self.request_words(audio_file)
+            transcript = self.process_words(words)
+            if transcript:
+                self.cache.put(key, transcript)
+            return transcript
         except Exception as e:
             logging.error(f"Error during transcription: {e}")
             return []
-            
 
-    def format_timestamp(self, seconds):
-        td = timedelta(seconds=seconds)
-        hours, remainder = divmod(td.seconds, 3600)
-        minutes, seconds = divmod(remainder, 60)
-        milliseconds = int(td.microseconds / 1000)
-        return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
+    def warm(self):
+        self.pool.warm()
+
+    def request_words(self, audio_file) -> list:
+        return self.pool.transcribe(audio_file)
+
+    def split_points(self, samples, sample_rate) -> list:
+        duration = len(samples) / sample_rate
+        points = [0.0]
+        while duration - points[-1] > self.chunk_seconds:
+            target = points[-1] + self.chunk_seconds
+            search_start = max(points[-1] + self.chunk_seconds / 2, target - self.split_search_seconds)
+            points.append(quietest_point(samples, sample_rate, search_start, target))
+        points.append(duration)
+        return points
+
+    def encode_chunk(self, audio_file, start: float, end: float, output_path: str) -> str:
+        if self.provider.remote:
+            # Opus at speech bitrates keeps a 10 minute chunk around 2 MB
+            codec = ['-c:a', 'libopus', '-b:a', '24k', '-ac', '1']
+        else:
+            # Local engines decode to 16 kHz mono anyway; skip the lossy round trip
+            codec = ['-c:a', 'pcm_s16le', '-ar', '16000', '-ac', '1']
+        with span("transcribe_encode"):
+            subprocess.run([
+                'ffmpeg', '-v', 'error',
+                '-ss', f"{start:.3f}", '-t', f"{end - start:.3f}",
+                '-i', audio_file,
+                *codec,
+                '-y', output_path
+            ], check=True)
+        return output_path
+
+    def transcribe_long(self, audio_file, samples, sample_rate) -> list:
+        points = self.split_points(samples, sample_rate)
+        duration = points[-1]
+        logging.info(f"Transcribing {duration:.0f}s of audio in {len(points) - 1} chunks")
 
+        work_dir = tempfile.mkdtemp(prefix="transcribe_")
+        extension = "ogg" if self.provider.remote else "wav"
+        try:
+            def transcribe_chunk(i):
+                owned_start, owned_end = points[i], points[i + 1]
+                chunk_start = max(0.0, owned_start - self.overlap_seconds)
+                chunk_end = min(duration, owned_end + self.overlap_seconds)
+                chunk_path = self.encode_chunk(audio_file, chunk_start, chunk_end, os.path.join(work_dir, f"chunk_{i:04d}.{extension}"))
+                words = self.request_words(chunk_path)
+                return owned_start, owned_end, chunk_start, words
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                chunks = list(pool.map(transcribe_chunk, range(len(points) - 1)))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        return self.merge_chunks(chunks)
+
+    @staticmethod
+    def merge_chunks(chunks) -> list:
+        """Shifts chunk-relative words onto the full timeline, keeping each word only in the chunk that owns it."""
+        merged = []
+        for owned_start, owned_end, offset, words in chunks:
+            for w in words:
+                start, end = w['start'] + offset, w['end'] + offset
+                if not owned_start <= (start + end) / 2 < owned_end:
+                    continue
+                previous = merged[-1] if merged else None
+                # The same word transcribed at the tail of one chunk and the head of the next
+                if previous and previous['word'] == w['word'] and start < previous['end']:
+                    continue
+                merged.append({"word": w['word'], "start": start, "end": end})
+        return merged
 
     def process_transcription(self, result):
-        timestamp_word_tuples = []
-        for word in result.words:
-            start_time = self.format_timestamp(word['start'])
-            end_time = self.format_timestamp(word['end'])
-            formatted_word = f" {word['word']}"  # Add a space before each word
-            if word['word'] in [',', '.', '!', '?']:  # Remove space before punctuation
-                formatted_word = word['word']
-            timestamp_word_tuples.append({"start": start_time, "end": end_time, "text": formatted_word})
-
-        return timestamp_word_tuples
+        return self.process_words(result.words)
+
+    def process_words(self, words):
+        # One bulk conversion for the whole transcript instead of formatting each word
+        return Transcript.from_words(words).to_timestamps()
@@ -0,0 +1,148 @@
+# services/upload_service.py
+import hashlib
+import json
+import os
+import threading
+import uuid
+from fastapi import UploadFile
+from .workspace import Workspace, QuotaExceeded
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+async def stream_to_file(file: UploadFile, path: str, chunk_size: int = CHUNK_SIZE, max_bytes: int = None):
+    """Writes an upload to `path` in fixed-size chunks, hashing as it goes. Returns (size, sha256)."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "wb") as buffer:
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if max_bytes is not None and size > max_bytes:
+                buffer.close()
+                os.remove(path)
+                raise QuotaExceeded("Upload exceeds the workspace quota")
+            digest.update(chunk)
+            buffer.write(chunk)
+    return size, digest.hexdigest()
+
+
+class UploadService:
+    """Resumable chunked uploads: init, append chunks at the current offset, then commit.
+
+    Partial uploads live in the workspace's `uploads/` directory and count against its quota.
+    """
+
+    def __init__(self):
+        # Running hashes for uploads that have been appended to in order since this process started
+        self._hashers = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _upload_dir(workspace: Workspace) -> str:
+        upload_dir = workspace.path("uploads")
+        os.makedirs(upload_dir, exist_ok=True)
+        return upload_dir
+
+    def _part_path(self, workspace: Workspace, upload_id: str) -> str:
+        return os.path.join(self._upload_dir(workspace), f"{os.path.basename(upload_id)}.part")
+
+    def _meta_path(self, workspace: Workspace, upload_id: str) -> str:
+        return os.path.join(self._upload_dir(workspace), f"{os.path.basename(upload_id)}.json")
+
+    def _upload_lock(self, upload_id: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def init(self, workspace: Workspace, size: int = None, sha256: str = None) -> dict:
+        if size is not None:
+            workspace.check_quota(size)
+        upload_id = uuid.uuid4().hex
+        with open(self._meta_path(workspace, upload_id), 'w') as f:
+            json.dump({"size": size, "sha256": sha256}, f)
+        open(self._part_path(workspace, upload_id), 'wb').close()
+        self._hashers[upload_id] = (hashlib.sha256(), 0)
+        return {"upload_id": upload_id, "offset": 0}
+
+    def meta(self, workspace: Workspace, upload_id: str) -> dict:
+        try:
+            with open(self._meta_path(workspace, upload_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError(f"Unknown upload {upload_id}")
+
+    def offset(self, workspace: Workspace, upload_id: str) -> int:
+        self.meta(workspace, upload_id)
+        return os.path.getsize(self._part_path(workspace, upload_id))
+
+    async def append(self, workspace: Workspace, upload_id: str, offset: int, chunks) -> int:
+        """Appends an async iterable of byte chunks at `offset`, which must equal the bytes received so far."""
+        meta = self.meta(workspace, upload_id)
+        part_path = self._part_path(workspace, upload_id)
+        remaining = workspace.remaining_bytes()
+        lock = self._upload_lock(upload_id)
+        if not lock.acquire(blocking=False):
+            raise UploadError("Another chunk for this upload is in progress")
+        try:
+            current = os.path.getsize(part_path)
+            if offset != current:
+                raise UploadError(f"Expected offset {current}, got {offset}")
+            hasher, hashed = self._hashers.get(upload_id, (None, 0))
+            if hashed != current:
+                hasher = None
+            with open(part_path, 'ab') as f:
+                try:
+                    async for chunk in chunks:
+                        # Both checks come before the write, so a rejected chunk leaves nothing behind
+                        if len(chunk) > remaining:
+                            raise QuotaExceeded("Upload exceeds the workspace quota")
+                        if meta["size"] is not None and current + len(chunk) > meta["size"]:
+                            raise UploadError("Upload is larger than declared")
+                        remaining -= len(chunk)
+                        f.write(chunk)
+                        current += len(chunk)
+                        if hasher is not None:
+                            hasher.update(chunk)
+                finally:
+                    f.flush()
+                    if hasher is not None:
+                        self._hashers[upload_id] = (hasher, current)
+                    else:
+                        self._hashers.pop(upload_id, None)
+            return current
+        finally:
+            lock.release()
+
+    def commit(self, workspace: Workspace, upload_id: str, dest_path: str) -> str:
+        """Verifies size and hash, moves the upload to `dest_path` and returns its sha256."""
+        meta = self.meta(workspace, upload_id)
+        part_path = self._part_path(workspace, upload_id)
+        size = os.path.getsize(part_path)
+        if meta["size"] is not None and size != meta["size"]:
+            raise UploadError(f"Upload incomplete: {size} of {meta['size']} bytes")
+
+        hasher, hashed = self._hashers.pop(upload_id, (None, 0))
+        if hasher is not None and hashed == size:
+            digest = hasher.hexdigest()
+        else:
+            # The process restarted mid-upload, so hash what is on disk
+            digest = hashlib.sha256()
+            with open(part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            digest = digest.hexdigest()
+        if meta["sha256"] and meta["sha256"] != digest:
+            raise UploadError("Checksum mismatch")
+
+        os.replace(part_path, dest_path)
+        os.remove(self._meta_path(workspace, upload_id))
+        with self._lock:
+            self._locks.pop(upload_id, None)
+        return digest
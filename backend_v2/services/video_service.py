@@ -1,31 +1,212 @@
 # services/video_service.py
 import os
+import json
+import logging
+import subprocess
 import tempfile
+from functools import partial
+from itertools import groupby
 from fastapi import UploadFile
-from moviepy.editor import VideoFileClip, concatenate_videoclips
-from .audio_service import AudioService
+from proglog import ProgressBarLogger
+from .audio_service import AudioService, CLONE_VOLUME
+from .smart_cut import smart_cut, SmartCutUnavailable
+from .edl import EDL
+from .filter_graph import FilterGraphRenderer, FilterGraphError
+from .metrics import span
+from .scheduler import TaskGraph
+from .segment_render import SegmentRenderer, SegmentRenderError
+from .timeline_service import TimelineService
+from .upload_service import stream_to_file
+from .workspace import Workspace
+
+# moov atom up front so previews can start playing before the download finishes
+FASTSTART = ["-movflags", "+faststart"]
+
+# Previews render against a small proxy whose short GOPs keep seeks and smart cuts cheap
+PROXY_HEIGHT = int(os.getenv("PROXY_HEIGHT", "480"))
+PROXY_GOP = int(os.getenv("PROXY_GOP", "12"))
+
+# Files derived from the upload; a new upload makes them all stale
+PROXY_NAME = "proxy.mp4"
+PREVIEW_NAME = "preview.mp4"
+EXPORT_NAME = "new_video.mp4"
+EDL_NAME = "edl.json"
+TRIMMED_TRANSCRIPT_NAME = "trimmed_transcript.json"
+
+
+class RenderProgressLogger(ProgressBarLogger):
+    """Forwards MoviePy's frame counter to a `progress(stage, fraction)` callback."""
+
+    def __init__(self, progress, stage: str = "encode"):
+        super().__init__()
+        self.progress = progress
+        self.stage = stage
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        if bar == 't' and attr == 'index':
+            total = self.bars[bar].get('total')
+            if total:
+                self.progress(self.stage, value / total)
+
+
+def scaled_progress(progress, low: float, high: float):
+    """Maps a stage's own [0, 1] progress onto [low, high] of the overall job."""
+    if progress is None:
+        return None
+    return lambda stage, fraction=None: progress(stage, None if fraction is None else low + (high - low) * fraction)
+
+
+def render_logger(progress):
+    return RenderProgressLogger(progress) if progress else 'bar'
+
 
 class VideoService:
-    def __init__(self):
-        self.data_dir = "data"
-        self.audio_service = AudioService()
-        os.makedirs(self.data_dir, exist_ok=True)
-
-    async def save_video(self, file: UploadFile) -> str:
-        video_path = os.path.join(self.data_dir, f"uploaded_video.mp4")
-        with open(video_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        return video_path
-
-    def extract_segments(self, video_path: str, timestamps: list) -> str:
-        output_path = os.path.join(self.data_dir, "new_video.mp4")
-        
-        with VideoFileClip(video_path) as video:
+    def __init__(self, render_mode: str = None, audio_service: AudioService = None):
+        # "smart" stream-copies whole GOPs, "reencode" encodes every frame through the segment cache,
+        # "ffmpeg" renders the whole timeline in one filter-graph run
+        self.render_mode = render_mode or os.getenv("RENDER_MODE", "smart")
+        # Kept words closer than this are rendered as one contiguous range
+        self.gap_tolerance_ms = int(os.getenv("EDL_GAP_TOLERANCE_MS", "50"))
+        self.max_clones_in_flight = int(os.getenv("CLONE_MAX_IN_FLIGHT", "4"))
+        # Shared with the app's own AudioService, so both use one artifact cache
+        self.audio_service = audio_service or AudioService()
+        self.segment_renderer = SegmentRenderer()
+        self.filter_graph_renderer = FilterGraphRenderer()
+
+    async def save_video(self, file: UploadFile, workspace: Workspace):
+        """Streams the upload into the workspace; returns (video_path, sha256)."""
+        video_path = workspace.path("uploaded_video.mp4")
+        self.discard_derived(workspace)
+        with span("save_upload") as current:
+            size, digest = await stream_to_file(file, video_path, max_bytes=workspace.remaining_bytes())
+            current.bytes_in = size
+        return video_path, digest
+
+    @staticmethod
+    def discard_derived(workspace: Workspace):
+        for name in (PROXY_NAME, PREVIEW_NAME, EXPORT_NAME, EDL_NAME, TRIMMED_TRANSCRIPT_NAME):
+            try:
+                os.remove(workspace.path(name))
+            except FileNotFoundError:
+                pass
+        TimelineService.discard(workspace)
+
+    def make_proxy(self, workspace: Workspace, video_path: str):
+        """Encodes a low-resolution, short-GOP copy of the upload for previews.
+
+        Returns the proxy path, or None if the upload was replaced while encoding.
+        """
+        workspace.check_quota()
+        source = os.stat(video_path)
+        fd, tmp_path = tempfile.mkstemp(suffix=".mp4", dir=workspace.root)
+        os.close(fd)
+        cmd = [
+            "ffmpeg", "-y", "-v", "error", "-i", video_path,
+            "-vf", f"scale=-2:'min({PROXY_HEIGHT},ih)'",
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "28", "-pix_fmt", "yuv420p",
+            "-g", str(PROXY_GOP), "-keyint_min", str(PROXY_GOP), "-sc_threshold", "0",
+            "-c:a", "aac", "-b:a", "96k",
+            *FASTSTART, tmp_path,
+        ]
+        with span("proxy") as current:
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                os.remove(tmp_path)
+                raise RuntimeError(f"Proxy encode failed: {result.stderr.strip()[-500:]}")
+            current.bytes_in = source.st_size
+            current.bytes_out = os.path.getsize(tmp_path)
+
+        current = os.stat(video_path)
+        if (current.st_size, current.st_mtime_ns) != (source.st_size, source.st_mtime_ns):
+            os.remove(tmp_path)
+            return None
+        proxy_path = workspace.path(PROXY_NAME)
+        os.replace(tmp_path, proxy_path)
+        return proxy_path
+
+    def build_edl(self, timestamps: list) -> EDL:
+        return EDL.from_timestamps(timestamps).coalesce(self.gap_tolerance_ms)
+
+    @staticmethod
+    def save_edl(workspace: Workspace, edl: EDL):
+        with open(workspace.path(EDL_NAME), "w") as f:
+            json.dump({"ranges": edl.ranges}, f)
+
+    @staticmethod
+    def load_edl(workspace: Workspace) -> EDL:
+        try:
+            with open(workspace.path(EDL_NAME)) as f:
+                return EDL(json.load(f)["ranges"])
+        except FileNotFoundError:
+            raise ValueError("Nothing to export: submit a trim first")
+
+    @staticmethod
+    def load_trimmed_transcript(workspace: Workspace) -> list:
+        with open(workspace.path(TRIMMED_TRANSCRIPT_NAME)) as f:
+            return json.load(f)
+
+    def preview(self, workspace: Workspace, video_path: str, timestamps: list, render_mode: str = None, progress=None) -> str:
+        """Renders the trim against the proxy (or the source while the proxy is still encoding).
+
+        The EDL is saved so `export` renders exactly the same cut at full resolution, along with
+        the kept words remapped onto the trimmed timeline, so the trim never needs transcribing.
+        """
+        edl = self.build_edl(timestamps)
+        self.save_edl(workspace, edl)
+        with open(workspace.path(TRIMMED_TRANSCRIPT_NAME), "w") as f:
+            json.dump(edl.remap_timestamps(timestamps), f)
+        # Any earlier full-resolution export is for a different cut now
+        try:
+            os.remove(workspace.path(EXPORT_NAME))
+        except FileNotFoundError:
+            pass
+
+        proxy_path = workspace.path(PROXY_NAME)
+        source = proxy_path if os.path.exists(proxy_path) else video_path
+        return self.render_edl(workspace, source, edl, PREVIEW_NAME, render_mode, progress)
+
+    def export(self, workspace: Workspace, video_path: str, render_mode: str = None, progress=None) -> str:
+        """Renders the last previewed EDL from the full-resolution upload."""
+        return self.render_edl(workspace, video_path, self.load_edl(workspace), EXPORT_NAME, render_mode, progress)
+
+    def extract_segments(self, workspace: Workspace, video_path: str, timestamps: list, render_mode: str = None, progress=None) -> str:
+        return self.render_edl(workspace, video_path, self.build_edl(timestamps), EXPORT_NAME, render_mode, progress)
+
+    def render_edl(self, workspace: Workspace, video_path: str, edl: EDL, output_name: str, render_mode: str = None, progress=None) -> str:
+        workspace.check_quota()
+        output_path = workspace.path(output_name)
+        with span("render") as current:
+            self._render_edl(video_path, edl, output_path, render_mode, progress)
+            current.bytes_out = os.path.getsize(output_path)
+        return output_path
+
+    def _render_edl(self, video_path: str, edl: EDL, output_path: str, render_mode: str = None, progress=None) -> str:
+        ranges = edl.to_seconds()
+
+        render_mode = render_mode or self.render_mode
+        if render_mode == "smart":
+            try:
+                with span("smart_cut"):
+                    return smart_cut(video_path, ranges, output_path, progress)
+            except SmartCutUnavailable as e:
+                logging.info(f"Smart cut unavailable, falling back to full re-encode: {e}")
+
+        if render_mode == "ffmpeg":
+            try:
+                with span("filter_graph"):
+                    return self.filter_graph_renderer.render(video_path, [(start, end, None, 1.0) for start, end in edl], output_path, progress)
+            except FilterGraphError as e:
+                logging.info(f"Filter graph render failed, falling back to segment render: {e}")
+
+        try:
+            return self.segment_renderer.render(video_path, self.segment_renderer.plan(edl), output_path, progress)
+        except SegmentRenderError as e:
+            logging.info(f"Segment render failed, falling back to MoviePy: {e}")
+
+        from moviepy.editor import VideoFileClip, concatenate_videoclips
+        with span("moviepy"), VideoFileClip(video_path) as video:
             segments = []
-            for ts in timestamps:
-                start = float(ts['start'].replace(":", "").replace(".", "")) / 1000
-                end = float(ts['end'].replace(":", "").replace(".", "")) / 1000
+            for start, end in ranges:
                 segment = video.subclip(start, end)
                 segments.append(segment)
             
@@ -34,37 +215,109 @@ class VideoService:
                 output_path,
                 codec="libx264",
                 audio_codec="aac",  # Use AAC for better compatibility
-                audio=True
+                audio=True,
+                ffmpeg_params=FASTSTART,
+                logger=render_logger(progress)
             )
             
         return output_path
 
-    def modify_and_patch(self, video_path: str, audio_path: str, timestamps: list, ref_text: str) -> str:
-        output_path = os.path.join(self.data_dir, "synced_video.mp4")
-        
-        with VideoFileClip(video_path) as video:
+    def modify_and_patch(self, workspace: Workspace, video_path: str, audio_path: str, timestamps: list, ref_text: str, timings: dict = None, progress=None) -> str:
+        workspace.check_quota()
+        output_path = workspace.path("synced_video.mp4")
+
+        # All clone predictions run concurrently; the render starts once the last one lands
+        graph = TaskGraph(limits={"clone": self.max_clones_in_flight, "render": 1})
+        clone_tasks = []
+        for i, ts in enumerate(timestamps):
+            if ts['sync']:
+                clone_tasks.append(graph.add(
+                    ("clone", i),
+                    partial(self.audio_service.get_cloned_voice_path, audio_path, ref_text, ts['text']),
+                    stage="clone"
+                ))
+
+        def render(*cloned_audios):
+            cloned = dict(zip((i for _, i in clone_tasks), cloned_audios))
+            render_progress = scaled_progress(progress, 0.5, 1.0)
+            segments = self._patched_segments(timestamps, cloned)
+            with span("render_patched") as current:
+                self._render_patched_segments(video_path, timestamps, cloned, segments, output_path, render_progress)
+                current.bytes_out = os.path.getsize(output_path)
+            return output_path
+
+        def task_done(name, stage, done, total):
+            if progress and stage == "clone":
+                progress("clone", 0.5 * done / total)
+
+        graph.add("render", render, deps=clone_tasks, stage="render")
+        graph.run(on_task_done=task_done)
+        if timings is not None:
+            timings.update(graph.stage_timings())
+        return output_path
+
+    def _render_patched_segments(self, video_path: str, timestamps: list, cloned: dict, segments: list, output_path: str, progress=None):
+        if self.render_mode == "ffmpeg":
+            try:
+                with span("filter_graph"):
+                    return self.filter_graph_renderer.render(video_path, segments, output_path, progress)
+            except FilterGraphError as e:
+                logging.info(f"Filter graph render failed, falling back to segment render: {e}")
+        try:
+            self.segment_renderer.render(video_path, segments, output_path, progress)
+        except SegmentRenderError as e:
+            logging.info(f"Segment render failed, falling back to MoviePy: {e}")
+            self._render_patched(video_path, timestamps, cloned, output_path, progress)
+
+    def _runs(self, timestamps: list):
+        """Yields (sync, [(index, ts), ...]) runs of consecutive lines."""
+        return groupby(enumerate(timestamps), key=lambda item: bool(item[1]['sync']))
+
+    def _patched_segments(self, timestamps: list, cloned: dict) -> list:
+        """Segments for the segment renderer: one per synced line, grid cells for the unchanged runs."""
+        segments = []
+        for sync, run in self._runs(timestamps):
+            run = list(run)
+            if sync:
+                for i, ts in run:
+                    # An empty line has no range, and nothing to render
+                    for start, end in EDL.from_timestamps([ts]).ranges:
+                        if cloned[i] is None:
+                            segments.append((start, end, None, 1.0))
+                        else:
+                            segments.append((start, end, cloned[i], CLONE_VOLUME))
+            else:
+                edl = EDL.from_timestamps([ts for _, ts in run]).coalesce(self.gap_tolerance_ms)
+                segments.extend(self.segment_renderer.plan(edl))
+        return segments
+
+    def _render_patched(self, video_path: str, timestamps: list, cloned: dict, output_path: str, progress=None):
+        # MoviePy is only the fallback renderer; importing it costs half a second of startup
+        from moviepy.editor import VideoFileClip, AudioFileClip, concatenate_videoclips
+        from moviepy.audio.fx.all import volumex
+        with span("moviepy"), VideoFileClip(video_path) as video:
             segments = []
-            for ts in timestamps:
-                start = float(ts['start'].replace(":", "").replace(".", "")) / 1000
-                end = float(ts['end'].replace(":", "").replace(".", "")) / 1000
-                
-                if ts['sync']:
-                    segment = video.subclip(start, end)
-                    cloned_audio = self.audio_service.get_cloned_voice(
-                        audio_path, ref_text, ts['text']
-                    )
-                    segment = segment.set_audio(cloned_audio)
+            # Unchanged runs collapse into a few contiguous ranges; each synced line keeps its own clip
+            for sync, run in self._runs(timestamps):
+                run = list(run)
+                if sync:
+                    for i, ts in run:
+                        for start, end in EDL.from_timestamps([ts]).to_seconds():
+                            segment = video.subclip(start, end)
+                            if cloned[i] is not None:
+                                segment = segment.set_audio(volumex(AudioFileClip(cloned[i]), CLONE_VOLUME))
+                            segments.append(segment)
                 else:
-                    segment = video.subclip(start, end)
-                segments.append(segment)
+                    edl = EDL.from_timestamps([ts for _, ts in run])
+                    for start, end in edl.coalesce(self.gap_tolerance_ms).to_seconds():
+                        segments.append(video.subclip(start, end))
             
             final_video = concatenate_videoclips(segments)
             final_video.write_videofile(
                 output_path,
                 codec="libx264",
                 audio_codec="aac",
-                audio=True
+                audio=True,
+                ffmpeg_params=FASTSTART,
+                logger=render_logger(progress)
             )
-            
-        return output_path
-
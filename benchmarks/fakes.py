@@ -0,0 +1,187 @@
+"""Local stand-ins for the OpenAI and Replicate clients, with configurable latency.
+
+They answer with well-formed results (word timestamps spread over the audio, a tone for a cloned
+voice, the face video with the new audio for lip sync) so the rest of the pipeline runs for real.
+"""
+import os
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from media import make_tone, media_duration, mux
+
+WORD_SECONDS = 0.3
+WORD_SPACING_SECONDS = 0.4
+
+
+class Counters:
+    """Thread-safe request counts and byte totals, per kind of request."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = defaultdict(int)
+
+    def add(self, name: str, amount: int = 1):
+        with self._lock:
+            self.values[name] += amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.values)
+
+    def reset(self):
+        with self._lock:
+            self.values.clear()
+
+
+class FakeTranscriptions:
+    def __init__(self, latency: float, seconds_per_audio_second: float, counters: Counters):
+        self.latency = latency
+        self.seconds_per_audio_second = seconds_per_audio_second
+        self.counters = counters
+
+    def create(self, model, file, **kwargs):
+        duration = media_duration(file.name)
+        self.counters.add("transcribe_requests")
+        self.counters.add("transcribe_upload_bytes", os.fstat(file.fileno()).st_size)
+        time.sleep(self.latency + duration * self.seconds_per_audio_second)
+        n = int(duration / WORD_SPACING_SECONDS)
+        words = [
+            {"word": f"word{i}", "start": i * WORD_SPACING_SECONDS, "end": i * WORD_SPACING_SECONDS + WORD_SECONDS}
+            for i in range(n)
+        ]
+        return SimpleNamespace(words=words)
+
+
+class FakeOpenAI:
+    def __init__(self, latency: float = 0.5, seconds_per_audio_second: float = 0.0, counters: Counters = None):
+        self.counters = counters or Counters()
+        self.audio = SimpleNamespace(transcriptions=FakeTranscriptions(latency, seconds_per_audio_second, self.counters))
+
+
+class FakePrediction:
+    def __init__(self, outputs: "FakeOutputs", kind: str, latency: float, make_output):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "starting"
+        self.output = None
+        # Like Replicate's: queued until it starts, which the fake does straight away
+        self.created_at = self.started_at = datetime.now(timezone.utc).isoformat()
+        self.completed_at = None
+        self._outputs = outputs
+        self._ready_at = time.monotonic() + latency
+        self._make_output = make_output
+
+    def reload(self):
+        if self.status == "succeeded":
+            return
+        if time.monotonic() < self._ready_at:
+            self.status = "processing"
+            return
+        self.output = self._outputs.register(self._make_output())
+        self.completed_at = datetime.now(timezone.utc).isoformat()
+        self.status = "succeeded"
+
+
+class FakeOutputs:
+    """Maps the fake output URLs predictions return to local files."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.files = {}
+
+    def register(self, path: str) -> str:
+        url = f"https://fake.replicate.delivery/{uuid.uuid4().hex}/{os.path.basename(path)}"
+        with self._lock:
+            self.files[url] = path
+        return url
+
+    def get(self, url: str) -> str:
+        with self._lock:
+            return self.files[url]
+
+
+class FakePredictions:
+    def __init__(self, replicate: "FakeReplicate"):
+        self.replicate = replicate
+
+    def create(self, version, input: dict):
+        return self.replicate.create(version, input)
+
+
+class FakeReplicate:
+    """Answers voice-clone predictions (`gen_text` inputs) and lip-sync ones (`face` inputs, which come
+    back with the new audio).
+    """
+
+    def __init__(self, media_dir: str, clone_latency: float = 2.0, lip_sync_latency: float = 4.0, counters: Counters = None):
+        self.media_dir = media_dir
+        self.clone_latency = clone_latency
+        self.lip_sync_latency = lip_sync_latency
+        self.counters = counters or Counters()
+        self.outputs = FakeOutputs()
+        self.predictions = FakePredictions(self)
+        os.makedirs(media_dir, exist_ok=True)
+
+    def create(self, version, input: dict):
+        for value in input.values():
+            if hasattr(value, "fileno"):
+                self.counters.add("replicate_upload_bytes", os.fstat(value.fileno()).st_size)
+        if "gen_text" in input:
+            self.counters.add("clone_requests")
+            # About as long as the words would take to say
+            seconds = max(0.5, WORD_SPACING_SECONDS * len(input["gen_text"].split()))
+            path = os.path.join(self.media_dir, f"clone_{seconds:.1f}.mp3")
+            return FakePrediction(self.outputs, "clone", self.clone_latency, lambda: make_tone(path, seconds))
+        if "face" in input:
+            self.counters.add("lip_sync_requests")
+            face_path, audio_path = input["face"].name, input["audio"].name
+            path = os.path.join(self.media_dir, f"lip_sync_{uuid.uuid4().hex}.mp4")
+            return FakePrediction(self.outputs, "lip_sync", self.lip_sync_latency, lambda: mux(face_path, audio_path, path))
+        raise ValueError(f"No fake for model {version}")
+
+
+class FakeResponse:
+    def __init__(self, path: str, offset: int = 0):
+        self.path = path
+        self.offset = offset
+        size = os.path.getsize(path)
+        self.status_code = 206 if offset else 200
+        self.headers = {
+            "content-type": "video/mp4" if path.endswith(".mp4") else "audio/mpeg",
+            "content-length": str(size - offset),
+        }
+        if offset:
+            self.headers["content-range"] = f"bytes {offset}-{size - 1}/{size}"
+
+    def iter_content(self, chunk_size: int = 1024 * 1024):
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    """Serves the fake output URLs in place of the downloader's HTTP session, Range requests included."""
+
+    def __init__(self, replicate: FakeReplicate):
+        self.replicate = replicate
+
+    def get(self, url, headers=None, **kwargs):
+        self.replicate.counters.add("download_requests")
+        match = re.match(r"bytes=(\d+)-", (headers or {}).get("Range", ""))
+        response = FakeResponse(self.replicate.outputs.get(url), int(match.group(1)) if match else 0)
+        self.replicate.counters.add("download_bytes", int(response.headers["content-length"]))
+        return response
@@ -0,0 +1,117 @@
+"""Times how long each app takes to import, i.e. how soon a worker or replica can start serving.
+
+    python benchmarks/import_time.py --repeat 5 --max-seconds 1 --output import_time.json
+
+Every sample is a fresh interpreter importing the app's main module from a scratch directory,
+with no API keys set, so clients built at import time fail loudly. Besides the wall time it
+lists the slowest top-level imports (from `python -X importtime`) and which of the heavy
+dependencies got loaded; those should only load on first use.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from run import ROOT, environment
+
+APPS = {
+    "backend_v2": os.path.join(ROOT, "backend_v2"),
+    "backend": os.path.join(ROOT, "backend"),
+}
+HEAVY = ("moviepy", "openai", "replicate", "requests", "faster_whisper", "cv2")
+SNIPPET = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def parse_importtime(stderr: str) -> list:
+    """(module, self_us, cumulative_us, depth) per line of `-X importtime` output."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return modules
+
+
+def sample(app_dir: str, scratch: str) -> dict:
+    env = {key: value for key, value in os.environ.items()
+           if key not in ("OPENAI_API_KEY", "REPLICATE_API_TOKEN")}
+    env["PYTHONPATH"] = app_dir
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", SNIPPET],
+                            cwd=scratch, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {app_dir} failed:\n{result.stderr[-2000:]}")
+    modules = parse_importtime(result.stderr)
+    return {
+        "seconds": float(result.stdout.strip().splitlines()[-1]),
+        "modules": modules,
+    }
+
+
+def measure(name: str, app_dir: str, repeat: int, top: int) -> dict:
+    seconds = []
+    modules = []
+    for _ in range(repeat):
+        scratch = tempfile.mkdtemp(prefix="import_time_")
+        try:
+            result = sample(app_dir, scratch)
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        seconds.append(result["seconds"])
+        modules = result["modules"]
+    # -X importtime lists a module's imports just before it, one level deeper
+    end = max(i for i, m in enumerate(modules) if m[0] == "main" and m[3] == 0)
+    start = end
+    while start > 0 and modules[start - 1][3] > 0:
+        start -= 1
+    app_imports = sorted((m for m in modules[start:end] if m[3] == 1), key=lambda m: -m[2])
+    loaded = {m[0].split(".")[0] for m in modules}
+    return {
+        "app": name,
+        "seconds": seconds,
+        "median_s": statistics.median(seconds),
+        "slowest_imports": [{"module": m[0], "cumulative_s": m[2] / 1e6} for m in app_imports[:top]],
+        "heavy_loaded": sorted(loaded & set(HEAVY)),
+    }
+
+
+def print_summary(results: list):
+    for result in results:
+        print(f"{result['app']}: {result['median_s']:.3f}s median over {len(result['seconds'])} runs")
+        for entry in result["slowest_imports"]:
+            print(f"    {entry['cumulative_s']:>7.3f}s  {entry['module']}")
+        print(f"    heavy dependencies loaded: {', '.join(result['heavy_loaded']) or 'none'}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--apps", default=",".join(APPS), help="which apps to import")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per app")
+    parser.add_argument("--top", type=int, default=8, help="slowest imports to list")
+    parser.add_argument("--max-seconds", type=float, default=None, help="exit non-zero if any median is slower")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+    args.apps = args.apps.split(",")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = [measure(name, APPS[name], args.repeat, args.top) for name in args.apps]
+    print_summary(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+        print(f"Results written to {os.path.abspath(args.output)}", file=sys.stderr)
+    if args.max_seconds is not None and any(r["median_s"] > args.max_seconds for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import os
+import re
+import subprocess
+import uuid
+import wave
+
+
+def _tmp_path(path: str) -> str:
+    # Several clones can ask for the same file at once; each writes its own and renames it in place
+    root, extension = os.path.splitext(path)
+    return f"{root}.{uuid.uuid4().hex}.tmp{extension}"
+
+
+def make_video(path: str, seconds: float, width: int = 640, height: int = 360, fps: int = 25, tone_hz: int = 220) -> str:
+    """Synthetic test video: lavfi testsrc picture and a sine tone, H.264/AAC like a phone upload.
+
+    A different `tone_hz` gives different bytes, so two benchmark points never share cache entries.
+    """
+    if os.path.exists(path):
+        return path
+    tmp_path = _tmp_path(path)
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc=size={width}x{height}:rate={fps}:duration={seconds}",
+        "-f", "lavfi", "-i", f"sine=frequency={tone_hz}:sample_rate=44100:duration={seconds}",
+        "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p", "-g", str(fps * 2),
+        "-c:a", "aac", "-b:a", "128k", "-shortest", tmp_path,
+    ], check=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def make_tone(path: str, seconds: float, tone_hz: int = 440) -> str:
+    """An mp3 tone standing in for a cloned voice."""
+    if os.path.exists(path):
+        return path
+    tmp_path = _tmp_path(path)
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"sine=frequency={tone_hz}:sample_rate=24000:duration={seconds:.2f}",
+        "-c:a", "libmp3lame", "-b:a", "64k", tmp_path,
+    ], check=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def mux(video_path: str, audio_path: str, path: str) -> str:
+    """`video_path`'s picture with `audio_path` as its sound, as a lip-sync model returns it."""
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error", "-i", video_path, "-i", audio_path,
+        "-map", "0:v", "-map", "1:a", "-c:v", "copy", "-c:a", "aac", "-shortest", path,
+    ], check=True)
+    return path
+
+
+def media_duration(path: str) -> float:
+    """Duration in seconds; WAV headers are read directly, anything else is asked of ffmpeg."""
+    try:
+        with wave.open(path, "rb") as f:
+            return f.getnframes() / f.getframerate()
+    except (wave.Error, EOFError):
+        pass
+    result = subprocess.run(["ffmpeg", "-i", path], capture_output=True, text=True)
+    match = re.search(r"Duration: (\d+):(\d+):(\d+\.\d+)", result.stderr)
+    if match is None:
+        raise ValueError(f"Can't read the duration of {path}")
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
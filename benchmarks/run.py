@@ -0,0 +1,349 @@
+"""Times the editing pipeline end to end on synthetic media with fake inference services.
+
+    python benchmarks/run.py --lengths 30,60,120 --edits 1,4,16 --output results.json
+    python benchmarks/run.py --output new.json --baseline results.json
+
+Every point is a cold run on freshly generated media: backend_v2's /upload-video/, /process-video/
+and /modify-video/, and backend's /upload_mp4/ and /process_script. The OpenAI and Replicate
+clients are replaced by the fakes in fakes.py, so the numbers cover our own work plus the
+configured latencies. Points are taken over video length (at --edits-at-length edits) and over
+number of edits (at --edit-length seconds); the JSON keeps every stage timing and both scaling
+curves, together with the commit it was measured on. Needs ffmpeg on the PATH.
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from fakes import Counters, FakeOpenAI, FakeReplicate, FakeSession
+from media import make_video
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+POLL_SECONDS = 0.01
+
+
+class StageRecorder:
+    """Wraps functions in place and adds up the time spent in each, per stage name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    def wrap(self, owner, name: str, stage: str):
+        original = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.seconds[stage] += time.perf_counter() - start
+                    self.calls[stage] += 1
+
+        setattr(owner, name, timed)
+
+    def take(self) -> dict:
+        """Stage timings since the last call; concurrent calls of one stage add up."""
+        with self._lock:
+            stages = {stage: {"seconds": round(s, 4), "calls": self.calls[stage]} for stage, s in self.seconds.items()}
+            self.seconds.clear()
+            self.calls.clear()
+        return stages
+
+
+def load_module(name: str, path: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def spread_edits(texts: list, n: int, tag: str) -> list:
+    """Replaces `n` words spread evenly through `texts`, never two side by side."""
+    texts = list(texts)
+    n = min(n, len(texts) // 2)
+    for k in range(n):
+        i = k * len(texts) // n + len(texts) // (2 * n)
+        texts[i] = f" {tag}{k}"
+    return texts
+
+
+class Bench:
+    def __init__(self, args, work_dir: str):
+        self.args = args
+        self.work_dir = work_dir
+        self.recorder = StageRecorder()
+        self.counters = Counters()
+
+        # Everything the services write (workspaces, caches) lands in the scratch directory
+        os.chdir(work_dir)
+        os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+        os.environ.setdefault("REPLICATE_API_TOKEN", "benchmark")
+        if args.render_mode:
+            os.environ["RENDER_MODE"] = args.render_mode
+        sys.path[:0] = [os.path.join(ROOT, "backend_v2"), os.path.join(ROOT, "backend")]
+
+        self.openai = FakeOpenAI(args.transcribe_latency, args.transcribe_rtf, self.counters)
+        self.replicate = FakeReplicate(os.path.join(work_dir, "fake_outputs"), args.clone_latency, args.lip_sync_latency, self.counters)
+        self.session = FakeSession(self.replicate)
+
+        from fastapi.testclient import TestClient
+        self.v2 = self.backend = None
+        if "backend_v2" in args.suites:
+            self.v2 = load_module("backend_v2_main", os.path.join(ROOT, "backend_v2", "main.py"))
+            self.v2_client = TestClient(self.v2.app)
+            self.patch_v2()
+        if "backend" in args.suites:
+            self.backend = load_module("backend_main", os.path.join(ROOT, "backend", "main.py"))
+            self.backend_client = TestClient(self.backend.app)
+            self.patch_backend()
+        logging.getLogger().setLevel(logging.WARNING)
+
+    def use_fakes(self, registry):
+        registry.set("openai", self.openai)
+        registry.set("replicate", self.replicate)
+        registry.set("http", self.session)
+
+    def patch_v2(self):
+        v2 = self.v2
+        self.use_fakes(sys.modules["services.registry"].registry)
+        self.recorder.wrap(v2.audio_service, "extract_audio", "extract_audio")
+        self.recorder.wrap(v2.transcription_service, "transcribe_audio", "transcribe")
+        self.recorder.wrap(v2.audio_service, "prepare_reference", "reference")
+        self.recorder.wrap(v2.video_service, "make_proxy", "proxy")
+        self.recorder.wrap(v2.video_service, "render_edl", "render")
+        self.recorder.wrap(v2.video_service.audio_service, "get_cloned_voice_path", "clone")
+        self.recorder.wrap(v2.video_service, "modify_and_patch", "modify_and_patch")
+
+    def patch_backend(self):
+        backend = self.backend
+        self.use_fakes(sys.modules["src.registry"].registry)
+        for name, stage in [("extract_audio", "extract_audio"), ("transcribe_audio", "transcribe"),
+                            ("build_reference", "reference"), ("extract_subclip", "extract"),
+                            ("get_cloned_voice", "clone"), ("lip_sync_clip", "lip_sync"),
+                            ("concat_all_vids", "concat")]:
+            self.recorder.wrap(backend, name, stage)
+
+    def measure(self, fn):
+        """Runs `fn`, returning (result, {"wall_s", "stages", "counters"})."""
+        self.recorder.take()
+        self.counters.reset()
+        start = time.perf_counter()
+        result = fn()
+        wall = time.perf_counter() - start
+        return result, {"wall_s": round(wall, 4), "stages": self.recorder.take(), "counters": self.counters.snapshot()}
+
+    def wait(self, job_id: str) -> dict:
+        while True:
+            job = self.v2_client.get(f"/jobs/{job_id}").json()
+            if job["status"] == "failed":
+                raise RuntimeError(f"Job {job_id} ({job['kind']}) failed: {job['error']}")
+            if job["status"] == "succeeded":
+                return job
+            time.sleep(POLL_SECONDS)
+
+    def run_v2(self, video_path: str, edits: int, tag: str) -> dict:
+        client = self.v2_client
+        endpoints = {}
+
+        def upload():
+            with open(video_path, "rb") as f:
+                response = client.post("/upload-video/", files={"file": ("upload.mp4", f, "video/mp4")}).json()
+            self.wait(response["job_id"])
+            upload_done = time.perf_counter()
+            self.wait(response["proxy_job_id"])
+            return response, upload_done
+
+        start = time.perf_counter()
+        (response, upload_done), endpoints["upload+proxy"] = self.measure(upload)
+        endpoints["upload+proxy"]["upload_wall_s"] = round(upload_done - start, 4)
+        headers = {"X-Workspace-Id": response["workspace_id"]}
+        transcript = client.get(f"/jobs/{response['job_id']}/result").json()["transcript"]
+
+        def process():
+            # Drop every tenth word, like trimming out stumbles
+            timestamps = [ts for i, ts in enumerate(transcript) if i % 10 != 9]
+            job = client.post("/process-video/", json={"timestamps": timestamps}, headers=headers).json()
+            self.wait(job["job_id"])
+            return client.get(f"/jobs/{job['job_id']}/transcript").json()["transcript"]
+
+        trimmed, endpoints["process"] = self.measure(process)
+
+        def modify():
+            texts = spread_edits([ts["text"] for ts in trimmed], edits, tag)
+            script = "\n".join(f"[{ts['start']} - {ts['end']}] :|: {text}" for ts, text in zip(trimmed, texts))
+            job = client.post("/modify-video/", json={"to_lip_sync_transcript": script}, headers=headers).json()
+            return self.wait(job["job_id"])["timings"]
+
+        job_timings, endpoints["modify"] = self.measure(modify)
+        endpoints["modify"]["job_timings"] = job_timings
+        client.delete(f"/workspaces/{response['workspace_id']}")
+        return endpoints
+
+    def run_backend(self, video_path: str, edits: int, tag: str) -> dict:
+        client = self.backend_client
+        endpoints = {}
+
+        def upload():
+            with open(video_path, "rb") as f:
+                return client.post("/upload_mp4/", files={"file": ("upload.mp4", f, "video/mp4")}).json()
+
+        response, endpoints["upload"] = self.measure(upload)
+        transcript = response["transcription"]
+
+        def process_script():
+            texts = spread_edits([ts["text"] for ts in transcript], edits, tag)
+            return client.post("/process_script", json={
+                "workspace_id": response["workspace_id"],
+                "original_script": transcript,
+                "new_script": [{"text": text} for text in texts],
+            }).json()
+
+        result, endpoints["process_script"] = self.measure(process_script)
+        endpoints["process_script"]["job_timings"] = result.get("timings")
+        self.backend.workspace_manager.delete(self.backend.workspace_manager.get(response["workspace_id"]))
+        return endpoints
+
+    def run_point(self, index: int, length: float, edits: int) -> dict:
+        width, height = self.args.resolution.split("x")
+        video_path = make_video(
+            os.path.join(self.work_dir, f"input_{index}.mp4"), length, int(width), int(height), self.args.fps,
+            tone_hz=220 + 10 * index
+        )
+        run = {"length_s": length, "edits": edits, "resolution": self.args.resolution, "endpoints": {}}
+        tag = f"edit{index}x"
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            if self.v2:
+                for name, metrics in self.run_v2(video_path, edits, tag).items():
+                    run["endpoints"][f"backend_v2.{name}"] = metrics
+            if self.backend:
+                for name, metrics in self.run_backend(video_path, edits, tag).items():
+                    run["endpoints"][f"backend.{name}"] = metrics
+        return run
+
+
+def scaling_curves(runs: list, edits_at_length: int, edit_length: float) -> dict:
+    curves = {"length_vs_seconds": defaultdict(list), "edits_vs_seconds": defaultdict(list)}
+    for run in runs:
+        for endpoint, metrics in run["endpoints"].items():
+            if run["edits"] == edits_at_length:
+                curves["length_vs_seconds"][endpoint].append([run["length_s"], metrics["wall_s"]])
+            if run["length_s"] == edit_length:
+                curves["edits_vs_seconds"][endpoint].append([run["edits"], metrics["wall_s"]])
+    return {name: {endpoint: sorted(points) for endpoint, points in curve.items()} for name, curve in curves.items()}
+
+
+def environment() -> dict:
+    def output(cmd):
+        try:
+            return subprocess.run(cmd, capture_output=True, text=True, cwd=ROOT).stdout.strip()
+        except OSError:
+            return None
+
+    return {
+        "commit": output(["git", "rev-parse", "HEAD"]),
+        "dirty": bool(output(["git", "status", "--porcelain", "--untracked-files=no"])),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "ffmpeg": (output(["ffmpeg", "-version"]) or "").split("\n")[0],
+    }
+
+
+def print_summary(runs: list, baseline: dict = None):
+    previous = {}
+    for run in (baseline or {}).get("runs", []):
+        for endpoint, metrics in run["endpoints"].items():
+            previous[(run["length_s"], run["edits"], endpoint)] = metrics["wall_s"]
+
+    print(f"{'length':>8} {'edits':>6}  {'endpoint':<30} {'seconds':>9}" + (f" {'baseline':>9} {'change':>8}" if baseline else ""))
+    for run in runs:
+        for endpoint, metrics in run["endpoints"].items():
+            line = f"{run['length_s']:>8g} {run['edits']:>6}  {endpoint:<30} {metrics['wall_s']:>9.2f}"
+            before = previous.get((run["length_s"], run["edits"], endpoint))
+            if before:
+                line += f" {before:>9.2f} {100 * (metrics['wall_s'] - before) / before:>+7.1f}%"
+            print(line)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--lengths", default="30,60,120", help="video lengths in seconds, comma-separated")
+    parser.add_argument("--edits", default="1,4,16", help="numbers of edited words, comma-separated")
+    parser.add_argument("--edits-at-length", type=int, default=4, help="edits made at every point of the length curve")
+    parser.add_argument("--edit-length", type=float, default=None, help="video length of the edits curve (default: shortest)")
+    parser.add_argument("--resolution", default="640x360")
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--suites", default="backend_v2,backend", help="which backends to run")
+    parser.add_argument("--render-mode", default=None, help="RENDER_MODE for backend_v2 (smart, reencode, ffmpeg)")
+    parser.add_argument("--transcribe-latency", type=float, default=0.5, help="seconds per transcription request")
+    parser.add_argument("--transcribe-rtf", type=float, default=0.01, help="extra transcription seconds per second of audio")
+    parser.add_argument("--clone-latency", type=float, default=2.0, help="seconds until a clone prediction succeeds")
+    parser.add_argument("--lip-sync-latency", type=float, default=4.0, help="seconds until a lip-sync prediction succeeds")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=None, help="earlier results to compare against")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = parser.parse_args(argv)
+    args.lengths = [float(x) for x in args.lengths.split(",")]
+    args.edits = [int(x) for x in args.edits.split(",")]
+    args.suites = args.suites.split(",")
+    if args.edit_length is None:
+        args.edit_length = min(args.lengths)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    output_path = os.path.abspath(args.output)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    points = [(length, args.edits_at_length) for length in args.lengths]
+    points += [(args.edit_length, edits) for edits in args.edits if (args.edit_length, edits) not in points]
+
+    cwd = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix="bench_")
+    try:
+        bench = Bench(args, work_dir)
+        runs = []
+        for index, (length, edits) in enumerate(points):
+            print(f"[{index + 1}/{len(points)}] {length:g}s video, {edits} edits", file=sys.stderr)
+            runs.append(bench.run_point(index, length, edits))
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            print(f"Scratch files kept in {work_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        "environment": environment(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "keep")},
+        "runs": runs,
+        "curves": scaling_curves(runs, args.edits_at_length, args.edit_length),
+    }
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print_summary(runs, baseline)
+    print(f"Results written to {output_path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()